@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Quiz, Question, GameSession, Player, PlayerAnswer
+from .models import Quiz, Question, GameSession, Player, PlayerAnswer, QuestionStats, QuizGenerationJob, GeneratedQuestionSet, BankQuestion, RecycledJoinCode
 
 
 @admin.register(Quiz)
@@ -37,4 +37,37 @@ class PlayerAdmin(admin.ModelAdmin):
 @admin.register(PlayerAnswer)
 class PlayerAnswerAdmin(admin.ModelAdmin):
     list_display = ['player', 'question', 'is_correct', 'time_taken', 'answered_at']
-    list_filter = ['is_correct', 'answered_at']
\ No newline at end of file
+    list_filter = ['is_correct', 'answered_at']
+
+
+@admin.register(QuestionStats)
+class QuestionStatsAdmin(admin.ModelAdmin):
+    list_display = ['session', 'question', 'responses', 'correct', 'mean_time_taken']
+
+
+@admin.register(QuizGenerationJob)
+class QuizGenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['quiz', 'status', 'questions_created', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+@admin.register(GeneratedQuestionSet)
+class GeneratedQuestionSetAdmin(admin.ModelAdmin):
+    list_display = ['topic', 'variant', 'created_at', 'expires_at']
+    search_fields = ['topic', 'key']
+    readonly_fields = ['created_at']
+
+
+@admin.register(BankQuestion)
+class BankQuestionAdmin(admin.ModelAdmin):
+    list_display = ['topic', 'difficulty', 'question_text', 'times_used', 'created_at']
+    list_filter = ['difficulty', 'created_at']
+    search_fields = ['topic', 'question_text']
+    exclude = ['signature']
+
+
+@admin.register(RecycledJoinCode)
+class RecycledJoinCodeAdmin(admin.ModelAdmin):
+    list_display = ['code', 'available_at']
+    search_fields = ['code']
@@ -1,18 +1,102 @@
 import requests
 import json
 import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from decouple import config
-from typing import List, Dict
+from django.conf import settings
+from typing import Dict, Iterator, List
+
+from .http_client import get_http_client
+from .metrics import record_ai_generation
+from .question_cache import get_question_cache, question_set_key
 
 logger = logging.getLogger(__name__)
 
 
+class AIServiceError(Exception):
+    """OpenRouter answered, but not with usable questions"""
+
+
+class QuestionStreamParser:
+    """
+    Pulls question objects out of a JSON array while its text is still
+    arriving: ``feed`` returns each top-level object as soon as its closing
+    brace has been seen. Anything before the opening ``[`` (such as a
+    markdown fence) is skipped.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._buffer = []
+
+    def feed(self, text: str) -> List[Dict]:
+        objects = []
+        for char in text:
+            if not self._started:
+                if char == '[':
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._depth >= 2:
+                self._buffer.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+                if self._depth == 2:
+                    self._buffer = [char]
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 1:
+                    try:
+                        objects.append(json.loads(''.join(self._buffer)))
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"Skipping malformed streamed question: {str(e)}")
+                    self._buffer = []
+                elif self._depth == 0:
+                    # End of the array; ignore whatever follows
+                    self._started = False
+                    self._depth = -1
+        return objects
+
+
 class QuizAIService:
     """Service for generating quiz questions using OpenRouter AI"""
 
+    # Part of the question cache key; bump whenever _create_prompt changes
+    PROMPT_VERSION = 1
+
+    # Larger quizzes are requested as concurrent chunks of at most this many questions
+    CHUNK_SIZE = 8
+
+    # One per chunk, so chunks of the same quiz ask about different things
+    TOPIC_ASPECTS = [
+        'history and origins',
+        'key people and figures',
+        'important facts and numbers',
+        'concepts and terminology',
+        'places and events',
+        'records and notable achievements',
+        'culture and influence',
+        'recent developments',
+    ]
+
     def __init__(self):
         self.api_key = config('OPENROUTER_API_KEY')
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.base_url = settings.OPENROUTER_API_URL
         # Updated to use the correct free model
         self.model = "deepseek/deepseek-chat-v3-0324:free"
 
@@ -23,7 +107,7 @@ class QuizAIService:
             logger.error("OpenRouter API key not found in environment variables")
 
     def generate_quiz_questions(self, topic: str, difficulty: str = 'medium',
-                                num_questions: int = 5) -> List[Dict]:
+                                num_questions: int = 5, variants: int = None) -> List[Dict]:
         """
         Generate quiz questions using AI
 
@@ -31,31 +115,245 @@ class QuizAIService:
             topic: The topic for the quiz
             difficulty: easy, medium, or hard
             num_questions: Number of questions to generate (default: 5)
+            variants: How many different cached sets to rotate through for
+                this request (default: settings.QUESTION_CACHE_VARIANTS)
 
         Returns:
             List of question dictionaries
         """
+        started = time.perf_counter()
+        try:
+            questions, outcome = self._generate_quiz_questions(topic, difficulty, num_questions, variants)
+        except AIServiceError:
+            record_ai_generation('failed', time.perf_counter() - started)
+            raise
+        record_ai_generation(outcome, time.perf_counter() - started)
+        return questions
+
+    def _generate_quiz_questions(self, topic: str, difficulty: str, num_questions: int, variants: int):
+        """
+        (questions, outcome): 'cached', 'ai' or 'fallback' to the sample
+        questions. Raises AIServiceError when the AI produced nothing and the
+        sample questions are too few for the request.
+        """
 
         logger.info(f"Generating {num_questions} {difficulty} questions about: {topic}")
 
+        # Serve repeated topics from the question cache
+        cache, cache_key, variants, cached = self._cached_questions(topic, difficulty, num_questions, variants)
+        if cached is not None:
+            return cached, 'cached'
+
         # Check if API key is available
         if not self.api_key:
             logger.error("No OpenRouter API key found, using fallback questions")
-            return self.generate_sample_questions(topic, difficulty)
+            return self._fallback_questions(topic, difficulty, num_questions), 'fallback'
+
+        try:
+            if num_questions > self.CHUNK_SIZE:
+                validated_questions = self._generate_in_chunks(topic, difficulty, num_questions)
+            else:
+                validated_questions = self._request_questions(topic, difficulty, num_questions)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API request failed: {str(e)}")
+            return self._fallback_questions(topic, difficulty, num_questions), 'fallback'
+        except Exception as e:
+            logger.error(f"Error generating questions: {str(e)}")
+            return self._fallback_questions(topic, difficulty, num_questions), 'fallback'
+
+        if len(validated_questions) == 0:
+            logger.warning("No valid questions generated by AI, using fallback")
+            return self._fallback_questions(topic, difficulty, num_questions), 'fallback'
+
+        # Only complete AI output is cached, never partial or fallback questions
+        if len(validated_questions) >= num_questions:
+            cache.put(cache_key, validated_questions, topic=topic, variants=variants)
+        return validated_questions, 'ai'
+
+    def iter_quiz_questions(self, topic: str, difficulty: str = 'medium',
+                            num_questions: int = 5, variants: int = None) -> Iterator[Dict]:
+        """
+        Like generate_quiz_questions, but yields each question as soon as it
+        is available. Quizzes that fit in one request are streamed: every
+        question is parsed and validated as it closes in the completion,
+        instead of after the whole completion has arrived.
+        """
+        if num_questions > self.CHUNK_SIZE or not self.api_key or not settings.AI_STREAM_COMPLETIONS:
+            yield from self.generate_quiz_questions(topic, difficulty, num_questions, variants)
+            return
+
+        logger.info(f"Streaming {num_questions} {difficulty} questions about: {topic}")
+        started = time.perf_counter()
+        cache, cache_key, variants, cached = self._cached_questions(topic, difficulty, num_questions, variants)
+        if cached is not None:
+            yield from cached
+            record_ai_generation('cached', time.perf_counter() - started)
+            return
+
+        generated = []
+        try:
+            for question in self._stream_questions(topic, difficulty, num_questions):
+                generated.append(question)
+                yield question
+                if len(generated) == num_questions:
+                    break
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API request failed after {len(generated)} streamed questions: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error streaming questions after {len(generated)}: {str(e)}")
+
+        if not generated:
+            logger.warning("No valid questions streamed by AI, using fallback")
+            try:
+                fallback = self._fallback_questions(topic, difficulty, num_questions)
+            except AIServiceError:
+                record_ai_generation('failed', time.perf_counter() - started)
+                raise
+            yield from fallback
+            record_ai_generation('fallback', time.perf_counter() - started)
+            return
+        if len(generated) >= num_questions:
+            cache.put(cache_key, generated, topic=topic, variants=variants)
+        record_ai_generation('ai', time.perf_counter() - started)
+
+    def _cached_questions(self, topic: str, difficulty: str, num_questions: int, variants: int = None):
+        """(cache, key, variants, cached questions or None) for a generation request"""
+        if variants is None:
+            variants = settings.QUESTION_CACHE_VARIANTS
+        cache = get_question_cache()
+        cache_key = question_set_key(topic, difficulty, num_questions, self.model, self.PROMPT_VERSION)
+        cached = cache.get(cache_key, variants=variants)
+        if cached is not None:
+            logger.info(f"Serving cached questions for: {topic}")
+        return cache, cache_key, variants, cached
+
+    def _generate_in_chunks(self, topic: str, difficulty: str, num_questions: int) -> List[Dict]:
+        """
+        Generate a large quiz as concurrent smaller requests, one per topic
+        aspect, merged in chunk order without duplicates. Failed chunks are
+        skipped, so the result may be short.
+        """
+        num_chunks = -(-num_questions // self.CHUNK_SIZE)
+        sizes = [num_questions // num_chunks + (idx < num_questions % num_chunks) for idx in range(num_chunks)]
+        logger.info(f"Splitting {num_questions} questions into {num_chunks} chunks of {sizes}")
+
+        def request_chunk(idx):
+            focus = self.TOPIC_ASPECTS[idx % len(self.TOPIC_ASPECTS)]
+            # Ask for one spare question per chunk to make up for duplicates
+            return self._request_questions(topic, difficulty, sizes[idx] + 1, focus=focus)
+
+        # Concurrency is bounded by the shared HTTP client, not this pool
+        with ThreadPoolExecutor(max_workers=num_chunks, thread_name_prefix='quiz-chunk') as executor:
+            futures = [executor.submit(request_chunk, idx) for idx in range(num_chunks)]
+
+        merged = []
+        seen = set()
+        for idx, future in enumerate(futures):
+            try:
+                chunk = future.result()
+            except Exception as e:
+                logger.error(f"Chunk {idx + 1}/{num_chunks} failed, keeping the others: {str(e)}")
+                continue
+            for question in chunk:
+                fingerprint = ' '.join(re.sub(r'\W+', ' ', question['question']).casefold().split())
+                if fingerprint not in seen:
+                    seen.add(fingerprint)
+                    merged.append(question)
+
+        logger.info(f"Merged {len(merged)} unique questions from {num_chunks} chunks")
+        return merged[:num_questions]
+
+    def _request_questions(self, topic: str, difficulty: str, num_questions: int,
+                           focus: str = None) -> List[Dict]:
+        """One OpenRouter completion, parsed and validated; raises on API errors"""
 
         # Construct the prompt
-        prompt = self._create_prompt(topic, difficulty, num_questions)
+        prompt = self._create_prompt(topic, difficulty, num_questions, focus)
         logger.info(f"Using AI model: {self.model}")
 
-        # Prepare the API request
-        headers = {
+        headers = self._headers()
+        data = self._payload(prompt, stream=False)
+
+        logger.info("Making API request to OpenRouter...")
+        # Make the API request (headers and bodies are never logged: they carry the API key)
+        logger.debug(f"Requesting {num_questions} questions about {topic!r} ({difficulty})")
+        # Pooled keep-alive session; retries 429/5xx/timeouts with backoff
+        response = get_http_client().post(self.base_url, headers=headers, json=data, timeout=30)
+
+        logger.info(f"OpenRouter API response status: {response.status_code}")
+
+        if response.status_code == 401:
+            raise AIServiceError("OpenRouter API: Unauthorized - check your API key")
+        elif response.status_code == 429:
+            raise AIServiceError("OpenRouter API: Rate limit exceeded after retries")
+        elif response.status_code != 200:
+            raise AIServiceError(f"OpenRouter API error: {response.status_code} - {response.text}")
+
+        logger.debug(f"OpenRouter response: {len(response.content)} bytes")
+        # Parse the response
+        result = response.json()
+        logger.info("Successfully received AI response")
+
+        if 'choices' not in result or not result['choices']:
+            raise AIServiceError("No choices in API response")
+
+        content = result['choices'][0]['message']['content']
+        logger.info(f"AI generated content length: {len(content)} characters")
+
+        # Extract JSON from the response
+        questions = self._parse_ai_response(content)
+        logger.info(f"Parsed {len(questions)} questions from AI response")
+
+        # Validate the questions
+        validated_questions = self._validate_questions(questions)
+        logger.info(f"Validated {len(validated_questions)} questions")
+        return validated_questions
+
+    def _stream_questions(self, topic: str, difficulty: str, num_questions: int) -> Iterator[Dict]:
+        """Yield validated questions from a streamed (SSE) completion as each one closes"""
+        prompt = self._create_prompt(topic, difficulty, num_questions)
+        logger.info(f"Streaming from AI model: {self.model}")
+
+        response = get_http_client().post(
+            self.base_url, headers=self._headers(), json=self._payload(prompt, stream=True),
+            timeout=30, stream=True
+        )
+        logger.info(f"OpenRouter API response status: {response.status_code}")
+
+        with response:
+            if response.status_code != 200:
+                raise AIServiceError(f"OpenRouter API error: {response.status_code} - {response.text}")
+
+            response.encoding = 'utf-8'
+            parser = QuestionStreamParser()
+            for line in response.iter_lines(decode_unicode=True):
+                # Blank lines separate events; ':' lines are keepalive comments
+                if not line.startswith('data:'):
+                    continue
+                payload = line[5:].strip()
+                if payload == '[DONE]':
+                    break
+
+                chunk = json.loads(payload)
+                if 'error' in chunk:
+                    raise AIServiceError(f"OpenRouter stream error: {chunk['error']}")
+                if not chunk.get('choices'):
+                    continue
+
+                content = chunk['choices'][0].get('delta', {}).get('content') or ''
+                for question in self._validate_questions(parser.feed(content)):
+                    yield question
+
+    def _headers(self) -> Dict:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
             "HTTP-Referer": "http://localhost:8000",  # Required for free tier
             "X-Title": "Quiz Platform"  # Optional, helps with tracking
         }
 
-        data = {
+    def _payload(self, prompt: str, stream: bool) -> Dict:
+        return {
             "model": self.model,
             "messages": [
                 {
@@ -69,64 +367,10 @@ class QuizAIService:
             ],
             "temperature": 0.7,
             "max_tokens": 2000,
-            "stream": False
+            "stream": stream
         }
 
-        try:
-            logger.info("Making API request to OpenRouter...")
-            # Make the API request
-            print(f"Headers: {headers}")
-            print(f"Payload: {json.dumps(data, indent=2)}")  
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=30)
-
-            logger.info(f"OpenRouter API response status: {response.status_code}")
-
-            if response.status_code == 401:
-                logger.error("OpenRouter API: Unauthorized - check your API key")
-                return self.generate_sample_questions(topic, difficulty)
-            elif response.status_code == 429:
-                logger.error("OpenRouter API: Rate limit exceeded")
-                return self.generate_sample_questions(topic, difficulty)
-            elif response.status_code != 200:
-                logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
-                return self.generate_sample_questions(topic, difficulty)
-
-            response.raise_for_status()
-
-            print(f"⬅️ Raw response: {response.text}")
-            # Parse the response
-            result = response.json()
-            logger.info("Successfully received AI response")
-
-            if 'choices' not in result or not result['choices']:
-                logger.error("No choices in API response")
-                return self.generate_sample_questions(topic, difficulty)
-
-            content = result['choices'][0]['message']['content']
-            logger.info(f"AI generated content length: {len(content)} characters")
-
-            # Extract JSON from the response
-            questions = self._parse_ai_response(content)
-            logger.info(f"Parsed {len(questions)} questions from AI response")
-
-            # Validate the questions
-            validated_questions = self._validate_questions(questions)
-            logger.info(f"Validated {len(validated_questions)} questions")
-
-            if len(validated_questions) == 0:
-                logger.warning("No valid questions generated by AI, using fallback")
-                return self.generate_sample_questions(topic, difficulty)
-
-            return validated_questions
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"API request failed: {str(e)}")
-            return self.generate_sample_questions(topic, difficulty)
-        except Exception as e:
-            logger.error(f"Error generating questions: {str(e)}")
-            return self.generate_sample_questions(topic, difficulty)
-
-    def _create_prompt(self, topic: str, difficulty: str, num_questions: int) -> str:
+    def _create_prompt(self, topic: str, difficulty: str, num_questions: int, focus: str = None) -> str:
         """Create the prompt for the AI"""
 
         difficulty_guidelines = {
@@ -135,10 +379,13 @@ class QuizAIService:
             'hard': 'Create difficult questions that require deep knowledge, critical thinking, or specialized understanding.'
         }
 
+        # Chunked requests each cover one aspect so their questions don't overlap
+        focus_line = f"FOCUS: Only ask about the {focus} of {topic}.\n" if focus else ''
+
         return f"""Create exactly {num_questions} multiple-choice trivia questions about "{topic}".
 
 DIFFICULTY: {difficulty} - {difficulty_guidelines.get(difficulty, '')}
-
+{focus_line}
 REQUIREMENTS:
 1. Each question must be factually accurate and well-researched
 2. Questions should be diverse and cover different aspects of {topic}
@@ -244,6 +491,15 @@ Generate {num_questions} questions about {topic} at {difficulty} difficulty leve
         logger.info(f"Validation complete: {len(validated)} out of {len(questions)} questions passed")
         return validated
 
+    def _fallback_questions(self, topic: str, difficulty: str, num_questions: int) -> List[Dict]:
+        """The sample questions standing in for failed AI generation; raises AIServiceError when too few"""
+        questions = self.generate_sample_questions(topic, difficulty)
+        if num_questions > len(questions):
+            raise AIServiceError(
+                f"AI generation failed and the {len(questions)} sample questions cannot stand in for {num_questions}"
+            )
+        return questions
+
     def generate_sample_questions(self, topic: str, difficulty: str = 'medium') -> List[Dict]:
         """Generate sample questions for testing or when AI fails"""
 
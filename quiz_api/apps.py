@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class QuizApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quiz_api'
+
+    def ready(self):
+        # Connects the per-request query counter to new database connections
+        from . import metrics  # noqa: F401
@@ -0,0 +1,375 @@
+import itertools
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .game_state import (
+    answered_player_ids, build_final_scores, build_game_state, load_game_state_delta, load_snapshot,
+    served_state_version, snapshot_from_session, snapshot_player
+)
+from .join_codes import get_join_code_resolver
+from .models import GameSession, Player, PlayerAnswer, Question, Quiz
+from .renderers import ORJSONRenderer
+from .serializers import PlayerSerializer, QuestionSerializer
+from .state_store import get_game_state_store
+
+User = get_user_model()
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+
+DEFAULT_SIZES = [10, 100, 1000]
+DEFAULT_REPEAT = 5
+QUESTIONS = 5
+
+# Slower than baseline by less than this is noise, whatever the percentage
+LATENCY_FLOOR_MS = 1.0
+
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+class Room:
+    """A seeded game: a host with ``size // 10`` quizzes, one of them live with ``size`` players"""
+
+    def __init__(self, size):
+        self.host = User.objects.create_user(username=f'benchmark-host-{size}', password='benchmark')
+        quizzes = [
+            Quiz.objects.create(host=self.host, title=f'Benchmark {idx}', topic='benchmark')
+            for idx in range(max(1, size // 10))
+        ]
+        self.quiz = quizzes[0]
+        Question.objects.bulk_create([
+            Question(
+                quiz=quiz,
+                question_text=f'Question {idx}?',
+                correct_answer='Right',
+                wrong_answers=['Wrong 1', 'Wrong 2', 'Wrong 3'],
+                order=idx
+            )
+            for quiz in quizzes for idx in range(QUESTIONS)
+        ])
+        self.questions = list(self.quiz.questions.order_by('order'))
+
+        now = timezone.now()
+        self.session = GameSession.objects.create(
+            quiz=self.quiz, status='active', started_at=now, question_started_at=now
+        )
+        # Half the room has answered the current question
+        Player.objects.bulk_create([
+            Player(session=self.session, nickname=f'player{idx}', score=100 if idx % 2 == 0 else 0,
+                   answers_correct=1 if idx % 2 == 0 else 0)
+            for idx in range(size)
+        ])
+        self.players = list(self.session.players.order_by('id'))
+        PlayerAnswer.objects.bulk_create([
+            PlayerAnswer(player=player, question=self.questions[0], selected_answer='Right',
+                         is_correct=True, time_taken=1.0)
+            for player in self.players[::2]
+        ])
+
+        self.host_client = APIClient()
+        self.host_client.force_authenticate(self.host)
+        self.client = APIClient()
+        # Later questions are still open for everyone
+        self._unanswered = itertools.product(self.questions[1:], self.players)
+        self._joins = itertools.count()
+
+    def invalidate(self):
+        get_game_state_store().invalidate(self.session.id)
+
+    def forget(self):
+        self.invalidate()
+        get_join_code_resolver().forget(self.quiz.join_code)
+
+    def restart(self):
+        GameSession.objects.filter(pk=self.session.pk).update(status='active', current_question_index=0)
+        self.invalidate()
+
+    # One request per endpoint, each a fresh one (new nickname, unanswered question ...)
+
+    def quiz_list(self):
+        return self.host_client.get('/api/quizzes/')
+
+    def game_state(self):
+        return self.client.get(f'/api/sessions/{self.session.id}/game_state/')
+
+    def leaderboard(self):
+        return self.client.get(f'/api/sessions/{self.session.id}/leaderboard/')
+
+    def join(self):
+        return self.client.post(
+            '/api/sessions/join/',
+            {'join_code': self.quiz.join_code, 'nickname': f'joiner{next(self._joins)}'},
+            format='json'
+        )
+
+    def submit_answer(self):
+        question, player = next(self._unanswered)
+        return self.client.post(
+            f'/api/players/{player.id}/submit_answer/',
+            {'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 1.0},
+            format='json'
+        )
+
+    def next_question(self):
+        return self.host_client.post(f'/api/sessions/{self.session.id}/next_question/')
+
+    def results(self):
+        return self.client.get(f'/api/players/{self.players[0].id}/results/')
+
+
+# (name, request, set up before each request). The *_cold variants rebuild
+# the session's hot snapshot from the database.
+ENDPOINTS = [
+    ('quiz_list', Room.quiz_list, None),
+    ('game_state', Room.game_state, None),
+    ('game_state_cold', Room.game_state, Room.invalidate),
+    ('leaderboard', Room.leaderboard, None),
+    ('leaderboard_cold', Room.leaderboard, Room.invalidate),
+    ('join', Room.join, None),
+    ('submit_answer', Room.submit_answer, None),
+    ('next_question', Room.next_question, Room.restart),
+    ('results', Room.results, None),
+]
+
+
+def measure(room, request, setup=None, repeat=DEFAULT_REPEAT):
+    """
+    {'queries', 'median_ms'} of a request, after one unmeasured warm-up.
+    Queries are those of the last run, without transaction control.
+    """
+    timings = []
+    for run in range(repeat + 1):
+        if setup is not None:
+            setup(room)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = request(room)
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f'{request.__name__} answered {response.status_code}: {response.content[:200]!r}')
+        if run:
+            timings.append(elapsed * 1000)
+    count = sum(1 for query in queries.captured_queries if not query['sql'].upper().startswith(TRANSACTION_CONTROL))
+    return {'queries': count, 'median_ms': round(statistics.median(timings), 3)}
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, endpoints=None):
+    """
+    {size: {endpoint: {'queries', 'median_ms'}}} for rooms of each size.
+    Everything a room writes is rolled back.
+    """
+    results = {}
+    # The test client's host, outside the test runner too
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for size in sizes:
+            results[str(size)] = _run_room(size, repeat, endpoints)
+    return results
+
+
+def _run_room(size, repeat, endpoints):
+    with transaction.atomic():
+        room = Room(size)
+        try:
+            return {
+                name: measure(room, request, setup, repeat)
+                for name, request, setup in ENDPOINTS
+                if endpoints is None or name in endpoints
+            }
+        finally:
+            room.forget()
+            transaction.set_rollback(True)
+
+
+def compare(results, baseline, query_tolerance=0, latency_tolerance=0.5):
+    """
+    Regressions of ``results`` against ``baseline``, as messages. A query
+    count may grow by ``query_tolerance`` and a median latency by the
+    ``latency_tolerance`` fraction (None skips latency). Sizes and endpoints
+    missing from the baseline are not compared.
+    """
+    regressions = []
+    for size, endpoints in results.items():
+        for name, measured in endpoints.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected is None:
+                continue
+            if measured['queries'] > expected['queries'] + query_tolerance:
+                regressions.append(
+                    f"{name} with {size} players: {measured['queries']} queries, baseline {expected['queries']}"
+                )
+            if latency_tolerance is None:
+                continue
+            limit = max(expected['median_ms'] * (1 + latency_tolerance), expected['median_ms'] + LATENCY_FLOOR_MS)
+            if measured['median_ms'] > limit:
+                regressions.append(
+                    f"{name} with {size} players: {measured['median_ms']:.1f} ms median, "
+                    f"baseline {expected['median_ms']:.1f} ms"
+                )
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def legacy_snapshot_from_session(session):
+    """``snapshot_from_session`` as it was: model instances through QuestionSerializer, for comparison"""
+    questions = QuestionSerializer(session.quiz.questions.all().order_by('order'), many=True).data
+    players = {player.id: snapshot_player(player) for player in session.players.all()}
+
+    current_question = None
+    if session.status == 'active' and session.current_question_index < len(questions):
+        current_question = questions[session.current_question_index]['id']
+
+    return {
+        'session_id': session.id,
+        'status': session.status,
+        'current_question_index': session.current_question_index,
+        'started_at': session.started_at.isoformat() if session.started_at else None,
+        'question_started_at': session.question_started_at.isoformat() if session.question_started_at else None,
+        'state_version': served_state_version(session.state_version, players.values()),
+        'session_version': session.state_version,
+        'quiz_title': session.quiz.title,
+        'questions': [dict(question) for question in questions],
+        'players': players,
+        'answered': answered_player_ids(current_question, list(players)),
+    }
+
+
+def legacy_final_scores(session):
+    return PlayerSerializer(session.ranked_players(), many=True).data
+
+
+def _cpu_ms(function, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        result = function()
+    return (time.process_time() - started) * 1000 / repeat, result
+
+
+def run_serialization_benchmarks(sizes=DEFAULT_SIZES, repeat=20):
+    """
+    CPU ms per call of the old and new way to build a session's snapshot
+    and final scores and to render its game state, for rooms of each size:
+    {size: {part: {'old_ms', 'new_ms', 'identical'}}}
+    """
+    results = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for size in sizes:
+            with transaction.atomic():
+                room = Room(size)
+                try:
+                    results[str(size)] = _compare_serialization(room.session, repeat)
+                finally:
+                    room.forget()
+                    transaction.set_rollback(True)
+    return results
+
+
+def _compare_serialization(session, repeat):
+    session = GameSession.objects.select_related('quiz').get(pk=session.pk)
+    payload = build_game_state(snapshot_from_session(session))
+    parts = {
+        'snapshot': (lambda: legacy_snapshot_from_session(session), lambda: snapshot_from_session(session)),
+        'final_scores': (lambda: legacy_final_scores(session), lambda: build_final_scores(session)),
+        'render': (lambda: JSONRenderer().render(payload), lambda: ORJSONRenderer().render(payload)),
+    }
+    results = {}
+    for part, (old, new) in parts.items():
+        old_ms, old_result = _cpu_ms(old, repeat)
+        new_ms, new_result = _cpu_ms(new, repeat)
+        results[part] = {
+            'old_ms': round(old_ms, 3),
+            'new_ms': round(new_ms, 3),
+            'identical': _as_json(old_result) == _as_json(new_result),
+        }
+    return results
+
+
+def _as_json(result):
+    """Rendered bytes of a benchmarked result, to compare old and new byte for byte"""
+    if isinstance(result, bytes):
+        return result
+    if isinstance(result, dict) and 'answered' in result:
+        result = dict(result, answered=sorted(result['answered']))
+    return JSONRenderer().render(result)
+
+
+def run_delta_benchmarks(size=500, batch=10):
+    """
+    Bytes sent to one polling client over two questions of a room of
+    ``size`` players, as full game states and as ``?delta_since=`` deltas:
+    the open half of the room answers the first question, the host moves
+    on and everyone answers the second, with a poll every ``batch`` answers.
+    Writes go straight to the state store; the room is rolled back.
+    """
+    with transaction.atomic():
+        room = Room(size)
+        try:
+            return _compare_deltas(room, batch)
+        finally:
+            room.forget()
+            transaction.set_rollback(True)
+
+
+def _compare_deltas(room, batch):
+    session_id = room.session.id
+    store = get_game_state_store()
+    renderer = ORJSONRenderer()
+    snapshot = load_snapshot(session_id)
+    version = snapshot['state_version']
+    polls = full_bytes = delta_bytes = 0
+
+    def poll():
+        nonlocal polls, full_bytes, delta_bytes, version
+        full_bytes += len(renderer.render(build_game_state(load_snapshot(session_id))))
+        delta = load_game_state_delta(session_id, version)
+        delta_bytes += len(renderer.render(delta))
+        version = delta['state_version']
+        polls += 1
+
+    def answer(question, players):
+        for count, player in enumerate(players, 1):
+            store.record_answer(session_id, question.id, dict(
+                player, score=player['score'] + 100, answers_correct=player['answers_correct'] + 1
+            ))
+            if count % batch == 0 or count == len(players):
+                poll()
+
+    answered = snapshot['answered']
+    answer(room.questions[0], [
+        player for player_id, player in snapshot['players'].items() if player_id not in answered
+    ])
+    store.update_session(
+        session_id, snapshot['session_version'] + 1, {'current_question_index': 0},
+        current_question_index=1, question_started_at=timezone.now().isoformat()
+    )
+    poll()
+    answer(room.questions[1], list(load_snapshot(session_id)['players'].values()))
+
+    return {
+        'players': room.session.players.count(),
+        'polls': polls,
+        'full_bytes': full_bytes,
+        'delta_bytes': delta_bytes,
+        'saved': round(1 - delta_bytes / full_bytes, 4),
+    }
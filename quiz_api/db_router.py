@@ -0,0 +1,129 @@
+import contextvars
+import math
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Holds the time until which the client's reads stay on the primary
+PIN_COOKIE = 'quiz_db_pin'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Whether the current request may read from the replica, and whether it wrote
+_replica_reads = contextvars.ContextVar('quiz_replica_reads', default=False)
+_request_writes = contextvars.ContextVar('quiz_request_writes', default=None)
+
+
+def replica_alias():
+    """The configured replica's alias, or None without one"""
+    alias = settings.DATABASE_READ_REPLICA
+    if not alias or alias == DEFAULT_DB_ALIAS or alias not in connections.settings:
+        return None
+    return alias
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, e.g. to fill a cache shared by every client"""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Read/write splitting between the primary database and a read replica.
+
+    Reads made while serving a safe request (GET, HEAD, OPTIONS) go to the
+    ``DATABASE_READ_REPLICA`` alias when it is configured; writes, reads of
+    other requests, reads inside a transaction and everything run outside a
+    request (the question timer, generation jobs, management commands) use
+    the primary. ``ReplicaRoutingMiddleware`` keeps a client that wrote on
+    the primary for ``DATABASE_REPLICA_LAG`` seconds, the most the replica
+    may lag, so it always reads its own writes.
+
+    To try it locally with two SQLite files, point the replica at a copy of
+    the database; copying it again "replicates"::
+
+        cp db.sqlite3 replica.sqlite3
+        DATABASE_REPLICA_URL=sqlite:///replica.sqlite3 python manage.py runserver
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        writes = _request_writes.get()
+        if writes is not None:
+            writes[0] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the primary's rows
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    """Decides per request whether reads may use the replica, and pins clients that wrote to the primary"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        writes, tokens = self._begin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self._reset(tokens)
+        return self._pin(response, writes)
+
+    async def __acall__(self, request):
+        writes, tokens = self._begin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._reset(tokens)
+        return self._pin(response, writes)
+
+    @staticmethod
+    def _pinned(request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _begin(self, request):
+        # A list, so writes made in sync_to_async threads are seen here
+        writes = [False]
+        reads = request.method in SAFE_METHODS and not self._pinned(request)
+        return writes, (_replica_reads.set(reads), _request_writes.set(writes))
+
+    @staticmethod
+    def _reset(tokens):
+        reads_token, writes_token = tokens
+        _replica_reads.reset(reads_token)
+        _request_writes.reset(writes_token)
+
+    @staticmethod
+    def _pin(response, writes):
+        lag = settings.DATABASE_REPLICA_LAG
+        if writes[0] and lag > 0 and replica_alias() is not None:
+            response.set_cookie(
+                PIN_COOKIE, f'{time.time() + lag:.3f}', max_age=math.ceil(lag), httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from django.db import close_old_connections, transaction
+
+from .game_state import build_game_state, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Joins to one session closer together than this reach subscribers as one event
+JOIN_EVENT_WINDOW = 0.1
+
+# Answers to one session closer together than this reach subscribers as one event
+ANSWER_EVENT_WINDOW = 0.5
+
+
+class SessionEventBroker:
+    """
+    In-process fan-out of game-state events to live subscribers.
+
+    Each subscriber is an asyncio queue owned by the event loop that serves
+    its stream, so publishing is safe from the sync worker threads that run
+    the REST views.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, session_id):
+        """Register a new subscriber queue (must be called on the event loop)"""
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        entry = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[int(session_id)].add(entry)
+        return entry
+
+    def unsubscribe(self, session_id, entry):
+        with self._lock:
+            subscribers = self._subscribers.get(int(session_id))
+            if subscribers is not None:
+                subscribers.discard(entry)
+                if not subscribers:
+                    del self._subscribers[int(session_id)]
+
+    def has_subscribers(self, session_id):
+        with self._lock:
+            return bool(self._subscribers.get(int(session_id)))
+
+    def publish(self, session_id, event, data):
+        """Deliver an event to every subscriber of a session"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(int(session_id), ()))
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event, data)
+            except RuntimeError:
+                # The subscriber's loop has already shut down
+                pass
+
+    @staticmethod
+    def _deliver(queue, event, data):
+        if queue.full():
+            # A slow client only needs the latest state, drop the oldest one
+            queue.get_nowait()
+        queue.put_nowait((event, data))
+
+
+broker = SessionEventBroker()
+
+
+def _publish(session_id, event, auto_advanced=False):
+    if not broker.has_subscribers(session_id):
+        return
+
+    try:
+        snapshot = load_snapshot(session_id)
+        broker.publish(session_id, event, build_game_state(snapshot, auto_advanced=auto_advanced))
+    except Exception as e:
+        logger.error(f"Failed to publish {event} for session {session_id}: {e}")
+
+
+def publish_session_event(session, event, auto_advanced=False):
+    """
+    Push the session's current game state to live subscribers once the
+    surrounding transaction commits.
+
+    The payload is built once per transition and shared by every subscriber.
+    """
+    session_id = session.id
+    transaction.on_commit(lambda: _publish(session_id, event, auto_advanced))
+
+
+_pending_events = set()
+_pending_events_lock = threading.Lock()
+
+
+def _publish_pending(session_id, event):
+    with _pending_events_lock:
+        _pending_events.discard((session_id, event))
+    # Runs on a timer thread, outside the request cycle that recycles connections
+    try:
+        _publish(session_id, event)
+    finally:
+        close_old_connections()
+
+
+def _publish_coalesced(session_id, event, window):
+    """
+    ``publish_session_event`` for events that come in bursts: the first one
+    after the transaction commits starts a ``window``-second timer, later
+    ones ride along, and subscribers get a single state once it fires.
+    """
+    def _schedule():
+        if not broker.has_subscribers(session_id):
+            return
+        with _pending_events_lock:
+            if (session_id, event) in _pending_events:
+                return
+            _pending_events.add((session_id, event))
+        timer = threading.Timer(window, _publish_pending, args=(session_id, event))
+        timer.daemon = True
+        timer.start()
+
+    transaction.on_commit(_schedule)
+
+
+def publish_player_joined(session_id):
+    """
+    ``publish_session_event(session, 'player_joined')``, coalesced: while
+    players pour in, subscribers get the room once per JOIN_EVENT_WINDOW
+    rather than a full game state per join.
+    """
+    _publish_coalesced(session_id, 'player_joined', JOIN_EVENT_WINDOW)
+
+
+def publish_answer_received(session_id):
+    """
+    ``publish_session_event(session, 'answer_received')``, coalesced: a room
+    answering a question gets the game state once per ANSWER_EVENT_WINDOW,
+    not once per answer (a room-sized state to every subscriber, N times).
+    """
+    _publish_coalesced(session_id, 'answer_received', ANSWER_EVENT_WINDOW)
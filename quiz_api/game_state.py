@@ -0,0 +1,466 @@
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+import logging
+
+from .db_router import primary_reads
+from .models import GameSession, Player, PlayerAnswer
+from .serializers import QuestionSerializer
+from .join_codes import get_join_code_resolver
+from .leaderboard import PLAYER_TOP, Leaderboard, ranked_player, ranked_players
+from .state_store import InMemoryGameStateStore, get_game_state_store
+
+logger = logging.getLogger(__name__)
+
+_datetime_field = serializers.DateTimeField()
+
+# Snapshots are built from .values() rows of these fields: what
+# QuestionSerializer and PlayerSerializer (minus rank) return, in their order
+QUESTION_FIELDS = tuple(QuestionSerializer.Meta.fields)
+PLAYER_FIELDS = ('id', 'nickname', 'score', 'answers_correct', 'answers_wrong', 'joined_at', 'is_active')
+
+
+def get_ordered_questions(session):
+    """Return the session's questions in play order"""
+    return list(session.quiz.questions.all().order_by('order'))
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _store_on_commit(session_id, write):
+    """
+    Run ``write(store)`` on the state store once the transaction commits. A
+    write that fails drops the session's snapshot instead, so readers rebuild
+    it from the database rather than keep serving one that lacks the change.
+    """
+    def apply():
+        store = get_game_state_store()
+        try:
+            write(store)
+        except Exception as e:
+            logger.error(f"State store write for session {session_id} failed, dropping its snapshot: {e}")
+            try:
+                store.invalidate(session_id)
+            except Exception as e:
+                logger.error(f"Could not drop the snapshot of session {session_id}: {e}")
+
+    transaction.on_commit(apply)
+
+
+def store_session(session, previous):
+    """
+    Push the session's status, index and timing to the state store on
+    commit, as of its ``state_version``. ``previous`` holds the values of
+    those fields the change replaced, so a snapshot that missed an earlier
+    change is caught.
+    """
+    session_id = session.id
+    version = session.state_version
+    fields = {
+        'status': session.status,
+        'current_question_index': session.current_question_index,
+        'started_at': _isoformat(session.started_at),
+        'question_started_at': _isoformat(session.question_started_at),
+    }
+    _store_on_commit(session_id, lambda store: store.update_session(session_id, version, previous, **fields))
+    if session.status == 'finished':
+        # Players joining with the quiz's code from now on get a new session
+        transaction.on_commit(lambda: get_join_code_resolver().forget_session(session_id))
+
+
+def session_position(session):
+    """The fields ``store_session`` checks the snapshot against, as they are before a change"""
+    return {'status': session.status, 'current_question_index': session.current_question_index}
+
+
+def store_player(player):
+    """Push a joined player to the state store on commit"""
+    session_id = player.session_id
+    data = snapshot_player(player)
+    _store_on_commit(session_id, lambda store: store.put_player(session_id, data))
+
+
+def store_answer(session_id, question_id, player):
+    """
+    Push a player's new counters and answered flag to the state store on
+    commit. ``player`` is the snapshot's copy of them with the new counters,
+    or None when the snapshot lacked them; the snapshot is dropped then.
+    """
+    if player is None:
+        _store_on_commit(session_id, lambda store: store.invalidate(session_id))
+    else:
+        _store_on_commit(session_id, lambda store: store.record_answer(session_id, question_id, player))
+
+
+def load_player_session_id(player_id):
+    """
+    The session of a player, from the state store when a snapshot has held
+    them, else from the database. Raises Player.DoesNotExist for unknown
+    players and ValueError for malformed ids.
+    """
+    player_id = int(player_id)
+    session_id = get_game_state_store().player_session(player_id)
+    if session_id is None:
+        session_id = Player.objects.values_list('session_id', flat=True).get(pk=player_id)
+    return session_id
+
+
+def advance_question(session, total_questions):
+    """
+    Move the session past its current question, finishing it after the last one.
+
+    The update is a compare-and-swap on ``current_question_index``: it only
+    applies if nobody else (the question timer, another worker, the host)
+    advanced the session since it was loaded, so a question is never skipped.
+    Returns True if this call advanced the session; ``session`` then holds
+    the new state.
+    """
+    now = timezone.now()
+    changes = {'current_question_index': session.current_question_index + 1}
+    if changes['current_question_index'] >= total_questions:
+        changes.update(status='finished', ended_at=now)
+    else:
+        changes['question_started_at'] = now
+
+    previous = session_position(session)
+    if not session.apply_state(changes, **previous):
+        return False
+    store_session(session, previous)
+    return True
+
+
+def answered_player_ids(question, player_ids):
+    """IDs of the given players who have answered the question, in one ``IN`` query"""
+    if question is None or not player_ids:
+        return set()
+    return set(
+        PlayerAnswer.objects.filter(question=question, player_id__in=player_ids)
+        .values_list('player_id', flat=True)
+    )
+
+
+def build_final_scores(session):
+    """Active players in leaderboard order as PlayerSerializer renders them, ranked in a single query"""
+    return [
+        dict(row, joined_at=_datetime_field.to_representation(row['joined_at']))
+        for row in session.ranked_players().values(*PLAYER_FIELDS, 'rank')
+    ]
+
+
+def snapshot_player_row(row):
+    """The state-store form of a player's ``.values(*PLAYER_FIELDS)`` row: PlayerSerializer fields minus rank"""
+    joined_at = row['joined_at']
+    return {
+        'id': row['id'],
+        'nickname': row['nickname'],
+        'score': row['score'],
+        'answers_correct': row['answers_correct'],
+        'answers_wrong': row['answers_wrong'],
+        'joined_at': _datetime_field.to_representation(joined_at),
+        'is_active': row['is_active'],
+        'joined_ts': joined_at.timestamp(),
+    }
+
+
+def snapshot_player(player):
+    """The state-store form of a player instance"""
+    return snapshot_player_row({field: getattr(player, field) for field in PLAYER_FIELDS})
+
+
+def served_state_version(session_version, players):
+    """
+    The state version clients see: the session's own, which joins and
+    transitions bump in the database, plus every answer given, which only
+    bumps the snapshot. It grows with each change, whichever way the
+    snapshot was built.
+    """
+    return session_version + sum(player['answers_correct'] + player['answers_wrong'] for player in players)
+
+
+def snapshot_from_session(session):
+    """
+    Build a state-store snapshot from the database in three queries, from
+    plain rows rather than model instances and serializers
+    """
+    questions = list(session.quiz.questions.order_by('order').values(*QUESTION_FIELDS))
+    players = {row['id']: snapshot_player_row(row) for row in session.players.values(*PLAYER_FIELDS)}
+
+    current_question = None
+    if session.status == 'active' and session.current_question_index < len(questions):
+        current_question = questions[session.current_question_index]['id']
+
+    return {
+        'session_id': session.id,
+        'status': session.status,
+        'current_question_index': session.current_question_index,
+        'started_at': _isoformat(session.started_at),
+        'question_started_at': _isoformat(session.question_started_at),
+        'state_version': served_state_version(session.state_version, players.values()),
+        'session_version': session.state_version,
+        'quiz_title': session.quiz.title,
+        'questions': questions,
+        'players': players,
+        'answered': answered_player_ids(current_question, list(players)),
+    }
+
+
+def load_snapshot(session_id):
+    """
+    Return the session's hot snapshot, rebuilding it from the database on a
+    store miss. Raises GameSession.DoesNotExist for unknown sessions and
+    ValueError for malformed ids.
+    """
+    session_id = int(session_id)
+    store = get_game_state_store()
+    snapshot = store.get(session_id)
+    if snapshot is None:
+        token = store.begin_fill(session_id)
+        # Every client is served this snapshot, so it must not come from a lagging replica
+        with primary_reads():
+            session = GameSession.objects.select_related('quiz').get(pk=session_id)
+            snapshot = snapshot_from_session(session)
+        store.finish_fill(session_id, token, snapshot)
+    return snapshot
+
+
+def snapshot_question(snapshot, question_id):
+    """The snapshot's serialized question with this id, or None if it is not in the quiz"""
+    for question in snapshot['questions']:
+        if question['id'] == question_id:
+            return question
+    return None
+
+
+def question_time_left(question, started):
+    """Seconds left on a serialized question that started at the ``started`` ISO time"""
+    question_start_time = parse_datetime(started) if started else timezone.now()
+    elapsed = (timezone.now() - question_start_time).total_seconds()
+    return max(0, question['time_limit'] - elapsed)
+
+
+def snapshot_time_left(snapshot):
+    """Seconds left on the snapshot's current question, or None when not active"""
+    index = snapshot['current_question_index']
+    if snapshot['status'] != 'active' or index >= len(snapshot['questions']):
+        return None
+    return question_time_left(
+        snapshot['questions'][index], snapshot['question_started_at'] or snapshot['started_at']
+    )
+
+
+def ranked_snapshot_players(snapshot):
+    """Active players from a snapshot in leaderboard order with their rank"""
+    ranking = snapshot.get('ranking')
+    if ranking is None:
+        # Snapshots straight from the database carry no maintained ranking
+        ranking = Leaderboard(snapshot['players'].values()).ids()
+    return ranked_players(snapshot['players'], ranking)
+
+
+def load_leaderboard(session_id, top=None, around_player=None):
+    """
+    A leaderboard slice (see ``GameStateStore.leaderboard``) answered from
+    the session's incrementally ranked snapshot, rebuilding it on a miss.
+    Raises GameSession.DoesNotExist for unknown sessions.
+    """
+    session_id = int(session_id)
+    store = get_game_state_store()
+    result = store.leaderboard(session_id, top=top, around_player=around_player)
+    if result is None:
+        snapshot = load_snapshot(session_id)
+        result = store.leaderboard(session_id, top=top, around_player=around_player)
+        if result is None:
+            # The rebuild raced a writer and was discarded; slice it privately
+            private = InMemoryGameStateStore()
+            private.finish_fill(session_id, private.begin_fill(session_id), snapshot)
+            result = private.leaderboard(session_id, top=top, around_player=around_player)
+    return result
+
+
+def load_player_view(session_id, player_id, top=PLAYER_TOP):
+    """
+    One player's view of the session (see ``GameStateStore.player_view``),
+    rebuilding the snapshot on a miss. Raises GameSession.DoesNotExist for
+    unknown sessions.
+    """
+    store = get_game_state_store()
+    view = store.player_view(session_id, player_id, top=top)
+    if view is None:
+        snapshot = load_snapshot(session_id)
+        view = store.player_view(session_id, player_id, top=top)
+        if view is None:
+            # The rebuild raced a writer and was discarded; read it privately
+            private = InMemoryGameStateStore()
+            private.finish_fill(session_id, private.begin_fill(session_id), snapshot)
+            view = private.player_view(session_id, player_id, top=top)
+    return view
+
+
+def build_player_state(view):
+    """
+    The compact payload of ``PlayerViewSet.state``: the phase, the current
+    question and its clock, the player's own standing and the leaders
+    """
+    question = view['current_question']
+    question_start_time = None
+    time_left = 0
+    if question is not None:
+        question_start_time = view['question_started_at'] or view['started_at'] or timezone.now().isoformat()
+        time_left = round(question_time_left(question, question_start_time), 1)
+
+    player = view['player']
+    if player is not None:
+        player = dict(player, has_answered=view['has_answered'])
+
+    finished = view['status'] == 'finished' or view['current_question_index'] >= view['total_questions']
+    return {
+        'session_id': view['session_id'],
+        'status': 'finished' if finished else view['status'],
+        'current_question_index': view['current_question_index'],
+        'total_questions': view['total_questions'],
+        'time_left': time_left,
+        'question_start_time': question_start_time,
+        'current_question': question,
+        'player': player,
+        'player_count': view['total_players'],
+        'top': view['top'],
+        'state_version': view['state_version'],
+        'server_time': timezone.now().isoformat(),
+    }
+
+
+def _question_state(snapshot):
+    """(current question, time left, question start time, answered ids) of an unfinished snapshot"""
+    if snapshot['status'] != 'active':
+        return None, 0, None, set()
+    question_start_time = snapshot['question_started_at'] or snapshot['started_at'] or timezone.now().isoformat()
+    return (
+        snapshot['questions'][snapshot['current_question_index']],
+        round(snapshot_time_left(snapshot), 1),
+        question_start_time,
+        snapshot['answered'],
+    )
+
+
+def build_game_state(snapshot, auto_advanced=False):
+    """
+    Build the game-state payload served by ``game_state`` and pushed to
+    live subscribers, entirely from a store snapshot (no database access).
+    """
+    questions = snapshot['questions']
+    total_questions = len(questions)
+    index = snapshot['current_question_index']
+    players_data = ranked_snapshot_players(snapshot)
+
+    if snapshot['status'] == 'finished' or index >= total_questions:
+        return {
+            'session_id': snapshot['session_id'],
+            'status': 'finished',
+            'current_question_index': index,
+            'total_questions': total_questions,
+            'final_scores': players_data,
+            'players': players_data,
+            'player_count': len(players_data),
+            'state_version': snapshot['state_version'],
+            'server_time': timezone.now().isoformat()
+        }
+
+    current_question, time_left, question_start_time, answered = _question_state(snapshot)
+
+    responses_received = 0
+    for player_data in players_data:
+        player_data['has_answered'] = player_data['id'] in answered
+        responses_received += player_data['has_answered']
+
+    return {
+        'session_id': snapshot['session_id'],
+        'status': snapshot['status'],
+        'current_question_index': index,
+        'total_questions': total_questions,
+        'time_left': time_left,
+        'question_start_time': question_start_time,
+        'current_question': current_question,
+        'players': players_data,
+        'player_count': len(players_data),
+        'responses_received': responses_received,
+        'state_version': snapshot['state_version'],
+        'server_time': timezone.now().isoformat(),
+        'auto_advanced': auto_advanced
+    }
+
+
+def build_game_state_delta(snapshot, since, changes):
+    """
+    What changed in the game-state payload after version ``since``, from a
+    store snapshot and its ``GameStateStore.changes``::
+
+        {'delta': True, 'since', 'session_id', 'state_version', 'server_time',
+         'time_left', 'player_count', 'responses_received',
+         'players': [...],     # changed active players, as in the full payload
+         'left': [...],        # ids of changed players who are no longer active
+         # only when the session moved on (started, advanced):
+         'status', 'current_question_index', 'total_questions',
+         'question_start_time', 'current_question',
+         'answered': [...]}    # has_answered is true for these ids only
+
+    Other players keep their fields; their ranks follow from the scores,
+    highest first, earlier joiners first on ties. Clients too far behind
+    for the change log, and finished games, get the full payload with
+    ``'delta': False``.
+    """
+    index = snapshot['current_question_index']
+    if changes is None or snapshot['status'] == 'finished' or index >= len(snapshot['questions']):
+        return dict(build_game_state(snapshot), delta=False)
+
+    current_question, time_left, question_start_time, answered = _question_state(snapshot)
+    players = snapshot['players']
+    ranking = snapshot.get('ranking')
+    if ranking is None:
+        ranking = Leaderboard(players.values()).ids()
+    ranks = {player_id: rank for rank, player_id in enumerate(ranking, 1)}
+
+    changed_players = []
+    left = []
+    for player_id in sorted(changes['players']):
+        if player_id not in ranks:
+            left.append(player_id)
+            continue
+        player_data = ranked_player(players[player_id], ranks[player_id])
+        player_data['has_answered'] = player_id in answered
+        changed_players.append(player_data)
+
+    delta = {
+        'delta': True,
+        'since': since,
+        'session_id': snapshot['session_id'],
+        'state_version': changes['state_version'],
+        'server_time': timezone.now().isoformat(),
+        'time_left': time_left,
+        'player_count': len(ranking),
+        'responses_received': sum(1 for player_id in answered if player_id in ranks),
+        'players': changed_players,
+        'left': left,
+    }
+    if changes['session']:
+        delta.update(
+            status=snapshot['status'],
+            current_question_index=index,
+            total_questions=len(snapshot['questions']),
+            question_start_time=question_start_time,
+            current_question=current_question,
+            answered=sorted(answered),
+        )
+    return delta
+
+
+def load_game_state_delta(session_id, since):
+    """
+    ``build_game_state_delta`` for a client holding version ``since``.
+    Raises GameSession.DoesNotExist for unknown sessions.
+    """
+    snapshot = load_snapshot(session_id)
+    changes = get_game_state_store().changes(int(session_id), since, snapshot['state_version'])
+    return build_game_state_delta(snapshot, since, changes)
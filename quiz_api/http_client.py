@@ -0,0 +1,194 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another attempt: rate limiting and transient upstream failures
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Per-attempt records kept for inspection
+RECENT_ATTEMPTS = 200
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - timezone.now()).total_seconds())
+
+
+class RequestMetrics:
+    """Thread-safe per-attempt latency and outcome counters"""
+
+    def __init__(self, recent=RECENT_ATTEMPTS):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=recent)
+        self._outcomes = Counter()
+        self._attempts = 0
+        self._retries = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def record(self, attempt, latency, outcome):
+        """``outcome`` is the HTTP status code, or an exception class name"""
+        with self._lock:
+            self._attempts += 1
+            self._retries += attempt > 1
+            self._outcomes[str(outcome)] += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+            self._recent.append({'attempt': attempt, 'latency': latency, 'outcome': outcome})
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'attempts': self._attempts,
+                'retries': self._retries,
+                'outcomes': dict(self._outcomes),
+                'latency_avg': self._latency_total / self._attempts if self._attempts else 0.0,
+                'latency_max': self._latency_max,
+                'recent': list(self._recent),
+            }
+
+
+class PooledHTTPClient:
+    """
+    A process-wide HTTP client for upstream APIs.
+
+    One ``requests.Session`` keeps connections (and their TLS sessions)
+    alive between calls. At most ``max_concurrency`` requests are in flight
+    at once, a streamed one until its response is closed; further callers
+    wait for a slot instead of opening more connections. Connection errors,
+    timeouts and RETRY_STATUSES are retried with full-jitter exponential
+    backoff, waiting at least as long as a ``Retry-After`` header asks.
+    Every attempt is recorded in ``metrics``.
+    """
+
+    def __init__(self, max_concurrency=4, max_retries=3, backoff_base=0.5,
+                 backoff_cap=8.0, max_retry_after=30.0, sleep=time.sleep):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+        self.metrics = RequestMetrics()
+        self._sleep = sleep
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def backoff(self, attempt, retry_after=None):
+        """Seconds to wait before retry number ``attempt``"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_retry_after))
+        return delay
+
+    def _hold_slot(self, response):
+        """Release the slot taken for a streamed response when it is closed, as its body is read later"""
+        close = response.close
+        released = threading.Lock()
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                # Closing twice (a ``with`` block, then an explicit close) releases once
+                if released.acquire(blocking=False):
+                    self._slots.release()
+
+        response.close = close_and_release
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request, retrying transient failures. Returns the last
+        response (which may still be an error status once retries run out)
+        and re-raises the last RequestException if no attempt got a response.
+        With ``stream=True`` the response keeps its slot until it is closed,
+        so callers must close it (``with response:``) once the body is read.
+        """
+        attempts = self.max_retries + 1
+        for attempt in range(1, attempts + 1):
+            started = time.monotonic()
+            self._slots.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._slots.release()
+                latency = time.monotonic() - started
+                self.metrics.record(attempt, latency, type(e).__name__)
+                logger.warning(f"{method} {url} attempt {attempt}/{attempts} failed after {latency:.2f}s: {e}")
+                if attempt == attempts:
+                    raise
+                self._sleep(self.backoff(attempt))
+                continue
+            except BaseException:
+                self._slots.release()
+                raise
+
+            if kwargs.get('stream'):
+                self._hold_slot(response)
+            else:
+                self._slots.release()
+
+            latency = time.monotonic() - started
+            self.metrics.record(attempt, latency, response.status_code)
+            logger.info(f"{method} {url} attempt {attempt}/{attempts}: {response.status_code} in {latency:.2f}s")
+            if response.status_code not in RETRY_STATUSES or attempt == attempts:
+                return response
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            response.close()
+            self._sleep(self.backoff(attempt, retry_after))
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """The process-wide client for AI requests, configured from settings"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PooledHTTPClient(
+                    max_concurrency=settings.AI_HTTP_MAX_CONCURRENCY,
+                    max_retries=settings.AI_HTTP_MAX_RETRIES,
+                    backoff_base=settings.AI_HTTP_BACKOFF_BASE,
+                )
+    return _client
+
+
+@receiver(setting_changed)
+def _reset_client(setting, **kwargs):
+    global _client
+    if setting.startswith('AI_HTTP_') and _client is not None:
+        _client.close()
+        _client = None
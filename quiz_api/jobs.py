@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .ai_service import QuizAIService
+from .materialize import QuestionWriter
+from .models import QuizGenerationJob
+from .question_bank import NearDuplicateIndex, bank_text, get_question_bank
+
+logger = logging.getLogger(__name__)
+
+# Jobs left 'running' this long were orphaned by a worker that died mid-generation
+STALE_JOB_AGE = timedelta(minutes=10)
+
+# Longest a generated question waits before it is written
+STREAM_FLUSH_SECONDS = 0.5
+
+
+def run_generation_job(job_id):
+    """
+    Generate and save a pending job's questions.
+
+    The job is claimed with a compare-and-swap from 'pending' to 'running',
+    so a job handed to several workers (the in-process pool and
+    ``run_generation_jobs``) is only generated once. Returns True if this
+    call ran the job.
+    """
+    claimed = QuizGenerationJob.objects.filter(pk=job_id, status='pending').update(
+        status='running', started_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    job = QuizGenerationJob.objects.select_related('quiz').get(pk=job_id)
+    quiz = job.quiz
+    logger.info(f"🤖 Generating {job.num_questions} questions for quiz {quiz.id} (job {job.id})")
+
+    def record_progress(count):
+        QuizGenerationJob.objects.filter(pk=job.pk).update(questions_created=count)
+
+    # Questions that arrive together (cache hits, chunked quizzes) are
+    # batched into bulk INSERTs; streamed ones are written as they arrive,
+    # so generation_status shows the first ones while the rest are generated
+    writer = QuestionWriter(quiz, max_delay=STREAM_FLUSH_SECONDS, on_flush=record_progress)
+    try:
+        questions = QuizAIService().iter_quiz_questions(
+            topic=quiz.topic,
+            difficulty=quiz.difficulty,
+            num_questions=job.num_questions
+        )
+        seen = NearDuplicateIndex()
+        kept = []
+        for q_data in questions:
+            text = bank_text(q_data)
+            if seen.find(text):
+                logger.info(f"Skipping near-duplicate question: {text[:50]}...")
+                continue
+            writer.add(q_data)
+            seen.add(len(kept), text)
+            kept.append(q_data)
+        writer.flush()
+    except Exception as e:
+        # Questions received before the failure are kept
+        try:
+            writer.flush()
+        except Exception as flush_error:
+            logger.error(f"Could not save the questions of failed job {job.id}: {str(flush_error)}")
+        logger.error(f"Quiz generation job {job.id} failed after {writer.count} questions: {str(e)}")
+        QuizGenerationJob.objects.filter(pk=job.pk).update(
+            status='failed', error=str(e), questions_created=writer.count, finished_at=timezone.now()
+        )
+        return True
+
+    QuizGenerationJob.objects.filter(pk=job.pk).update(status='completed', finished_at=timezone.now())
+
+    # Keep the new questions for quizzes assembled from the bank later
+    try:
+        get_question_bank().add(kept, quiz.topic, quiz.difficulty, created_by_id=quiz.host_id)
+    except Exception as e:
+        logger.warning(f"Could not bank questions of job {job.id}: {str(e)}")
+    logger.info(f"✅ Quiz generation job {job.id} completed: {writer.count} questions")
+    return True
+
+
+def requeue_stale_jobs(older_than=STALE_JOB_AGE):
+    """Put jobs orphaned in 'running' back to 'pending'; returns how many"""
+    return QuizGenerationJob.objects.filter(
+        status='running', started_at__lt=timezone.now() - older_than
+    ).update(status='pending', started_at=None)
+
+
+def pending_job_ids():
+    return list(QuizGenerationJob.objects.filter(status='pending').values_list('id', flat=True))
+
+
+class GenerationJobRunner:
+    """
+    Runs quiz generation jobs on a small in-process thread pool.
+
+    Jobs live in the database, so there is no broker to run: the web process
+    submits each job once its row is committed, and jobs it never got to (a
+    restart, QUIZ_GENERATION_IN_PROCESS off) stay 'pending' for
+    ``python manage.py run_generation_jobs`` to drain.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers or settings.QUIZ_GENERATION_WORKERS,
+                    thread_name_prefix='quiz-generation'
+                )
+            return self._executor
+
+    def submit(self, job_id):
+        return self._get_executor().submit(self.run, job_id)
+
+    @staticmethod
+    def run(job_id):
+        # Pool threads never go through the request cycle that recycles connections
+        close_old_connections()
+        try:
+            return run_generation_job(job_id)
+        except Exception as e:
+            logger.error(f"Quiz generation job {job_id} crashed: {str(e)}")
+            return False
+        finally:
+            close_old_connections()
+
+    def drain(self):
+        """Run every pending job in this thread; returns how many ran"""
+        requeue_stale_jobs()
+        return sum(self.run(job_id) for job_id in pending_job_ids())
+
+    def run_forever(self, poll_interval):
+        while True:
+            if not self.drain():
+                time.sleep(poll_interval)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+generation_runner = GenerationJobRunner()
+
+
+def enqueue_generation_job(job):
+    """Start the job on this process's pool once the surrounding transaction commits"""
+    if not settings.QUIZ_GENERATION_IN_PROCESS:
+        return
+    job_id = job.id
+    transaction.on_commit(lambda: generation_runner.submit(job_id))
@@ -0,0 +1,258 @@
+import functools
+import hashlib
+import logging
+import string
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import GameSession, Quiz, RecycledJoinCode, generate_join_code
+
+logger = logging.getLogger(__name__)
+
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+
+# 36^6 codes, split into two halves of 36^3 for the Feistel network
+CODE_SPACE = len(CODE_ALPHABET) ** CODE_LENGTH
+_HALF = len(CODE_ALPHABET) ** (CODE_LENGTH // 2)
+FEISTEL_ROUNDS = 6
+
+# Recycled codes looked at per claim, in case others claim the oldest ones first
+CLAIM_CANDIDATES = 5
+
+# Random codes tried when a shuffled code is already taken (only legacy
+# random codes, or codes issued under another JOIN_CODE_KEY, can clash)
+FALLBACK_ATTEMPTS = 10
+
+
+@functools.lru_cache(maxsize=4)
+def _round_key(secret):
+    return hashlib.sha256(f'join-code:{secret}'.encode()).digest()
+
+
+def _round(key, number, half):
+    digest = hashlib.blake2b(f'{number}:{half}'.encode(), key=key, digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % _HALF
+
+
+def permute(index, secret=None):
+    """Keyed bijection of range(CODE_SPACE) onto itself"""
+    key = _round_key(secret if secret is not None else settings.JOIN_CODE_KEY)
+    left, right = divmod(index % CODE_SPACE, _HALF)
+    for number in range(FEISTEL_ROUNDS):
+        left, right = right, (left + _round(key, number, right)) % _HALF
+    return left * _HALF + right
+
+
+def unpermute(value, secret=None):
+    """Inverse of ``permute``"""
+    key = _round_key(secret if secret is not None else settings.JOIN_CODE_KEY)
+    left, right = divmod(value, _HALF)
+    for number in reversed(range(FEISTEL_ROUNDS)):
+        left, right = (right - _round(key, number, left)) % _HALF, left
+    return left * _HALF + right
+
+
+def encode_code(value):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def code_for_index(index, secret=None):
+    """The join code of the index-th quiz"""
+    return encode_code(permute(index, secret))
+
+
+class JoinCodeAllocator:
+    """
+    Hands out join codes without ever probing for a free one.
+
+    A new quiz's code is its primary key pushed through a keyed Feistel
+    permutation of the 36^6 code space: ids are unique and never reused,
+    so neither are the codes, and consecutive quizzes get unrelated-looking
+    codes. Codes released by deactivated or deleted quizzes wait out a
+    recycle delay in RecycledJoinCode and are then claimed (by deleting
+    their row) before new ones are minted. The unique constraint on
+    ``Quiz.join_code`` stays the final guard.
+    """
+
+    def __init__(self, recycle_delay=24 * 60 * 60):
+        self.recycle_delay = timedelta(seconds=recycle_delay)
+        self._lock = threading.Lock()
+        # Nothing in the recycled pool can be claimed before this time
+        self._next_claimable = None
+
+    def claim_recycled(self):
+        """A released code whose delay has passed, removed from the pool, or None"""
+        now = timezone.now()
+        with self._lock:
+            if self._next_claimable is not None and now < self._next_claimable:
+                return None
+
+        pool = list(RecycledJoinCode.objects.order_by('available_at').values_list(
+            'code', 'available_at'
+        )[:CLAIM_CANDIDATES])
+        for code, available_at in pool:
+            if available_at > now:
+                break
+            if RecycledJoinCode.objects.filter(code=code).delete()[0]:
+                return code
+
+        waiting = [available_at for _, available_at in pool if available_at > now]
+        if len(waiting) < len(pool):
+            # Others claimed these first; there may be more claimable ones behind them
+            return None
+        # Codes released from now on only become claimable after the delay
+        with self._lock:
+            self._next_claimable = min(waiting + [now + self.recycle_delay])
+        return None
+
+    def release(self, code):
+        """Put a code no quiz uses any more back in the pool"""
+        RecycledJoinCode.objects.get_or_create(
+            code=code, defaults={'available_at': timezone.now() + self.recycle_delay}
+        )
+        with self._lock:
+            if self.recycle_delay <= timedelta(0):
+                self._next_claimable = None
+
+    def save_with_code(self, quiz, save, *args, **kwargs):
+        """
+        Save a quiz that has no join code yet, giving it one. ``save`` is the
+        model's own save; ``kwargs`` are the arguments it was called with.
+        """
+        using = kwargs.get('using')
+        with transaction.atomic(using=using):
+            quiz.join_code = self.claim_recycled()
+            if quiz.join_code is not None:
+                save(*args, **kwargs)
+                return
+
+            if quiz._state.adding:
+                save(*args, **kwargs)
+                candidates = [code_for_index(quiz.pk)]
+            else:
+                # A reactivated quiz: its own shuffled code may have been recycled
+                candidates = []
+            candidates += [generate_join_code() for _ in range(FALLBACK_ATTEMPTS)]
+
+            for code in candidates:
+                quiz.join_code = code
+                try:
+                    with transaction.atomic(using=using):
+                        save(update_fields=['join_code'], using=using)
+                    return
+                except IntegrityError:
+                    logger.warning(f"Join code {code} is taken, trying another for quiz {quiz.pk}")
+            quiz.join_code = None
+            raise IntegrityError(f'Could not find a free join code for quiz {quiz.pk}')
+
+
+class JoinCodeResolver:
+    """
+    Cache of join code -> the quiz's live session, for join storms.
+
+    The first join with a code looks the quiz up and gets or creates its
+    live session; everyone after it for ``ttl`` seconds joins straight
+    from memory. Entries are dropped when the session finishes or the quiz
+    is deactivated, and an entry made stale by another process (the session
+    finished, the quiz deactivated) is caught by the join itself (see
+    ``GameSession.bump_state_version(joinable_only=True)``).
+    """
+
+    def __init__(self, ttl=10, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def resolve(self, code, fresh=False):
+        """
+        {'session_id', 'quiz_id', 'quiz_title', 'total_questions'} for an
+        active quiz's code, or None. ``fresh`` skips the cache.
+        """
+        now = time.monotonic()
+        if not fresh:
+            with self._lock:
+                entry = self._entries.get(code)
+                if entry is not None and entry[1] > now:
+                    return entry[0]
+
+        quiz = Quiz.objects.filter(join_code=code, is_active=True).annotate(
+            total_questions=Count('questions')
+        ).values('id', 'title', 'total_questions').first()
+        if quiz is None:
+            self.forget(code)
+            return None
+
+        session, created = GameSession.get_or_create_live(quiz['id'])
+        if created:
+            logger.info(f"🎮 Opened session {session.id} for quiz {quiz['id']}")
+        target = {
+            'session_id': session.id,
+            'quiz_id': quiz['id'],
+            'quiz_title': quiz['title'],
+            'total_questions': quiz['total_questions'],
+        }
+        with self._lock:
+            self._entries[code] = (target, now + self.ttl)
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return target
+
+    def forget(self, code):
+        with self._lock:
+            self._entries.pop(code, None)
+
+    def forget_session(self, session_id):
+        with self._lock:
+            for code in [code for code, (target, _) in self._entries.items() if target['session_id'] == session_id]:
+                del self._entries[code]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+_resolver = None
+
+
+def get_join_code_allocator():
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = JoinCodeAllocator(recycle_delay=settings.JOIN_CODE_RECYCLE_DELAY)
+    return _allocator
+
+
+def get_join_code_resolver():
+    global _resolver
+    if _resolver is None:
+        with _allocator_lock:
+            if _resolver is None:
+                _resolver = JoinCodeResolver(ttl=settings.JOIN_CODE_CACHE_TTL)
+    return _resolver
+
+
+@receiver(setting_changed)
+def _reset_allocator(setting, **kwargs):
+    global _allocator, _resolver
+    if setting.startswith('JOIN_CODE_'):
+        _allocator = None
+        _resolver = None
@@ -0,0 +1,71 @@
+from bisect import bisect_left, insort
+
+# Players shown on each side of a player for "around me" queries
+AROUND_RADIUS = 5
+
+# Leaders shown on a player's own screen
+PLAYER_TOP = 5
+
+
+def ranking_key(player):
+    """Leaderboard order: highest score first, earliest joiner wins ties"""
+    return (-player['score'], player['joined_ts'], player['id'])
+
+
+def ranked_player(player, rank):
+    """The API form of a stored player: everything but ``joined_ts``, plus ``rank``"""
+    data = {key: value for key, value in player.items() if key != 'joined_ts'}
+    data['rank'] = rank
+    return data
+
+
+def ranked_players(players, ids, first_rank=1):
+    """Stored players for consecutive ranks starting at ``first_rank``"""
+    return [ranked_player(players[player_id], rank) for rank, player_id in enumerate(ids, first_rank)]
+
+
+class Leaderboard:
+    """
+    A session's active players in leaderboard order, maintained incrementally.
+
+    Players are kept as a sorted list of ``ranking_key`` tuples, so rank
+    lookups are bisections (O(log N)) and a score change moves a single key
+    instead of re-sorting the room.
+    """
+
+    def __init__(self, players=()):
+        self._keys = sorted(ranking_key(player) for player in players if player['is_active'])
+        self._key_of = {key[2]: key for key in self._keys}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def update(self, player):
+        """Insert, move or (for inactive players) remove a player"""
+        old_key = self._key_of.pop(player['id'], None)
+        if old_key is not None:
+            del self._keys[bisect_left(self._keys, old_key)]
+
+        if player['is_active']:
+            key = ranking_key(player)
+            insort(self._keys, key)
+            self._key_of[player['id']] = key
+
+    def rank(self, player_id):
+        """1-based rank of a player, or None if they are not on the board"""
+        key = self._key_of.get(player_id)
+        if key is None:
+            return None
+        return bisect_left(self._keys, key) + 1
+
+    def ids(self, start=0, stop=None):
+        """Player ids for ranks ``start + 1`` through ``stop``"""
+        return [key[2] for key in self._keys[start:stop]]
+
+    def window(self, player_id, radius=AROUND_RADIUS):
+        """(first rank, player ids) for a player and up to ``radius`` neighbours on each side"""
+        rank = self.rank(player_id)
+        if rank is None:
+            return None, []
+        start = max(0, rank - 1 - radius)
+        return start + 1, self.ids(start, rank + radius)
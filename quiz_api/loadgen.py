@@ -0,0 +1,567 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Share of answers the simulated players get right
+CORRECT_ANSWER_RATE = 0.7
+
+# How often a host checks on its AI generation job (seconds)
+GENERATION_POLL_INTERVAL = 0.25
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(1, math.ceil(pct / 100 * len(sorted_values))) - 1]
+
+
+class LatencyStats:
+    """Latencies and failures per endpoint, e.g. ``POST /api/sessions/join/``"""
+
+    def __init__(self):
+        self._latencies = defaultdict(list)
+        self._errors = defaultdict(int)
+
+    def record(self, endpoint, latency, ok):
+        self._latencies[endpoint].append(latency)
+        if not ok:
+            self._errors[endpoint] += 1
+
+    @property
+    def requests(self):
+        return sum(len(values) for values in self._latencies.values())
+
+    def report(self, elapsed):
+        """One row per endpoint: request and error counts, requests/s and p50/p95/p99 in ms"""
+        rows = []
+        for endpoint in sorted(self._latencies):
+            values = sorted(self._latencies[endpoint])
+            rows.append({
+                'endpoint': endpoint,
+                'requests': len(values),
+                'errors': self._errors[endpoint],
+                'throughput': len(values) / elapsed if elapsed else 0.0,
+                'p50': percentile(values, 50) * 1000,
+                'p95': percentile(values, 95) * 1000,
+                'p99': percentile(values, 99) * 1000,
+            })
+        return rows
+
+
+class LoadTestError(Exception):
+    """A simulated client could not carry on with its game"""
+
+
+class AsyncHTTPClient:
+    """
+    A small HTTP/1.1 client on asyncio streams, standing in for one browser:
+    a single keep-alive connection, a cookie jar, and Django's CSRF header
+    on unsafe requests. Thousands of them fit in one event loop.
+    """
+
+    def __init__(self, base_url, stats, timeout=30.0):
+        parts = urlsplit(base_url)
+        self.secure = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.prefix = parts.path.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = {}
+        self._reader = None
+        self._writer = None
+
+    async def close(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def request(self, method, path, endpoint, data=None, headers=None, expect=(200,)):
+        """
+        Send a request and return (status, headers, JSON body or None). The
+        latency is recorded under ``endpoint``; a status outside ``expect``
+        is recorded as an error and raises LoadTestError.
+        """
+        body = json.dumps(data).encode() if data is not None else b''
+        content_type = 'application/json' if data is not None else None
+        raw = self._request_head(method, path, body, content_type, headers=headers) + body
+
+        started = time.perf_counter()
+        try:
+            status, response_headers, content = await asyncio.wait_for(self._exchange(raw), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            await self.close()
+            self.stats.record(endpoint, time.perf_counter() - started, False)
+            raise LoadTestError(f'{endpoint} failed: {e!r}')
+        self.stats.record(endpoint, time.perf_counter() - started, status in expect)
+
+        for name, value in response_headers:
+            if name == 'set-cookie':
+                self._store_cookie(value)
+        fields = dict(response_headers)
+        payload = json.loads(content) if content and 'json' in fields.get('content-type', '') else None
+        if status not in expect:
+            raise LoadTestError(f'{endpoint} answered {status}: {payload or content[:200]!r}')
+        return status, fields, payload
+
+    def _store_cookie(self, header):
+        cookie = SimpleCookie()
+        cookie.load(header)
+        for name, morsel in cookie.items():
+            if morsel['max-age'] == '0' or not morsel.value:
+                self.cookies.pop(name, None)
+            else:
+                self.cookies[name] = morsel.value
+
+    async def _exchange(self, raw):
+        while True:
+            reused = self._writer is not None
+            if not reused:
+                self._reader, self._writer = await asyncio.open_connection(
+                    self.host, self.port, ssl=self.secure or None
+                )
+            try:
+                self._writer.write(raw)
+                await self._writer.drain()
+                return await self._read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                # An idle keep-alive connection the server already closed; the
+                # request never reached it, so send it again on a new one
+                if not reused:
+                    raise
+
+    def _request_head(self, method, path, body=b'', content_type=None, accept='application/json', headers=None):
+        lines = [
+            f'{method} {self.prefix}{path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            f'Accept: {accept}',
+            f'Content-Length: {len(body)}',
+        ]
+        if content_type is not None:
+            lines.append(f'Content-Type: {content_type}')
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{name}={value}' for name, value in self.cookies.items()))
+        if method not in ('GET', 'HEAD') and 'csrftoken' in self.cookies:
+            lines.append(f"X-CSRFToken: {self.cookies['csrftoken']}")
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    @staticmethod
+    async def _read_head(reader):
+        """The status line and headers of a response: (HTTP version, status, [(lowercase name, value)])"""
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        version, status, *_ = status_line.decode('latin-1').split(' ', 2)
+
+        headers = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip().lower(), value.strip()))
+        return version, int(status), headers
+
+    async def _read_response(self):
+        version, status, headers = await self._read_head(self._reader)
+        fields = dict(headers)
+
+        keep_alive = version == 'HTTP/1.1' and fields.get('connection', '').lower() != 'close'
+        if status in (204, 304) or 100 <= status < 200:
+            content = b''
+        elif fields.get('transfer-encoding', '').lower() == 'chunked':
+            content = await self._read_chunked()
+        elif 'content-length' in fields:
+            content = await self._reader.readexactly(int(fields['content-length']))
+        else:
+            content = await self._reader.read()
+            keep_alive = False
+
+        if not keep_alive:
+            await self.close()
+        return status, headers, content
+
+    async def events(self, path, endpoint):
+        """
+        Follow a Server-Sent Events stream on a connection of its own, so
+        the client's other requests go on alongside it: yields each event's
+        JSON data, and None for a keep-alive comment, until the server ends
+        the stream. The time to the response headers is recorded under
+        ``endpoint``; a failed stream raises LoadTestError.
+        """
+        started = time.perf_counter()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.secure or None), self.timeout
+            )
+            writer.write(self._request_head('GET', path, accept='text/event-stream'))
+            await writer.drain()
+            _, status, headers = await asyncio.wait_for(self._read_head(reader), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            if writer is not None:
+                writer.close()
+            self.stats.record(endpoint, time.perf_counter() - started, False)
+            raise LoadTestError(f'{endpoint} failed: {e!r}')
+        self.stats.record(endpoint, time.perf_counter() - started, status == 200)
+
+        try:
+            if status != 200:
+                raise LoadTestError(f'{endpoint} answered {status}')
+            chunked = dict(headers).get('transfer-encoding', '').lower() == 'chunked'
+            data = []
+            async for line in self._stream_lines(reader, chunked):
+                if line.startswith(':'):
+                    yield None
+                elif line.startswith('data:'):
+                    data.append(line[len('data:'):].strip())
+                elif not line and data:
+                    yield json.loads('\n'.join(data))
+                    data = []
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            raise LoadTestError(f'{endpoint} broke off: {e!r}')
+        finally:
+            writer.close()
+
+    async def _stream_lines(self, reader, chunked):
+        """The decoded lines of a streamed body, read as they arrive"""
+        buffer = b''
+        while True:
+            if chunked:
+                size = int((await asyncio.wait_for(reader.readline(), self.timeout)).split(b';')[0], 16)
+                if size == 0:
+                    return
+                buffer += await asyncio.wait_for(reader.readexactly(size + 2), self.timeout)
+                buffer = buffer[:-2]
+            else:
+                chunk = await asyncio.wait_for(reader.read(65536), self.timeout)
+                if not chunk:
+                    return
+                buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                yield line.rstrip(b'\r').decode()
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self._reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # Skip any trailers up to the closing blank line
+                while (await self._reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self._reader.readexactly(size))
+            await self._reader.readline()
+
+
+@dataclass
+class LoadTestConfig:
+    base_url: str = 'http://127.0.0.1:8000'
+    hosts: int = 1
+    players: int = 10
+    questions: int = 5
+    # 'poll' (If-None-Match every poll_interval), 'long-poll' (?since=<version>)
+    # or 'sse' (the Server-Sent Events streams: the session's for hosts, their own for players)
+    mode: str = 'poll'
+    poll_interval: float = 1.0
+    think_time: float = 2.0
+    topic: str = 'General knowledge'
+    timeout: float = 30.0
+    generation_timeout: float = 120.0
+    question_timeout: float = 60.0
+
+
+class LoadTest:
+    """
+    Plays ``hosts`` complete games at once against a running server, each
+    with ``players`` players: the host registers, logs in, generates a quiz
+    with create_with_ai, opens a session and runs it question by question
+    while its players join, watch the game state and answer.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.stats = LatencyStats()
+        self.run_id = f'{int(time.time())}{random.randrange(1000):03d}'
+        self.rooms_completed = 0
+
+    def client(self):
+        return AsyncHTTPClient(self.config.base_url, self.stats, timeout=self.config.timeout)
+
+    async def run(self):
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self.run_room(room) for room in range(self.config.hosts)), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        failures = [f'room {room}: {result}' for room, result in enumerate(results) if isinstance(result, Exception)]
+        for failure in failures:
+            logger.warning(f"Load test {failure}")
+        return {
+            'rooms': self.config.hosts,
+            'rooms_completed': self.rooms_completed,
+            'players': self.config.hosts * self.config.players,
+            'elapsed': elapsed,
+            'requests': self.stats.requests,
+            'throughput': self.stats.requests / elapsed if elapsed else 0.0,
+            'endpoints': self.stats.report(elapsed),
+            'failures': failures,
+        }
+
+    async def run_room(self, room):
+        host = self.client()
+        players = [self.client() for _ in range(self.config.players)]
+        try:
+            quiz = await self.create_quiz(host, room)
+            _, _, session = await host.request(
+                'POST', f"/api/quizzes/{quiz['id']}/start_session/", 'POST /api/quizzes/{id}/start_session/',
+                expect=(201,)
+            )
+            player_ids = await asyncio.gather(*(
+                self.join(client, quiz['join_code'], f'player{idx}') for idx, client in enumerate(players)
+            ))
+            await host.request(
+                'POST', f"/api/sessions/{session['id']}/start_game/", 'POST /api/sessions/{id}/start_game/'
+            )
+            await asyncio.gather(
+                self.host_game(host, session['id']),
+                *(self.play(client, session['id'], player_id) for client, player_id in zip(players, player_ids))
+            )
+            self.rooms_completed += 1
+        finally:
+            await asyncio.gather(*(client.close() for client in [host, *players]))
+
+    async def create_quiz(self, host, room):
+        """Register and log in the room's host, then generate its quiz; returns the quiz"""
+        username = f'load-{self.run_id}-{room}'
+        credentials = {'username': username, 'password': f'{username}-password'}
+        await host.request(
+            'POST', '/api/auth/register/', 'POST /api/auth/register/',
+            dict(credentials, email=f'{username}@example.com'), expect=(201,)
+        )
+        await host.request('POST', '/api/auth/login/', 'POST /api/auth/login/', credentials)
+        await host.request('GET', '/api/auth/csrf/', 'GET /api/auth/csrf/')
+
+        _, _, job = await host.request('POST', '/api/quizzes/create_with_ai/', 'POST /api/quizzes/create_with_ai/', {
+            'title': f'Load test room {room}',
+            'topic': self.config.topic,
+            'difficulty': 'medium',
+            'num_questions': self.config.questions,
+        }, expect=(202,))
+
+        deadline = time.monotonic() + self.config.generation_timeout
+        while time.monotonic() < deadline:
+            _, _, job = await host.request(
+                'GET', f"/api/quizzes/{job['quiz_id']}/generation_status/", 'GET /api/quizzes/{id}/generation_status/'
+            )
+            if job['status'] == 'completed':
+                return job['quiz']
+            if job['status'] == 'failed':
+                raise LoadTestError(f"Quiz generation failed: {job['error']}")
+            await asyncio.sleep(GENERATION_POLL_INTERVAL)
+        raise LoadTestError('Quiz generation timed out')
+
+    async def join(self, client, join_code, nickname):
+        _, _, joined = await client.request(
+            'POST', '/api/sessions/join/', 'POST /api/sessions/join/',
+            {'join_code': join_code, 'nickname': nickname}, expect=(201,)
+        )
+        return joined['player']['id']
+
+    async def watch(self, client, session_id, player_id=None):
+        """
+        Yield the session's game state whenever it changes, and None when a
+        poll found nothing new (or a stream was only kept alive), until the
+        client stops iterating. Players streaming follow their own compact
+        state, as the play page does.
+        """
+        if self.config.mode == 'sse':
+            if player_id is None:
+                stream = client.events(f'/api/sessions/{session_id}/events/', 'GET /api/sessions/{id}/events/')
+            else:
+                stream = client.events(f'/api/players/{player_id}/events/', 'GET /api/players/{id}/events/')
+            async for state in stream:
+                yield state
+            # Clients stop iterating at the finished state, the stream's last
+            raise LoadTestError('The event stream ended before the game finished')
+
+        path = f'/api/sessions/{session_id}/game_state/'
+        etag = None
+        version = None
+        while True:
+            if self.config.mode == 'long-poll' and version is not None:
+                status, headers, state = await client.request(
+                    'GET', f'{path}?since={version}', 'GET /api/sessions/{id}/game_state/?since', expect=(200, 304)
+                )
+            else:
+                status, headers, state = await client.request(
+                    'GET', path, 'GET /api/sessions/{id}/game_state/',
+                    headers={'If-None-Match': etag} if etag else None, expect=(200, 304)
+                )
+
+            if status == 200:
+                etag = headers.get('etag')
+                version = state['state_version']
+                yield state
+            else:
+                yield None
+            if self.config.mode != 'long-poll':
+                await asyncio.sleep(self.config.poll_interval)
+
+    async def play(self, client, session_id, player_id):
+        answered = set()
+        async for state in self.watch(client, session_id, player_id):
+            if state is None:
+                continue
+            if state['status'] == 'finished':
+                return
+            question = state.get('current_question')
+            if not question or question['id'] in answered:
+                continue
+
+            answered.add(question['id'])
+            think = random.uniform(0, self.config.think_time)
+            await asyncio.sleep(think)
+            if random.random() < CORRECT_ANSWER_RATE:
+                answer = question['correct_answer']
+            else:
+                answer = random.choice(question['wrong_answers'])
+            await client.request(
+                'POST', f'/api/players/{player_id}/submit_answer/', 'POST /api/players/{id}/submit_answer/',
+                {'question_id': question['id'], 'selected_answer': answer, 'time_taken': think}
+            )
+
+    async def host_game(self, host, session_id):
+        """Move on once every player answered, or after question_timeout"""
+        index = None
+        advanced_from = None
+        question_deadline = None
+        async for state in self.watch(host, session_id):
+            if state is not None:
+                if state['status'] == 'finished':
+                    return
+                if state['status'] != 'active':
+                    continue
+                if state['current_question_index'] != index:
+                    index = state['current_question_index']
+                    question_deadline = time.monotonic() + self.config.question_timeout
+                everyone_answered = state['responses_received'] >= state['player_count']
+            else:
+                everyone_answered = False
+
+            timed_out = question_deadline is not None and time.monotonic() >= question_deadline
+            if index is None or index == advanced_from or not (everyone_answered or timed_out):
+                continue
+
+            advanced_from = index
+            _, _, result = await host.request(
+                'POST', f'/api/sessions/{session_id}/next_question/', 'POST /api/sessions/{id}/next_question/'
+            )
+            if result.get('status') == 'Quiz completed':
+                return
+
+
+def run_load_test(config):
+    return asyncio.run(LoadTest(config).run())
+
+
+_WORD_PARTS = ('bcdfgklmnprstvz', 'aeiou')
+
+
+def _made_up_words(rng, count):
+    return ' '.join(
+        ''.join(rng.choice(_WORD_PARTS[0]) + rng.choice(_WORD_PARTS[1]) for _ in range(rng.randint(2, 4)))
+        for _ in range(count)
+    )
+
+
+class AIStandIn:
+    """
+    A local OpenAI-style chat completions endpoint that makes up questions
+    after ``latency`` seconds, so load tests exercise create_with_ai
+    without OpenRouter. Serves plain and streamed (SSE) completions; point
+    the server at it with OPENROUTER_API_URL.
+    """
+
+    def __init__(self, port=0, latency=0.0):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                time.sleep(stand_in.latency)
+                content = json.dumps(stand_in.questions(request['messages'][-1]['content']))
+                try:
+                    if request.get('stream'):
+                        self.send_response(200)
+                        self.send_header('Content-Type', 'text/event-stream')
+                        self.end_headers()
+                        for start in range(0, len(content), 64):
+                            chunk = {'choices': [{'delta': {'content': content[start:start + 64]}}]}
+                            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+                        self.wfile.write(b'data: [DONE]\n\n')
+                    else:
+                        body = json.dumps({'choices': [{'message': {'content': content}}]}).encode()
+                        self.send_response(200)
+                        self.send_header('Content-Type', 'application/json')
+                        self.send_header('Content-Length', str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.latency = latency
+        self.requests = 0
+        self._rng = random.Random()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}/v1/chat/completions'
+
+    def questions(self, prompt):
+        """As many made-up questions as the prompt asks for"""
+        match = re.search(r'Create exactly (\d+)', prompt)
+        count = int(match.group(1)) if match else 5
+        with self._lock:
+            self.requests += 1
+            return [
+                {
+                    'question': f'{_made_up_words(self._rng, 6).capitalize()}?',
+                    'correct_answer': _made_up_words(self._rng, 2),
+                    'wrong_answers': [_made_up_words(self._rng, 2) for _ in range(3)],
+                }
+                for _ in range(count)
+            ]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
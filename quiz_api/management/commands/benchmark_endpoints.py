@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz_api.benchmarks import (
+    BASELINE_PATH, DEFAULT_REPEAT, DEFAULT_SIZES, ENDPOINTS, compare, load_baseline, run_benchmarks, save_baseline
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure queries and median latency of the game endpoints for rooms of 10, 100 and 1000 players '
+        'and fail on regressions against the JSON baseline (all changes are rolled back)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Players per room')
+        parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Timed requests per endpoint')
+        parser.add_argument(
+            '--endpoints', nargs='+', choices=[name for name, _, _ in ENDPOINTS], help='Only these endpoints'
+        )
+        parser.add_argument('--baseline', default=str(BASELINE_PATH), help='Baseline JSON file')
+        parser.add_argument(
+            '--update-baseline', action='store_true', help='Write the results to the baseline instead of comparing'
+        )
+        parser.add_argument('--query-tolerance', type=int, default=0, help='Extra queries allowed per request')
+        parser.add_argument(
+            '--latency-tolerance', type=float, default=0.5,
+            help='Allowed median latency growth as a fraction of the baseline (latency is machine dependent)'
+        )
+        parser.add_argument('--no-latency', action='store_true', help='Only compare query counts')
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(options['sizes'], options['repeat'], options['endpoints'])
+        baseline = load_baseline(options['baseline'])
+
+        self.stdout.write(f"{'endpoint':<18} {'players':>8} {'queries':>8} {'median ms':>10} {'baseline':>16}")
+        for size, endpoints in results.items():
+            for name, measured in endpoints.items():
+                expected = baseline.get(size, {}).get(name)
+                reference = f"{expected['queries']} / {expected['median_ms']:.1f}" if expected else '-'
+                self.stdout.write(
+                    f"{name:<18} {size:>8} {measured['queries']:>8} {measured['median_ms']:>10.1f} {reference:>16}"
+                )
+
+        if options['update_baseline']:
+            for size, endpoints in results.items():
+                baseline.setdefault(size, {}).update(endpoints)
+            save_baseline(baseline, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"💾 Baseline written to {options['baseline']}"))
+            return
+
+        regressions = compare(
+            results, baseline,
+            query_tolerance=options['query_tolerance'],
+            latency_tolerance=None if options['no_latency'] else options['latency_tolerance'],
+        )
+        if regressions:
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f'  {regression}'))
+            raise CommandError(f'{len(regressions)} benchmark regression(s)')
+        self.stdout.write(self.style.SUCCESS('✅ No regressions against the baseline'))
@@ -0,0 +1,71 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from quiz_api.join_codes import CODE_SPACE, code_for_index
+from quiz_api.models import Quiz, generate_join_code
+
+User = get_user_model()
+
+# Filler quizzes per bulk INSERT (SQLite caps the parameters of one statement)
+FILL_BATCH = 50
+
+
+class Command(BaseCommand):
+    help = 'Measure join code allocation rate as the quiz table grows (all changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+            help='Quiz table sizes to measure at'
+        )
+        parser.add_argument(
+            '--sample', type=int, default=200,
+            help='Quizzes created at each size'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'quizzes':>10} {'creates/s':>10} {'queries':>8} {'probe codes/s':>14}")
+        with transaction.atomic():
+            host = User.objects.create_user(username='join-code-benchmark', password='benchmark')
+            filled = 0
+            for size in sorted(options['sizes']):
+                filled = self._fill(host, filled, size - Quiz.objects.count())
+                rate, queries = self._measure(host, options['sample'])
+                probe_rate = self._measure_probe(options['sample'])
+                self.stdout.write(f"{Quiz.objects.count():>10} {rate:>10.0f} {queries:>8.1f} {probe_rate:>14.0f}")
+            transaction.set_rollback(True)
+
+    def _fill(self, host, filled, count):
+        """Bulk insert filler quizzes, coded from the far end of the shuffled space"""
+        while count > 0:
+            batch = min(count, FILL_BATCH)
+            Quiz.objects.bulk_create([
+                Quiz(host=host, title='Filler', topic='filler', join_code=code_for_index(CODE_SPACE - 1 - idx))
+                for idx in range(filled, filled + batch)
+            ])
+            filled += batch
+            count -= batch
+        return filled
+
+    def _measure(self, host, sample):
+        """(quizzes created per second, queries per quiz) through the allocator"""
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(sample):
+                Quiz.objects.create(host=host, title='Benchmark', topic='benchmark')
+            elapsed = time.perf_counter() - started
+        return sample / elapsed, len(queries) / sample
+
+    def _measure_probe(self, sample):
+        """Codes per second of the old draw-and-probe loop, for comparison"""
+        started = time.perf_counter()
+        for _ in range(sample):
+            while True:
+                code = generate_join_code()
+                if not Quiz.objects.filter(join_code=code).exists():
+                    break
+        return sample / (time.perf_counter() - started)
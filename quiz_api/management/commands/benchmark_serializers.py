@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz_api.benchmarks import DEFAULT_SIZES, run_serialization_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the CPU time of the serializer-based and .values()-based session snapshot and final scores, '
+        'and of the stock and orjson JSON renderers (all changes are rolled back)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Players per room')
+        parser.add_argument('--repeat', type=int, default=20, help='Calls timed per measurement')
+
+    def handle(self, *args, **options):
+        results = run_serialization_benchmarks(options['sizes'], options['repeat'])
+
+        self.stdout.write(f"{'part':<14} {'players':>8} {'old ms':>9} {'new ms':>9} {'saved ms':>9} {'speedup':>8}")
+        mismatches = []
+        for size, parts in results.items():
+            for part, measured in parts.items():
+                saved = measured['old_ms'] - measured['new_ms']
+                speedup = measured['old_ms'] / measured['new_ms'] if measured['new_ms'] else float('inf')
+                self.stdout.write(
+                    f"{part:<14} {size:>8} {measured['old_ms']:>9.3f} {measured['new_ms']:>9.3f} "
+                    f"{saved:>9.3f} {speedup:>7.1f}x"
+                )
+                if not measured['identical']:
+                    mismatches.append(f'{part} with {size} players')
+
+        if mismatches:
+            raise CommandError(f"Output differs from the old path: {', '.join(mismatches)}")
+        self.stdout.write(self.style.SUCCESS('✅ Same JSON bytes as the old path'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from quiz_api.benchmarks import run_delta_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the bytes a polling client receives as full game states and as ?delta_since= deltas '
+        'while a room answers two questions (all changes are rolled back)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[500], help='Players per room')
+        parser.add_argument('--batch', type=int, default=10, help='Answers between two polls')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'players':>8} {'polls':>6} {'full KB':>10} {'delta KB':>10} {'saved':>7}")
+        for size in options['sizes']:
+            result = run_delta_benchmarks(size, options['batch'])
+            self.stdout.write(
+                f"{result['players']:>8} {result['polls']:>6} {result['full_bytes'] / 1024:>10.1f} "
+                f"{result['delta_bytes'] / 1024:>10.1f} {result['saved']:>7.1%}"
+            )
@@ -0,0 +1,86 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz_api.loadgen import AIStandIn, LoadTestConfig, run_load_test
+
+
+class Command(BaseCommand):
+    help = 'Simulate hosts and players playing full games against a running server and report latency per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Server to load')
+        parser.add_argument('--hosts', type=int, default=1, help='Concurrent games (one host each)')
+        parser.add_argument('--players', type=int, default=10, help='Players per game')
+        parser.add_argument('--questions', type=int, default=5, help='Questions per quiz')
+        parser.add_argument(
+            '--mode', choices=['poll', 'long-poll', 'sse'], default='poll',
+            help='How clients follow the game: ETag polling, ?since= long polling or the Server-Sent Events stream'
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls')
+        parser.add_argument('--think-time', type=float, default=2.0, help='Longest a player takes to answer')
+        parser.add_argument('--topic', default='General knowledge')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout')
+        parser.add_argument(
+            '--ai-stand-in', type=int, metavar='PORT',
+            help='Serve made-up completions on this port; run the server with '
+                 'OPENROUTER_API_URL=http://127.0.0.1:PORT/v1/chat/completions'
+        )
+        parser.add_argument('--ai-latency', type=float, default=0.0, help='Seconds the stand-in takes per completion')
+        parser.add_argument('--json', metavar='PATH', help='Also write the report to this file')
+
+    def handle(self, *args, **options):
+        config = LoadTestConfig(
+            base_url=options['base_url'],
+            hosts=options['hosts'],
+            players=options['players'],
+            questions=options['questions'],
+            mode=options['mode'],
+            poll_interval=options['poll_interval'],
+            think_time=options['think_time'],
+            topic=options['topic'],
+            timeout=options['timeout'],
+        )
+
+        stand_in = None
+        if options['ai_stand_in'] is not None:
+            stand_in = AIStandIn(port=options['ai_stand_in'], latency=options['ai_latency']).start()
+            self.stdout.write(f'🤖 AI stand-in listening on {stand_in.url}')
+
+        self.stdout.write(
+            f'🚀 {config.hosts} game(s) x {config.players} player(s), {config.questions} question(s), '
+            f'{config.mode} against {config.base_url}'
+        )
+        try:
+            report = run_load_test(config)
+        finally:
+            if stand_in is not None:
+                stand_in.stop()
+
+        self.stdout.write(
+            f"{'endpoint':<45} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for row in report['endpoints']:
+            self.stdout.write(
+                f"{row['endpoint']:<45} {row['requests']:>8} {row['errors']:>6} {row['throughput']:>8.1f} "
+                f"{row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f}"
+            )
+
+        summary = (
+            f"🏁 {report['rooms_completed']}/{report['rooms']} games with {report['players']} players finished in "
+            f"{report['elapsed']:.1f}s: {report['requests']} requests, {report['throughput']:.1f} req/s"
+        )
+        if report['failures']:
+            self.stdout.write(self.style.WARNING(summary))
+            for failure in report['failures']:
+                self.stdout.write(self.style.ERROR(f'  {failure}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        unfinished = report['rooms'] - report['rooms_completed']
+        if report['failures'] or unfinished:
+            raise CommandError(f"{unfinished} of {report['rooms']} games did not finish")
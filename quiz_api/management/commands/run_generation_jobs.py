@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from quiz_api.jobs import GenerationJobRunner
+
+
+class Command(BaseCommand):
+    help = 'Generate the questions of pending AI quiz generation jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait for new jobs once the queue is empty'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit after draining the jobs pending right now'
+        )
+
+    def handle(self, *args, **options):
+        runner = GenerationJobRunner()
+        if options['once']:
+            count = runner.drain()
+            self.stdout.write(self.style.SUCCESS(f'🤖 Ran {count} generation job(s)'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('🤖 Generation worker running, press Ctrl+C to stop'))
+        try:
+            runner.run_forever(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Generation worker stopped')
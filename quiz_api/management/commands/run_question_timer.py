@@ -0,0 +1,29 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from quiz_api.timers import RESCAN_SECONDS, QuestionTimerScheduler
+
+
+class Command(BaseCommand):
+    help = 'Auto-advance game sessions whose current question has run out of time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rescan-interval', type=float, default=RESCAN_SECONDS,
+            help='Seconds between scans for newly started questions'
+        )
+
+    def handle(self, *args, **options):
+        if settings.GAME_STATE_STORE == 'memory':
+            self.stderr.write(self.style.WARNING(
+                "GAME_STATE_STORE is 'memory': web workers won't see advances made by this "
+                "process. Use the redis store, or the in-process timer (QUESTION_TIMER_IN_PROCESS)."
+            ))
+
+        self.stdout.write(self.style.SUCCESS('⏱️ Question timer running, press Ctrl+C to stop'))
+        try:
+            asyncio.run(QuestionTimerScheduler(rescan_interval=options['rescan_interval']).run())
+        except KeyboardInterrupt:
+            self.stdout.write('Question timer stopped')
@@ -0,0 +1,167 @@
+import csv
+import json
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Quiz, Question
+
+logger = logging.getLogger(__name__)
+
+# Rows per bulk INSERT
+BATCH_SIZE = 500
+
+# Row errors kept for an import's response; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+CSV_FIELDS = ['question', 'correct_answer', 'wrong_answer_1', 'wrong_answer_2', 'wrong_answer_3', 'time_limit']
+
+
+def question_from_data(quiz, data, order):
+    """
+    An unsaved Question from a generated or imported question dict.
+    Raises ValueError when the data doesn't describe a valid question.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Question must be an object')
+
+    text = str(data.get('question') or data.get('question_text') or '').strip()
+    correct_answer = str(data.get('correct_answer') or '').strip()
+    wrong_answers = data.get('wrong_answers')
+    if not text or not correct_answer:
+        raise ValueError('Question needs question and correct_answer')
+    if not isinstance(wrong_answers, list) or len(wrong_answers) != 3:
+        raise ValueError('Question needs exactly 3 wrong_answers')
+    wrong_answers = [str(answer).strip() for answer in wrong_answers]
+    if not all(wrong_answers):
+        raise ValueError('Wrong answers must not be empty')
+
+    question = Question(
+        quiz=quiz,
+        question_text=text,
+        correct_answer=correct_answer,
+        wrong_answers=wrong_answers,
+        order=order
+    )
+    if data.get('time_limit') not in (None, ''):
+        try:
+            question.time_limit = int(data['time_limit'])
+        except (TypeError, ValueError):
+            raise ValueError('time_limit must be a whole number of seconds')
+        if question.time_limit <= 0:
+            raise ValueError('time_limit must be positive')
+    return question
+
+
+class QuestionWriter:
+    """
+    Appends questions to a quiz with batched ``bulk_create`` INSERTs.
+
+    Rows are buffered until ``batch_size`` of them are waiting, or, with
+    ``max_delay``, until that many seconds have passed since the last write,
+    so slowly produced questions (a streamed completion) still show up
+    promptly while bursts are written together. ``on_flush(count)`` is
+    called after every write. Only the current batch is held in memory.
+    """
+
+    def __init__(self, quiz, batch_size=BATCH_SIZE, max_delay=None, on_flush=None, start_order=0):
+        self.quiz = quiz
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.on_flush = on_flush
+        self.next_order = start_order
+        self.count = 0
+        self._pending = []
+        self._flushed_at = None
+
+    @classmethod
+    def appending_to(cls, quiz, **kwargs):
+        """A writer that orders new questions after the quiz's existing ones"""
+        last = quiz.questions.aggregate(last=Max('order'))['last']
+        return cls(quiz, start_order=0 if last is None else last + 1, **kwargs)
+
+    def add(self, data):
+        """Buffer a question dict; raises ValueError (and skips it) when invalid"""
+        self._pending.append(question_from_data(self.quiz, data, self.next_order))
+        self.next_order += 1
+
+        due = len(self._pending) >= self.batch_size
+        if self.max_delay is not None:
+            due = due or self._flushed_at is None or time.monotonic() - self._flushed_at >= self.max_delay
+        if due:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        Question.objects.bulk_create(self._pending, batch_size=self.batch_size)
+        self.count += len(self._pending)
+        self._pending = []
+        self._flushed_at = time.monotonic()
+        if self.on_flush is not None:
+            self.on_flush(self.count)
+
+
+def materialize_quiz(host, title, topic, difficulty, questions, batch_size=BATCH_SIZE):
+    """Create a quiz and all its questions in one transaction, a batch per INSERT"""
+    with transaction.atomic():
+        quiz = Quiz.objects.create(host=host, title=title, topic=topic, difficulty=difficulty)
+        writer = QuestionWriter(quiz, batch_size=batch_size)
+        for data in questions:
+            writer.add(data)
+        writer.flush()
+    logger.info(f"📦 Materialized quiz {quiz.id} with {writer.count} questions")
+    return quiz
+
+
+def iter_ndjson(lines):
+    """(line number, question dict or ValueError) for each non-blank NDJSON line"""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, ValueError(f'Invalid JSON: {e.msg}')
+
+
+def iter_csv(lines):
+    """(line number, question dict) for each CSV row, using the CSV_FIELDS header"""
+    reader = csv.DictReader(line.decode('utf-8') if isinstance(line, bytes) else line for line in lines)
+    for row in reader:
+        wrong_answers = [row.get(f'wrong_answer_{idx}') for idx in (1, 2, 3)]
+        yield reader.line_num, {
+            'question': row.get('question'),
+            'correct_answer': row.get('correct_answer'),
+            'wrong_answers': [answer for answer in wrong_answers if answer],
+            'time_limit': row.get('time_limit'),
+        }
+
+
+def import_questions(quiz, rows, batch_size=BATCH_SIZE):
+    """
+    Append parsed rows (from ``iter_ndjson``/``iter_csv``) to a quiz in one
+    transaction. Invalid rows are skipped and reported; memory use stays
+    flat however many rows there are.
+    """
+    errors = []
+    skipped = 0
+    with transaction.atomic():
+        writer = QuestionWriter.appending_to(quiz, batch_size=batch_size)
+        for number, data in rows:
+            try:
+                if isinstance(data, ValueError):
+                    raise data
+                writer.add(data)
+            except ValueError as e:
+                skipped += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'line': number, 'error': str(e)})
+        writer.flush()
+
+    logger.info(f"📥 Imported {writer.count} questions into quiz {quiz.id} ({skipped} skipped)")
+    return {'imported': writer.count, 'skipped': skipped, 'errors': errors}
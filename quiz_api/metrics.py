@@ -0,0 +1,311 @@
+import atexit
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+GENERATION_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'quiz_http_requests_total': ('counter', 'Requests by route, action, method and status', None),
+    'quiz_http_request_duration_seconds': (
+        'histogram', 'Time to the response (to the headers for streams)', LATENCY_BUCKETS
+    ),
+    'quiz_http_db_queries_total': ('counter', 'Database queries run by requests', None),
+    'quiz_http_db_query_duration_seconds_total': ('counter', 'Time requests spent in database queries', None),
+    'quiz_http_response_bytes_total': ('counter', 'Response body bytes (streams not included)', None),
+    'quiz_ai_generations_total': ('counter', 'Question generations by outcome: ai, cached, fallback or failed', None),
+    'quiz_ai_generation_duration_seconds': ('histogram', 'Question generation time by outcome', GENERATION_BUCKETS),
+    'quiz_active_sessions': ('gauge', 'Game sessions waiting or active', None),
+    'quiz_active_players': ('gauge', 'Active players in waiting or active sessions', None),
+}
+
+# The queries and query time of the request being handled
+_request_db = contextvars.ContextVar('quiz_request_db', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms of this process, merged with every other
+    worker's at scrape time.
+
+    Samples are kept in memory. With a ``directory`` (one shared by all
+    gunicorn workers), each process also writes its samples to its own
+    file at most every ``flush_interval`` seconds and at exit, replacing
+    the file atomically, and ``collect`` sums the files of all processes.
+    Files of exited workers are kept so their counts never go backwards;
+    empty the directory before (re)starting the server.
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory or None
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Threads flushing at once would write the same temporary file
+        self._flush_lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = 0.0
+        self._path = None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._path = os.path.join(self.directory, f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+            atexit.register(self.flush)
+
+    def inc(self, name, labels, amount=1):
+        key = format_labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+        self._maybe_flush()
+
+    def observe(self, name, labels, value):
+        """Add ``value`` to a histogram: per-bucket counts (the last one +Inf), sum and count"""
+        buckets = METRICS[name][2]
+        key = format_labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+            index = next((idx for idx, bound in enumerate(buckets) if value <= bound), len(buckets))
+            histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+        self._maybe_flush()
+
+    def samples(self):
+        with self._lock:
+            return json.loads(json.dumps({'counters': self._counters, 'histograms': self._histograms}))
+
+    def _maybe_flush(self):
+        if self._path is not None and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._path is None:
+            return
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            temp_path = f'{self._path}.tmp'
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump(self.samples(), f)
+                os.replace(temp_path, self._path)
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {self._path}: {str(e)}")
+
+    def collect(self):
+        """Samples of every process (just this one without a directory)"""
+        if self._path is None:
+            return self.samples()
+        self.flush()
+        merged = {'counters': {}, 'histograms': {}}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    samples = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics file {path}: {str(e)}")
+                continue
+            for name, series in samples.get('counters', {}).items():
+                target = merged['counters'].setdefault(name, {})
+                for key, value in series.items():
+                    target[key] = target.get(key, 0) + value
+            for name, series in samples.get('histograms', {}).items():
+                target = merged['histograms'].setdefault(name, {})
+                for key, histogram in series.items():
+                    if key not in target:
+                        target[key] = histogram
+                        continue
+                    total = target[key]
+                    total['buckets'] = [a + b for a, b in zip(total['buckets'], histogram['buckets'])]
+                    total['sum'] += histogram['sum']
+                    total['count'] += histogram['count']
+        return merged
+
+    def close(self):
+        """Write this process's samples one last time"""
+        if self._path is not None:
+            self.flush()
+            atexit.unregister(self.flush)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def render(samples, gauges=None):
+    """Samples (see ``MetricsRegistry.collect``) and {name: value} gauges in the Prometheus text format"""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        if kind == 'gauge':
+            if gauges is None or name not in gauges:
+                continue
+            series = {'': gauges[name]}
+        elif kind == 'counter':
+            series = samples['counters'].get(name)
+        else:
+            series = samples['histograms'].get(name)
+        if not series:
+            continue
+
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key in sorted(series):
+            if kind != 'histogram':
+                lines.append(f'{name}{{{key}}} {_format_value(series[key])}' if key else f'{name} {series[key]}')
+                continue
+            histogram = series[key]
+            prefix = f'{key},' if key else ''
+            cumulative = 0
+            for bound, count in zip((*buckets, float('inf')), histogram['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{prefix}le="{_format_value(bound)}"}} {cumulative}')
+            labels = f'{{{key}}}' if key else ''
+            lines.append(f'{name}_sum{labels} {_format_value(float(histogram["sum"]))}')
+            lines.append(f'{name}_count{labels} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry(directory=settings.METRICS_DIR)
+    return _metrics
+
+
+@receiver(setting_changed)
+def _reset_metrics(setting, **kwargs):
+    global _metrics
+    if setting == 'METRICS_DIR':
+        _metrics = None
+
+
+def record_ai_generation(outcome, seconds):
+    """Count a question generation: 'ai', 'cached', 'fallback' (sample questions) or 'failed'"""
+    metrics = get_metrics()
+    metrics.inc('quiz_ai_generations_total', {'outcome': outcome})
+    metrics.observe('quiz_ai_generation_duration_seconds', {'outcome': outcome}, seconds)
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _request_db.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def _install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def route_labels(request):
+    """
+    {'route', 'action'} of a resolved request: the URL name and the DRF
+    action (``game_state``, ``submit_answer`` ...) or view function name.
+    Unresolved requests share one label so scanners can't blow up the series.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return {'route': 'unmatched', 'action': 'unmatched'}
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower()) or getattr(match.func, '__name__', '')
+    if not action or action == 'view':
+        action = match.url_name or 'view'
+    return {'route': match.url_name or match.view_name or 'unnamed', 'action': action}
+
+
+class MetricsMiddleware:
+    """Records count, latency, database queries and response size of every request"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started, stats, token = self._begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_db.reset(token)
+        self._record(request, response, started, stats)
+        return response
+
+    async def __acall__(self, request):
+        started, stats, token = self._begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_db.reset(token)
+        self._record(request, response, started, stats)
+        return response
+
+    @staticmethod
+    def _begin():
+        # A list, so queries run in sync_to_async threads add to the same one
+        stats = [0, 0.0]
+        return time.perf_counter(), stats, _request_db.set(stats)
+
+    @staticmethod
+    def _record(request, response, started, stats):
+        elapsed = time.perf_counter() - started
+        labels = route_labels(request)
+        metrics = get_metrics()
+        metrics.inc('quiz_http_requests_total', {
+            **labels, 'method': request.method, 'status': response.status_code
+        })
+        metrics.observe('quiz_http_request_duration_seconds', labels, elapsed)
+        metrics.inc('quiz_http_db_queries_total', labels, stats[0])
+        metrics.inc('quiz_http_db_query_duration_seconds_total', labels, stats[1])
+        if not response.streaming:
+            metrics.inc('quiz_http_response_bytes_total', labels, len(response.content))
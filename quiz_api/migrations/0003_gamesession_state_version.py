@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0002_gamesession_question_started_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='state_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
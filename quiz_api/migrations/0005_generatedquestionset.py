@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0004_quizgenerationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedQuestionSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('variant', models.PositiveIntegerField(default=0)),
+                ('topic', models.CharField(max_length=100)),
+                ('questions', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'unique_together': {('key', 'variant')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0006_bankquestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecycledJoinCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=6, unique=True)),
+                ('available_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='quiz',
+            name='join_code',
+            field=models.CharField(blank=True, default=None, max_length=6, null=True, unique=True),
+        ),
+    ]
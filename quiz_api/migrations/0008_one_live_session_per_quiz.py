@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:41
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def finish_duplicate_live_sessions(apps, schema_editor):
+    """Racing joins could open several live sessions per quiz; keep the oldest"""
+    GameSession = apps.get_model('quiz_api', 'GameSession')
+    seen = set()
+    duplicates = []
+    live = GameSession.objects.filter(status__in=['waiting', 'active']).order_by('quiz_id', 'id')
+    for session_id, quiz_id in live.values_list('id', 'quiz_id'):
+        if quiz_id in seen:
+            duplicates.append(session_id)
+        seen.add(quiz_id)
+    GameSession.objects.filter(id__in=duplicates).update(status='finished', ended_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0007_recycledjoincode'),
+    ]
+
+    operations = [
+        migrations.RunPython(finish_duplicate_live_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='gamesession',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['waiting', 'active'])), fields=('quiz',), name='one_live_session_per_quiz'),
+        ),
+    ]
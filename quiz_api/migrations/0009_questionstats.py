@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0008_one_live_session_per_quiz'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('options', models.JSONField(default=list)),
+                ('responses', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('wrong_1', models.PositiveIntegerField(default=0)),
+                ('wrong_2', models.PositiveIntegerField(default=0)),
+                ('wrong_3', models.PositiveIntegerField(default=0)),
+                ('sum_time_taken', models.FloatField(default=0.0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_stats', to='quiz_api.question')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_stats', to='quiz_api.gamesession')),
+            ],
+            options={
+                'unique_together': {('session', 'question')},
+            },
+        ),
+    ]
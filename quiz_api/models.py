@@ -1,4 +1,9 @@
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.db.models.sql import UpdateQuery
 from django.contrib.auth import get_user_model
 import random
 import string
@@ -7,11 +12,34 @@ User = get_user_model()
 
 
 def generate_join_code():
-    """Generate a unique 6-character join code"""
-    while True:
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-        if not Quiz.objects.filter(join_code=code).exists():
-            return code
+    """A random 6-character join code; uniqueness is left to the unique constraint"""
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+
+
+def update_returning(model, pk, returning, changes, **filters):
+    """
+    ``model.objects.filter(pk=pk, **filters).update(**changes)`` that returns
+    the ``returning`` fields as the UPDATE left the row, or None when no row
+    matched. Uses UPDATE ... RETURNING where the database has it (the ORM has
+    no API for it), elsewhere re-reads the row, which the UPDATE keeps locked
+    until the caller's transaction ends.
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    rows = model._base_manager.using(using).filter(pk=pk, **filters)
+    if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+        query = rows.query.chain(UpdateQuery)
+        query.add_update_values(changes)
+        update_sql, params = query.get_compiler(using).as_sql()
+        columns = [connection.ops.quote_name(model._meta.get_field(field).column) for field in returning]
+        with connection.cursor() as cursor:
+            cursor.execute(f"{update_sql} RETURNING {', '.join(columns)}", params)
+            row = cursor.fetchone()
+        return None if row is None else dict(zip(returning, row))
+
+    if not rows.update(**changes):
+        return None
+    return model._base_manager.using(using).filter(pk=pk).values(*returning).get()
 
 
 class Quiz(models.Model):
@@ -25,7 +53,8 @@ class Quiz(models.Model):
     title = models.CharField(max_length=200)
     topic = models.CharField(max_length=100)
     difficulty = models.CharField(max_length=20, choices=DIFFICULTY_CHOICES, default='medium')
-    join_code = models.CharField(max_length=6, unique=True, default=generate_join_code)
+    # Assigned on save by join_codes.JoinCodeAllocator; None once the quiz is deactivated
+    join_code = models.CharField(max_length=6, unique=True, null=True, blank=True, default=None)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -37,6 +66,27 @@ class Quiz(models.Model):
     def __str__(self):
         return f"{self.title} by {self.host.username}"
 
+    def save(self, *args, **kwargs):
+        if self.join_code is None and self.is_active:
+            if kwargs.get('update_fields') is not None:
+                # The code assigned here has to be written along with the rest
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'join_code'}
+            from .join_codes import get_join_code_allocator
+            get_join_code_allocator().save_with_code(self, super().save, *args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
+    def deactivate(self):
+        """Deactivate the quiz and release its join code for reuse"""
+        from .join_codes import get_join_code_allocator, get_join_code_resolver
+        code, self.join_code = self.join_code, None
+        self.is_active = False
+        with transaction.atomic():
+            self.save()
+            if code:
+                get_join_code_allocator().release(code)
+                transaction.on_commit(lambda: get_join_code_resolver().forget(code))
+
 
 class Question(models.Model):
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='questions')
@@ -70,9 +120,88 @@ class GameSession(models.Model):
     # ADD THIS LINE - NEW FIELD FOR TIMING SYNCHRONIZATION
     question_started_at = models.DateTimeField(null=True, blank=True, help_text='When the current question started')
 
+    # Bumped on every join and question transition; live endpoints serve it plus the
+    # answers given as their ETag (see game_state.served_state_version)
+    state_version = models.PositiveIntegerField(default=0)
+
+    # Players can join a session in these states; a quiz has at most one such session
+    LIVE_STATUSES = ('waiting', 'active')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['quiz'], condition=models.Q(status__in=['waiting', 'active']),
+                name='one_live_session_per_quiz'
+            )
+        ]
+
     def __str__(self):
         return f"Session for {self.quiz.title} - {self.status}"
 
+    @classmethod
+    def bump_state_version(cls, session_id, joinable_only=False):
+        """
+        Record a change to the session's live state in one UPDATE; returns
+        the new version, or None when it did not apply. With ``joinable_only``
+        it only applies while players may join: the session is live and its
+        quiz still active.
+        """
+        filters = {'status__in': cls.LIVE_STATUSES, 'quiz__is_active': True} if joinable_only else {}
+        return cls.update_state(session_id, **filters)
+
+    @classmethod
+    def update_state(cls, session_id, changes=None, **filters):
+        """
+        Apply ``changes`` to the session and bump its state version in one
+        UPDATE, if it matches ``filters``; returns the new version or None
+        """
+        changes = dict(changes or {}, state_version=F('state_version') + 1)
+        row = update_returning(cls, session_id, ('state_version',), changes, **filters)
+        return None if row is None else row['state_version']
+
+    def apply_state(self, changes, **filters):
+        """
+        ``update_state`` of this session; when it applies, the instance gets
+        ``changes`` and the new state version. Returns whether it applied.
+        """
+        version = self.update_state(self.pk, changes, **filters)
+        if version is None:
+            return False
+        for field, value in changes.items():
+            setattr(self, field, value)
+        self.state_version = version
+        return True
+
+    @classmethod
+    def get_or_create_live(cls, quiz_id):
+        """
+        The quiz's waiting or running session, created if it has none, as
+        (session, created). Racing creators are settled by the
+        one_live_session_per_quiz constraint, so there is never a second one.
+        """
+        session = cls.objects.filter(quiz_id=quiz_id, status__in=cls.LIVE_STATUSES).first()
+        if session is not None:
+            return session, False
+        try:
+            with transaction.atomic():
+                return cls.objects.create(quiz_id=quiz_id), True
+        except IntegrityError:
+            return cls.objects.get(quiz_id=quiz_id, status__in=cls.LIVE_STATUSES), False
+
+    def ranked_players(self, active_only=True):
+        """Players in leaderboard order, each annotated with its ``rank`` in one query"""
+        players = self.players.all()
+        if active_only:
+            players = players.filter(is_active=True)
+
+        return players.annotate(
+            rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('is_active')],
+                order_by=[F('score').desc(), F('joined_at').asc()]
+            )
+        ).order_by('-score', 'joined_at')
+
 
 class Player(models.Model):
     session = models.ForeignKey(GameSession, on_delete=models.CASCADE, related_name='players')
@@ -90,6 +219,21 @@ class Player(models.Model):
     def __str__(self):
         return f"{self.nickname} in {self.session}"
 
+    COUNTER_FIELDS = ('score', 'answers_correct', 'answers_wrong')
+
+    @classmethod
+    def add_answer(cls, player_id, score_earned, is_correct):
+        """
+        Add an answer to the player's counters in one UPDATE and return them
+        as it left them, ``{'score', 'answers_correct', 'answers_wrong'}``.
+        An instance loaded earlier in the request may be stale by then,
+        when the same player's answer to another question committed meanwhile.
+        """
+        increments = (score_earned, int(is_correct), int(not is_correct))
+        return update_returning(cls, player_id, cls.COUNTER_FIELDS, {
+            field: F(field) + value for field, value in zip(cls.COUNTER_FIELDS, increments)
+        })
+
 
 class PlayerAnswer(models.Model):
     player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='answers')
@@ -103,4 +247,153 @@ class PlayerAnswer(models.Model):
         unique_together = ['player', 'question']
 
     def __str__(self):
-        return f"{self.player.nickname}'s answer to {self.question}"
\ No newline at end of file
+        return f"{self.player.nickname}'s answer to {self.question}"
+
+
+class QuestionStats(models.Model):
+    """
+    Live answer counters of one question in one session, kept by submit_answer
+    so the host's histogram is read without aggregating answers.
+    ``options`` holds the correct answer, then the wrong ones; ``correct``
+    and ``wrong_1`` to ``wrong_3`` count the answers picking each of them.
+    Answers matching no option only count as responses.
+    """
+    OPTION_FIELDS = ('correct', 'wrong_1', 'wrong_2', 'wrong_3')
+
+    session = models.ForeignKey(GameSession, on_delete=models.CASCADE, related_name='question_stats')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='session_stats')
+    options = models.JSONField(default=list)
+    responses = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    wrong_1 = models.PositiveIntegerField(default=0)
+    wrong_2 = models.PositiveIntegerField(default=0)
+    wrong_3 = models.PositiveIntegerField(default=0)
+    sum_time_taken = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ['session', 'question']
+
+    def __str__(self):
+        return f"Answers to {self.question} in {self.session}: {self.responses}"
+
+    @classmethod
+    def record(cls, session_id, question, selected_answer, time_taken):
+        """
+        Count an answer to a serialized question with F() increments in one
+        UPDATE, so concurrent answers never wait on a locked read; the
+        question's first answer inserts the row instead.
+        """
+        options = [question['correct_answer'], *question['wrong_answers']]
+        picked = cls.OPTION_FIELDS[options.index(selected_answer)] if selected_answer in options else None
+
+        stats = cls.objects.filter(session_id=session_id, question_id=question['id'])
+        increments = {'responses': F('responses') + 1, 'sum_time_taken': F('sum_time_taken') + time_taken}
+        if picked is not None:
+            increments[picked] = F(picked) + 1
+        if stats.update(**increments):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    session_id=session_id, question_id=question['id'], options=options,
+                    responses=1, sum_time_taken=time_taken, **({picked: 1} if picked else {})
+                )
+        except IntegrityError:
+            # A concurrent first answer inserted it
+            stats.update(**increments)
+
+    @property
+    def mean_time_taken(self):
+        return self.sum_time_taken / self.responses if self.responses else 0.0
+
+    def histogram(self):
+        return {
+            'question_id': self.question_id,
+            'responses': self.responses,
+            'correct': self.correct,
+            'mean_time_taken': round(self.mean_time_taken, 2),
+            'options': [
+                {'answer': answer, 'count': getattr(self, field), 'is_correct': field == 'correct'}
+                for answer, field in zip(self.options, self.OPTION_FIELDS)
+            ],
+        }
+
+
+class QuizGenerationJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed')
+    ]
+
+    quiz = models.OneToOneField(Quiz, on_delete=models.CASCADE, related_name='generation_job')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    num_questions = models.IntegerField(default=5)
+    questions_created = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"Generation of {self.quiz.title} - {self.status}"
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+
+class GeneratedQuestionSet(models.Model):
+    """A cached AI-generated question set; ``variant`` tells apart sets for the same request"""
+    key = models.CharField(max_length=64)
+    variant = models.PositiveIntegerField(default=0)
+    topic = models.CharField(max_length=100)
+    questions = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ['key', 'variant']
+
+    def __str__(self):
+        return f"Cached questions for {self.topic} (variant {self.variant})"
+
+
+class BankQuestion(models.Model):
+    """A reusable question in the shared bank, indexed for near-duplicates by its MinHash signature"""
+    question_text = models.TextField()
+    correct_answer = models.CharField(max_length=500)
+    wrong_answers = models.JSONField()
+    topic = models.CharField(max_length=100, db_index=True)  # normalized, see question_cache.normalize_topic
+    difficulty = models.CharField(max_length=20, choices=Quiz.DIFFICULTY_CHOICES, default='medium')
+    fingerprint = models.CharField(max_length=64, unique=True)
+    signature = models.JSONField()
+    times_used = models.IntegerField(default=0)
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='bank_questions'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"[{self.topic}] {self.question_text[:50]}..."
+
+
+class RecycledJoinCode(models.Model):
+    """A join code released by a deactivated or deleted quiz, claimable again from ``available_at``"""
+    code = models.CharField(max_length=6, unique=True)
+    available_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.code} (from {self.available_at})"
+
+
+@receiver(post_delete, sender=Quiz)
+def release_deleted_quiz_join_code(sender, instance, **kwargs):
+    if instance.join_code:
+        from .join_codes import get_join_code_allocator
+        get_join_code_allocator().release(instance.join_code)
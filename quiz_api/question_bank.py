@@ -0,0 +1,228 @@
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.db.models import F
+
+from .models import BankQuestion
+from .question_cache import normalize_topic
+
+logger = logging.getLogger(__name__)
+
+# MinHash signature length, split into BANDS bands of NUM_PERM // BANDS rows
+# for locality-sensitive hashing. Stored signatures depend on these, so
+# changing them means recomputing BankQuestion.signature.
+NUM_PERM = 64
+BANDS = 16
+SHINGLE_SIZE = 4
+
+# Shingle Jaccard similarity at which a question counts as a near-duplicate
+DUPLICATE_THRESHOLD = 0.7
+
+# Seconds a process's index is trusted by lookups before it checks the bank
+# for rows added elsewhere; banking always checks first
+REFRESH_INTERVAL = 30
+
+# One multiply-add hash per signature position, from a fixed seed so every
+# process computes the same signatures
+_random = random.Random('question-bank')
+_HASHES = [(_random.getrandbits(64) | 1, _random.getrandbits(64)) for _ in range(NUM_PERM)]
+_MASK64 = (1 << 64) - 1
+_ROWS = NUM_PERM // BANDS
+
+
+def normalize_text(text):
+    return ' '.join(re.sub(r'\W+', ' ', str(text)).casefold().split())
+
+
+def bank_text(question):
+    """The part of a question dict that identifies it: question and correct answer"""
+    text = question.get('question') or question.get('question_text') or ''
+    return f"{normalize_text(text)} | {normalize_text(question.get('correct_answer') or '')}"
+
+
+def fingerprint(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def shingles(text):
+    return {text[idx:idx + SHINGLE_SIZE] for idx in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+
+
+def minhash(text):
+    """MinHash signature of the text's character shingles"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'little')
+        for shingle in shingles(text)
+    ]
+    return [min((a * value + b) & _MASK64 for value in hashes) for a, b in _HASHES]
+
+
+def similarity(text, other):
+    """Jaccard similarity of two texts' character shingles"""
+    a, b = shingles(text), shingles(other)
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateIndex:
+    """
+    LSH index of bank texts by MinHash signature.
+
+    Each signature is filed under one bucket per band, so a lookup only
+    looks at the few entries sharing a band with it, however many are
+    indexed; those candidates are then checked by their exact similarity.
+    """
+
+    def __init__(self, threshold=DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self._buckets = defaultdict(list)
+        self._texts = {}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def __contains__(self, key):
+        return key in self._texts
+
+    @staticmethod
+    def _bands(signature):
+        for band in range(BANDS):
+            yield band, tuple(signature[band * _ROWS:(band + 1) * _ROWS])
+
+    def add(self, key, text, signature=None):
+        if key in self._texts:
+            return
+        self._texts[key] = text
+        for band in self._bands(signature or minhash(text)):
+            self._buckets[band].append(key)
+
+    def find(self, text, signature=None):
+        """(key, similarity) of the closest indexed near-duplicate of the text, or None"""
+        best = None
+        checked = set()
+        for band in self._bands(signature or minhash(text)):
+            for key in self._buckets.get(band, ()):
+                if key in checked:
+                    continue
+                checked.add(key)
+                score = similarity(text, self._texts[key])
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (key, score)
+        return best
+
+
+class QuestionBank:
+    """
+    Shared bank of reusable questions that refuses near-duplicates.
+
+    The LSH index lives in each process and catches up on rows added
+    elsewhere by loading only BankQuestion rows newer than the last one it
+    saw: lookups at most once per ``refresh_interval`` seconds, banking
+    every time. Exact duplicates that race past it are stopped by the
+    unique ``fingerprint``.
+    """
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._index = NearDuplicateIndex()
+        self._last_id = 0
+        self._refreshed_at = None
+
+    def refresh(self, force=False):
+        """
+        Index bank rows added since the last refresh, unless that was less
+        than ``refresh_interval`` seconds ago and not ``force`` (caller holds the lock)
+        """
+        now = time.monotonic()
+        if not force and self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+            return
+        rows = BankQuestion.objects.filter(id__gt=self._last_id).order_by('id').values_list(
+            'id', 'fingerprint', 'signature', 'question_text', 'correct_answer'
+        )
+        for row_id, key, signature, question_text, correct_answer in rows:
+            text = bank_text({'question': question_text, 'correct_answer': correct_answer})
+            self._index.add(key, text, signature)
+            self._last_id = row_id
+        self._refreshed_at = now
+
+    def find_duplicate(self, question):
+        """(fingerprint, similarity) of a banked near-duplicate of the question, or None"""
+        with self._lock:
+            self.refresh()
+            return self._index.find(bank_text(question))
+
+    def add(self, questions, topic, difficulty='medium', created_by_id=None):
+        """
+        Bank validated question dicts, skipping near-duplicates of banked
+        questions and of each other. Returns (banked, skipped) counts.
+        """
+        rows = []
+        with self._lock:
+            self.refresh(force=True)
+            for question in questions:
+                text = bank_text(question)
+                key = fingerprint(text)
+                signature = minhash(text)
+                if key in self._index or self._index.find(text, signature):
+                    continue
+                self._index.add(key, text, signature)
+                rows.append(BankQuestion(
+                    question_text=question['question'],
+                    correct_answer=question['correct_answer'],
+                    wrong_answers=question['wrong_answers'],
+                    topic=normalize_topic(topic)[:100],
+                    difficulty=difficulty,
+                    fingerprint=key,
+                    signature=signature,
+                    created_by_id=created_by_id
+                ))
+
+        BankQuestion.objects.bulk_create(rows, ignore_conflicts=True)
+        skipped = len(questions) - len(rows)
+        logger.info(f"🏦 Banked {len(rows)} questions about '{topic}' ({skipped} near-duplicates skipped)")
+        return len(rows), skipped
+
+    def clear(self):
+        """Forget the in-memory index (the bank itself is left alone)"""
+        with self._lock:
+            self._index = NearDuplicateIndex()
+            self._last_id = 0
+            self._refreshed_at = None
+
+
+def assemble_questions(topic, difficulty=None, num_questions=10):
+    """
+    Question dicts for a new quiz drawn from the bank, least used first,
+    with no AI call. Marks the picked questions as used once more.
+    """
+    bank = BankQuestion.objects.filter(topic=normalize_topic(topic))
+    if difficulty:
+        bank = bank.filter(difficulty=difficulty)
+
+    picked = list(bank.order_by('times_used', '?').values(
+        'id', 'question_text', 'correct_answer', 'wrong_answers'
+    )[:num_questions])
+    BankQuestion.objects.filter(id__in=[row['id'] for row in picked]).update(times_used=F('times_used') + 1)
+
+    return [
+        {'question': row['question_text'], 'correct_answer': row['correct_answer'], 'wrong_answers': row['wrong_answers']}
+        for row in picked
+    ]
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+
+def get_question_bank():
+    global _bank
+    if _bank is None:
+        with _bank_lock:
+            if _bank is None:
+                _bank = QuestionBank()
+    return _bank
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import Counter, OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import GeneratedQuestionSet
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_topic(topic):
+    """Case- and whitespace-insensitive form of a topic, so "Space " and "space" share sets"""
+    return ' '.join(str(topic).split()).casefold()
+
+
+def question_set_key(topic, difficulty, num_questions, model, prompt_version):
+    """Content address of a generation request"""
+    request = [normalize_topic(topic), str(difficulty).lower(), int(num_questions), model, prompt_version]
+    return hashlib.sha256(json.dumps(request).encode()).hexdigest()
+
+
+class QuestionSetCache:
+    """
+    Two-tier cache of generated question sets.
+
+    A bounded in-memory LRU sits in front of GeneratedQuestionSet rows, and
+    both tiers expire sets after ``ttl`` seconds. A key can hold several
+    variants: asked for ``variants=N``, the cache misses until N different
+    sets are stored, then hands them out in turn so repeated topics don't
+    always get the same quiz.
+    """
+
+    def __init__(self, max_entries=256, ttl=7 * 24 * 60 * 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._turns = Counter()
+        self.counters = Counter()
+
+    def _live(self, variants_by_index, now):
+        return {
+            index: (questions, expires_at)
+            for index, (questions, expires_at) in variants_by_index.items()
+            if expires_at > now
+        }
+
+    def _remember(self, key, variants_by_index):
+        """Store a key's variants in the LRU (caller holds the lock)"""
+        self._entries[key] = variants_by_index
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._turns.pop(evicted, None)
+
+    def _load(self, key, now):
+        """A key's live variants, from memory or else the database; second item is the tier"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                live = self._live(entry, now)
+                if live:
+                    return live, 'memory'
+
+        rows = GeneratedQuestionSet.objects.filter(key=key, expires_at__gt=now).values_list(
+            'variant', 'questions', 'expires_at'
+        )
+        live = {variant: (questions, expires_at) for variant, questions, expires_at in rows}
+        if live:
+            with self._lock:
+                self._remember(key, dict(live))
+        return live, 'db'
+
+    def get(self, key, variants=1):
+        """A cached question set for the key, or None when the caller should generate one"""
+        live, tier = self._load(key, timezone.now())
+        if len(live) < variants:
+            with self._lock:
+                self.counters['misses'] += 1
+            return None
+
+        with self._lock:
+            turn = self._turns[key]
+            self._turns[key] += 1
+            self.counters[f'{tier}_hits'] += 1
+        indexes = sorted(live)
+        questions, _ = live[indexes[turn % len(indexes)]]
+        return [dict(question) for question in questions]
+
+    def put(self, key, questions, topic='', variants=1):
+        """Store a newly generated set in a free variant slot, else replacing the oldest"""
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.ttl)
+        live, _ = self._load(key, now)
+        free = [index for index in range(variants) if index not in live]
+        if free:
+            variant = free[0]
+        else:
+            variant = min(live, key=lambda index: live[index][1])
+
+        GeneratedQuestionSet.objects.filter(key=key, expires_at__lte=now).delete()
+        GeneratedQuestionSet.objects.update_or_create(
+            key=key, variant=variant,
+            defaults={'topic': topic[:100], 'questions': questions, 'expires_at': expires_at}
+        )
+        with self._lock:
+            live[variant] = (questions, expires_at)
+            self._remember(key, live)
+            self.counters['stores'] += 1
+        logger.info(f"💾 Cached {len(questions)} questions for '{topic}' (variant {variant})")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries))
+
+    def clear(self):
+        """Drop the memory tier and counters (the database tier is left alone)"""
+        with self._lock:
+            self._entries.clear()
+            self._turns.clear()
+            self.counters.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_question_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QuestionSetCache(
+                    max_entries=settings.QUESTION_CACHE_SIZE,
+                    ttl=settings.QUESTION_CACHE_TTL
+                )
+    return _cache
+
+
+@receiver(setting_changed)
+def _reset_cache(setting, **kwargs):
+    global _cache
+    if setting in ('QUESTION_CACHE_SIZE', 'QUESTION_CACHE_TTL'):
+        _cache = None
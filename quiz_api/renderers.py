@@ -0,0 +1,61 @@
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+# orjson writes 1e16, 1e-7 and 0.00001 where json writes 1e+16, 1e-07 and
+# 1e-05. The quick checks are prefilters: the string-aware rewrite only runs
+# when the output has an "e" followed by a digit or minus sign, or "0.0000".
+_MAYBE_EXPONENT = re.compile(rb'e[-0-9]')
+_STRING_OR_FLOAT = re.compile(
+    rb'"(?:[^"\\]|\\.)*"|(?<![\d.])-?(?:\d+(?:\.\d+)?e[-+]?\d+|0\.0000\d+)'
+)
+
+
+def _python_float(match):
+    token = match.group()
+    if token.startswith(b'"'):
+        return token
+    return repr(float(token)).encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    DRF's JSONRenderer, byte for byte, encoded with orjson.
+
+    Objects orjson doesn't know (datetimes included, for DRF's "Z"
+    suffix) go through DRF's encoder, and floats and U+2028/U+2029 are
+    written the way ``json.dumps`` writes them. Indented output, ASCII or
+    non-compact settings, and anything orjson can't encode are left to
+    the stock renderer. NaN and infinity come out as null instead of
+    raising.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            orjson is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if _MAYBE_EXPONENT.search(ret) or b'0.0000' in ret:
+            ret = _STRING_OR_FLOAT.sub(_python_float, ret)
+        # U+2028 and U+2029 start with this byte; a single-byte search is much cheaper
+        if b'\xe2' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
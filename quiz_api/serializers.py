@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Quiz, Question, GameSession, Player, PlayerAnswer
+from django.db.models import Q
+from .models import Quiz, Question, GameSession, Player, PlayerAnswer, QuizGenerationJob
 from authentication.models import User
 
 
@@ -32,9 +33,30 @@ class QuizSerializer(serializers.ModelSerializer):
 
 
 class QuizCreateSerializer(serializers.ModelSerializer):
+    num_questions = serializers.IntegerField(min_value=1, max_value=50, default=5, write_only=True)
+
     class Meta:
         model = Quiz
-        fields = ['title', 'topic', 'difficulty']
+        fields = ['title', 'topic', 'difficulty', 'num_questions']
+
+
+class BankQuizSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=200)
+    topic = serializers.CharField(max_length=100)
+    difficulty = serializers.ChoiceField(choices=Quiz.DIFFICULTY_CHOICES, required=False)
+    num_questions = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
+class QuizGenerationJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.IntegerField(source='id', read_only=True)
+    quiz_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = QuizGenerationJob
+        fields = [
+            'job_id', 'quiz_id', 'status', 'num_questions', 'questions_created',
+            'error', 'created_at', 'started_at', 'finished_at'
+        ]
 
 
 class PlayerSerializer(serializers.ModelSerializer):
@@ -48,17 +70,32 @@ class PlayerSerializer(serializers.ModelSerializer):
         ]
 
     def get_rank(self, obj):
-        # Get rank within the session
-        players = obj.session.players.filter(is_active=True).order_by('-score', 'joined_at')
-        for idx, player in enumerate(players, 1):
-            if player.id == obj.id:
-                return idx
-        return None
+        if not obj.is_active:
+            return None
+
+        # Use the window-function rank when the queryset was built by GameSession.ranked_players()
+        rank = getattr(obj, 'rank', None)
+        if rank is not None:
+            return rank
+
+        # Otherwise count the active players ranked ahead of this one
+        ahead = obj.session.players.filter(is_active=True).filter(
+            Q(score__gt=obj.score) | Q(score=obj.score, joined_at__lt=obj.joined_at)
+        ).count()
+        return ahead + 1
+
+
+class JoinedPlayerSerializer(serializers.ModelSerializer):
+    """A newly joined player, without the rank a join-storm response can't afford to compute"""
+
+    class Meta:
+        model = Player
+        fields = ['id', 'nickname', 'score', 'answers_correct', 'answers_wrong', 'joined_at', 'is_active']
 
 
 class GameSessionSerializer(serializers.ModelSerializer):
     quiz_title = serializers.CharField(source='quiz.title', read_only=True)
-    players = PlayerSerializer(many=True, read_only=True)
+    players = serializers.SerializerMethodField()
     total_questions = serializers.IntegerField(source='quiz.questions.count', read_only=True)
     current_question = serializers.SerializerMethodField() 
     
@@ -70,12 +107,16 @@ class GameSessionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'started_at', 'ended_at']
     
+    def get_players(self, obj):
+        return PlayerSerializer(obj.ranked_players(active_only=False), many=True).data
+
     def get_current_question(self, obj):
         # Get ordered questions from quiz
-        questions = obj.quiz.questions.all().order_by('order')
         index = obj.current_question_index or 0
-        if 0 <= index < questions.count():
-            question = questions[index]
+        if index < 0:
+            return None
+        question = obj.quiz.questions.all().order_by('order')[index:index + 1].first()
+        if question:
             return QuestionSerializer(question).data
         return None
 
@@ -0,0 +1,723 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .leaderboard import AROUND_RADIUS, PLAYER_TOP, Leaderboard, ranked_player, ranked_players
+
+logger = logging.getLogger(__name__)
+
+# Snapshots of idle sessions are dropped after this many seconds
+DEFAULT_TTL = 60 * 60
+
+# How long a reader may take to rebuild a snapshot from the database
+FILL_TIMEOUT = 5
+
+# Writes remembered per session for game-state deltas; clients further behind get a full state
+DEFAULT_LOG_SIZE = 1000
+
+# Keys deleted per DEL when clearing the Redis backend
+CLEAR_BATCH_SIZE = 500
+
+# Session fields returned with every leaderboard slice
+LEADERBOARD_FIELDS = ('session_id', 'status', 'quiz_title', 'state_version')
+
+# Session fields returned with a player's view
+PLAYER_VIEW_FIELDS = (
+    'session_id', 'status', 'quiz_title', 'state_version', 'current_question_index', 'started_at',
+    'question_started_at'
+)
+
+
+class GameStateStore:
+    """
+    Hot per-session game-state snapshots kept outside the database.
+
+    A snapshot is a plain dict::
+
+        {
+            'session_id', 'status', 'current_question_index',
+            'started_at', 'question_started_at',   # ISO strings or None
+            'state_version', 'quiz_title',
+            'questions': [...],                    # serialized questions in play order
+            'players': {player_id: {...}},         # serialized players (no rank)
+            'answered': {player_id, ...},          # answered the current question
+            'ranking': [player_id, ...],           # active players in leaderboard order (get only)
+        }
+
+    Backends keep the ranking up to date as players join and score, so
+    leaderboard slices never re-sort the room.
+
+    Each write bumps the snapshot's ``state_version``, so the version
+    always describes the snapshot it is served with. Writes are checked
+    against the snapshot, so one that missed an earlier write (lost or
+    failed) is dropped and the next reader rebuilds it from the database:
+    a session update carries the ``GameSession.state_version`` it produced
+    (``session_version`` in the snapshot) and the fields it replaced, and
+    an answer the player's counters after it. A snapshot that already holds
+    a write (rebuilt after it committed) is left alone.
+
+    Writers apply their change only when a snapshot is present; readers
+    rebuild a missing snapshot from the database. ``begin_fill`` /
+    ``finish_fill`` make sure a rebuild that raced with a writer is
+    discarded instead of caching stale data.
+
+    Backends also log the last ``log_size`` writes of each snapshot as
+    (state_version, player id, or None for session fields), so ``changes``
+    can tell a client what changed since the version it holds.
+    """
+
+    def get(self, session_id):
+        raise NotImplementedError
+
+    def version(self, session_id):
+        """The snapshot's ``state_version`` without reading the rest of it, or None without a snapshot"""
+        raise NotImplementedError
+
+    def player_session(self, player_id):
+        """
+        The session of a player that has been in a snapshot, or None. Players
+        never change session, so the answer holds after the snapshot is gone.
+        """
+        raise NotImplementedError
+
+    def begin_fill(self, session_id):
+        raise NotImplementedError
+
+    def finish_fill(self, session_id, token, snapshot):
+        raise NotImplementedError
+
+    def update_session(self, session_id, version, previous, **fields):
+        """Apply session ``fields`` produced by DB ``version``, over the ``previous`` values of the fields it checks"""
+        raise NotImplementedError
+
+    def put_player(self, session_id, player):
+        """Add a joined player"""
+        raise NotImplementedError
+
+    def record_answer(self, session_id, question_id, player):
+        """Mark ``player`` as having answered the question and store their counters after the answer"""
+        raise NotImplementedError
+
+    def changes(self, session_id, since, until):
+        """
+        What changed after version ``since`` up to ``until`` (the version of
+        the snapshot the caller holds), or None when the log doesn't reach
+        back to ``since`` or there is no snapshot::
+
+            {'state_version': 12,        # ``until``, or lower (see ``collect_changes``)
+             'session': True,            # session fields changed
+             'players': {player_id, ...}}
+        """
+        raise NotImplementedError
+
+    def leaderboard(self, session_id, top=None, around_player=None, radius=AROUND_RADIUS):
+        """
+        A slice of the session's leaderboard, or None without a snapshot.
+        ``top`` must be positive when given::
+
+            {'session_id', 'status', 'quiz_title', 'state_version', 'total_players',
+             'leaderboard': [...],       # the top ``top`` players (everyone when no slice is asked for)
+             'around': [...],            # ``around_player`` and ``radius`` neighbours each side
+             'player_rank': 3}           # only with ``around_player``
+        """
+        raise NotImplementedError
+
+    def player_view(self, session_id, player_id, top=PLAYER_TOP):
+        """
+        What one player's screen needs, without touching the rest of the
+        room, or None without a snapshot::
+
+            {'session_id', 'status', 'quiz_title', 'state_version',
+             'current_question_index', 'started_at', 'question_started_at',
+             'total_questions', 'current_question',   # None unless active
+             'total_players',
+             'player': {...},                       # ranked (rank None when inactive), None if unknown
+             'has_answered': False,                 # answered the current question
+             'top': [...]}                          # the first ``top`` players
+        """
+        raise NotImplementedError
+
+    def invalidate(self, session_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class InMemoryGameStateStore(GameStateStore):
+    """
+    Process-local backend. Only correct when one process serves every
+    request of a session, e.g. a single ASGI worker.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, log_size=DEFAULT_LOG_SIZE):
+        self.ttl = ttl
+        self.log_size = log_size
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._answers = {}
+        self._fills = {}
+        self._player_sessions = {}
+
+    def _live(self, session_id):
+        entry = self._snapshots.get(session_id)
+        if entry is None:
+            return None
+        if entry['expires_at'] < time.monotonic():
+            self._drop(session_id)
+            return None
+        return entry
+
+    def _touch(self, entry):
+        entry['expires_at'] = time.monotonic() + self.ttl
+
+    def _drop(self, session_id):
+        entry = self._snapshots.pop(session_id, None)
+        self._answers.pop(session_id, None)
+        if entry is not None:
+            for player_id in entry['snapshot']['players']:
+                self._player_sessions.pop(player_id, None)
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._live(session_id)
+            if entry is None:
+                return None
+
+            snapshot = entry['snapshot']
+            current_question = _current_question_id(snapshot)
+            answered = self._answers.get(session_id, {}).get(current_question, ())
+            return dict(
+                snapshot,
+                players=dict(snapshot['players']),
+                answered=set(answered),
+                ranking=entry['leaderboard'].ids()
+            )
+
+    def version(self, session_id):
+        with self._lock:
+            entry = self._live(session_id)
+            return None if entry is None else entry['snapshot']['state_version']
+
+    def player_session(self, player_id):
+        with self._lock:
+            return self._player_sessions.get(player_id)
+
+    def begin_fill(self, session_id):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._fills[session_id] = token
+        return token
+
+    def finish_fill(self, session_id, token, snapshot):
+        with self._lock:
+            if self._fills.get(session_id) != token:
+                return False
+            del self._fills[session_id]
+
+            snapshot = dict(snapshot, players={
+                player_id: dict(player) for player_id, player in snapshot['players'].items()
+            })
+            answered = snapshot.pop('answered', set())
+            entry = {
+                'snapshot': snapshot,
+                'leaderboard': Leaderboard(snapshot['players'].values()),
+                'log': deque(maxlen=self.log_size),
+            }
+            self._touch(entry)
+            self._drop(session_id)
+            self._snapshots[session_id] = entry
+            self._player_sessions.update(dict.fromkeys(snapshot['players'], session_id))
+            self._answers[session_id] = {_current_question_id(snapshot): set(answered)}
+            return True
+
+    def _writable(self, session_id):
+        # A rebuild that started before this write would miss it
+        self._fills.pop(session_id, None)
+        return self._live(session_id)
+
+    def _bump(self, entry, player_id=None):
+        entry['snapshot']['state_version'] += 1
+        entry['log'].append((entry['snapshot']['state_version'], player_id))
+        self._touch(entry)
+
+    def update_session(self, session_id, version, previous, **fields):
+        with self._lock:
+            entry = self._writable(session_id)
+            snapshot = entry and entry['snapshot']
+            if snapshot is None or snapshot['session_version'] >= version:
+                return
+            if any(snapshot[field] != value for field, value in previous.items()):
+                _log_missed_write(session_id)
+                self._drop(session_id)
+                return
+            snapshot.update(fields, session_version=version)
+            self._bump(entry)
+
+    def put_player(self, session_id, player):
+        with self._lock:
+            entry = self._writable(session_id)
+            if entry is None or player['id'] in entry['snapshot']['players']:
+                return
+            entry['snapshot']['players'][player['id']] = dict(player)
+            entry['leaderboard'].update(player)
+            self._player_sessions[player['id']] = session_id
+            self._bump(entry, player['id'])
+
+    def record_answer(self, session_id, question_id, player):
+        with self._lock:
+            entry = self._writable(session_id)
+            if entry is None:
+                return
+            state = _answer_write_state(entry['snapshot']['players'].get(player['id']), player)
+            if state != 'apply':
+                if state == 'missed':
+                    _log_missed_write(session_id)
+                    self._drop(session_id)
+                return
+            entry['snapshot']['players'][player['id']] = dict(player)
+            entry['leaderboard'].update(player)
+            self._answers[session_id].setdefault(question_id, set()).add(player['id'])
+            self._bump(entry, player['id'])
+
+    def changes(self, session_id, since, until):
+        with self._lock:
+            entry = self._live(session_id)
+            if entry is None:
+                return None
+            return collect_changes(entry['log'], since, until)
+
+    def leaderboard(self, session_id, top=None, around_player=None, radius=AROUND_RADIUS):
+        with self._lock:
+            entry = self._live(session_id)
+            if entry is None:
+                return None
+
+            snapshot = entry['snapshot']
+            board = entry['leaderboard']
+            players = snapshot['players']
+            result = {field: snapshot[field] for field in LEADERBOARD_FIELDS}
+            result['total_players'] = len(board)
+
+            if top is not None or around_player is None:
+                result['leaderboard'] = ranked_players(players, board.ids(0, top))
+            if around_player is not None:
+                first_rank, ids = board.window(around_player, radius)
+                result['around'] = ranked_players(players, ids, first_rank)
+                result['player_rank'] = board.rank(around_player)
+            return result
+
+    def player_view(self, session_id, player_id, top=PLAYER_TOP):
+        with self._lock:
+            entry = self._live(session_id)
+            if entry is None:
+                return None
+
+            snapshot = entry['snapshot']
+            board = entry['leaderboard']
+            players = snapshot['players']
+            question_id = _current_question_id(snapshot)
+            player = players.get(player_id)
+
+            view = {field: snapshot[field] for field in PLAYER_VIEW_FIELDS}
+            view.update(
+                total_questions=len(snapshot['questions']),
+                current_question=_current_question(snapshot),
+                total_players=len(board),
+                player=ranked_player(player, board.rank(player_id)) if player else None,
+                has_answered=player_id in self._answers[session_id].get(question_id, ()),
+                top=ranked_players(players, board.ids(0, top)),
+            )
+            return view
+
+    def invalidate(self, session_id):
+        with self._lock:
+            self._fills.pop(session_id, None)
+            self._drop(session_id)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+            self._answers.clear()
+            self._player_sessions.clear()
+            self._fills.clear()
+
+
+class RedisGameStateStore(GameStateStore):
+    """
+    Shared backend for multi-process deployments.
+
+    Uses only plain Redis commands (HSET, HSETNX, HGET, HMGET, HINCRBY, HGETALL,
+    SADD, SMEMBERS, SISMEMBER, ZADD, ZREM, ZRANGE, ZRANK, ZCARD, RPUSH, LTRIM, LRANGE,
+    SET, GET, EXISTS, EXPIRE, DEL, SCAN) on a client created with ``decode_responses=True``, so any
+    Redis-compatible server or local stand-in works. Every write touches a
+    single key, so concurrent writers never overwrite each other's fields.
+
+    The leaderboard is a sorted set scored by ``-score``; members start with
+    the zero-padded join time so Redis breaks ties in join order. The change
+    log is a list of ``"<version>:<player id or empty>"`` entries, and
+    ``<prefix>:player:<id>`` keys hold each player's session id.
+    """
+
+    META_FIELDS = (
+        'session_id', 'status', 'current_question_index', 'started_at', 'question_started_at',
+        'state_version', 'session_version', 'quiz_title'
+    )
+
+    def __init__(self, client, prefix='quiz:state', ttl=DEFAULT_TTL, log_size=DEFAULT_LOG_SIZE):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.log_size = log_size
+
+    def _key(self, session_id, *parts):
+        return ':'.join([self.prefix, str(session_id), *map(str, parts)])
+
+    def _player_key(self, player_id):
+        return f'{self.prefix}:player:{player_id}'
+
+    @staticmethod
+    def _member(player):
+        return f"{player['joined_ts']:017.6f}:{player['id']:012d}"
+
+    @staticmethod
+    def _member_id(member):
+        return int(member.rsplit(':', 1)[1])
+
+    def _rank_player(self, session_id, player):
+        ranking_key = self._key(session_id, 'ranking')
+        if player['is_active']:
+            self.client.zadd(ranking_key, {self._member(player): -player['score']})
+        else:
+            self.client.zrem(ranking_key, self._member(player))
+        self.client.expire(ranking_key, self.ttl)
+
+    def _players(self, session_id, ids, first_rank=1):
+        if not ids:
+            return []
+        stored = self.client.hmget(self._key(session_id, 'players'), ids)
+        players = {player_id: json.loads(player) for player_id, player in zip(ids, stored)}
+        return ranked_players(players, ids, first_rank)
+
+    def get(self, session_id):
+        meta = self.client.hgetall(self._key(session_id, 'meta'))
+        if not meta or meta.get('filled') != '1':
+            return None
+
+        snapshot = {field: json.loads(meta[field]) for field in self.META_FIELDS}
+        snapshot['questions'] = json.loads(meta['questions'])
+        snapshot['players'] = {
+            int(player_id): json.loads(player)
+            for player_id, player in self.client.hgetall(self._key(session_id, 'players')).items()
+        }
+        current_question = _current_question_id(snapshot)
+        snapshot['answered'] = {
+            int(player_id) for player_id in self.client.smembers(self._key(session_id, 'answered', current_question))
+        }
+        snapshot['ranking'] = [
+            self._member_id(member) for member in self.client.zrange(self._key(session_id, 'ranking'), 0, -1)
+        ]
+        return snapshot
+
+    def version(self, session_id):
+        filled, version = self.client.hmget(self._key(session_id, 'meta'), ['filled', 'state_version'])
+        return int(version) if filled == '1' else None
+
+    def player_session(self, player_id):
+        session_id = self.client.get(self._player_key(player_id))
+        return None if session_id is None else int(session_id)
+
+    def begin_fill(self, session_id):
+        token = uuid.uuid4().hex
+        self.client.set(self._key(session_id, 'fill'), token, px=FILL_TIMEOUT * 1000)
+        return token
+
+    def finish_fill(self, session_id, token, snapshot):
+        # A writer deletes the fill marker, which voids this rebuild
+        if self.client.get(self._key(session_id, 'fill')) != token:
+            return False
+
+        meta_key = self._key(session_id, 'meta')
+        players_key = self._key(session_id, 'players')
+        ranking_key = self._key(session_id, 'ranking')
+        answered_key = self._key(session_id, 'answered', _current_question_id(snapshot))
+
+        self.client.delete(meta_key, players_key, ranking_key, self._key(session_id, 'log'))
+        meta = {field: json.dumps(snapshot[field]) for field in self.META_FIELDS}
+        meta['questions'] = json.dumps(snapshot['questions'])
+        self.client.hset(meta_key, mapping=meta)
+        if snapshot['players']:
+            self.client.hset(players_key, mapping={
+                player_id: json.dumps(player) for player_id, player in snapshot['players'].items()
+            })
+            ranking = {
+                self._member(player): -player['score'] for player in snapshot['players'].values() if player['is_active']
+            }
+            if ranking:
+                self.client.zadd(ranking_key, ranking)
+            for player_id in snapshot['players']:
+                self.client.set(self._player_key(player_id), session_id, ex=self.ttl)
+        if snapshot['answered']:
+            self.client.sadd(answered_key, *snapshot['answered'])
+
+        # Readers only trust the snapshot once it is complete
+        self.client.hset(meta_key, 'filled', '1')
+        for key in (meta_key, players_key, ranking_key, answered_key):
+            self.client.expire(key, self.ttl)
+        self.client.delete(self._key(session_id, 'fill'))
+        return True
+
+    def _cancel_fill(self, session_id):
+        self.client.delete(self._key(session_id, 'fill'))
+
+    def _present(self, session_id):
+        return self.client.exists(self._key(session_id, 'meta'))
+
+    def _bump(self, session_id, player_id=None):
+        # The data is written first, so a reader that sees a version also sees its changes
+        meta_key = self._key(session_id, 'meta')
+        version = self.client.hincrby(meta_key, 'state_version', 1)
+        log_key = self._key(session_id, 'log')
+        self.client.rpush(log_key, f"{version}:{'' if player_id is None else player_id}")
+        self.client.ltrim(log_key, -self.log_size, -1)
+        self.client.expire(log_key, self.ttl)
+        self.client.expire(meta_key, self.ttl)
+
+    def _write_player(self, session_id, player):
+        players_key = self._key(session_id, 'players')
+        self.client.hset(players_key, player['id'], json.dumps(player))
+        self._rank_player(session_id, player)
+        self.client.expire(players_key, self.ttl)
+
+    def update_session(self, session_id, version, previous, **fields):
+        self._cancel_fill(session_id)
+        meta_key = self._key(session_id, 'meta')
+        current, *replaced = self.client.hmget(meta_key, ['session_version', *previous])
+        if current is None or json.loads(current) >= version:
+            return
+        if any(value is None or json.loads(value) != previous[field] for field, value in zip(previous, replaced)):
+            _log_missed_write(session_id)
+            self.invalidate(session_id)
+            return
+        self.client.hset(meta_key, mapping={
+            field: json.dumps(value) for field, value in dict(fields, session_version=version).items()
+        })
+        self._bump(session_id)
+
+    def put_player(self, session_id, player):
+        self._cancel_fill(session_id)
+        if not self._present(session_id):
+            return
+        players_key = self._key(session_id, 'players')
+        # Atomic, so a player is added (and the version bumped) once
+        if not self.client.hsetnx(players_key, player['id'], json.dumps(player)):
+            return
+        self._rank_player(session_id, player)
+        self._bump(session_id, player['id'])
+        self.client.expire(players_key, self.ttl)
+        self.client.set(self._player_key(player['id']), session_id, ex=self.ttl)
+
+    def record_answer(self, session_id, question_id, player):
+        self._cancel_fill(session_id)
+        if not self._present(session_id):
+            return
+        known = self.client.hget(self._key(session_id, 'players'), player['id'])
+        state = _answer_write_state(None if known is None else json.loads(known), player)
+        if state != 'apply':
+            if state == 'missed':
+                _log_missed_write(session_id)
+                self.invalidate(session_id)
+            return
+        answered_key = self._key(session_id, 'answered', question_id)
+        self.client.sadd(answered_key, player['id'])
+        self.client.expire(answered_key, self.ttl)
+        self._write_player(session_id, player)
+        self._bump(session_id, player['id'])
+
+    def changes(self, session_id, since, until):
+        if not self._present(session_id):
+            return None
+        entries = []
+        for entry in self.client.lrange(self._key(session_id, 'log'), 0, -1):
+            version, player_id = entry.split(':')
+            entries.append((int(version), int(player_id) if player_id else None))
+        return collect_changes(entries, since, until)
+
+    def leaderboard(self, session_id, top=None, around_player=None, radius=AROUND_RADIUS):
+        meta = self.client.hgetall(self._key(session_id, 'meta'))
+        if not meta or meta.get('filled') != '1':
+            return None
+
+        ranking_key = self._key(session_id, 'ranking')
+        result = {field: json.loads(meta[field]) for field in LEADERBOARD_FIELDS}
+        result['total_players'] = self.client.zcard(ranking_key)
+
+        if top is not None or around_player is None:
+            members = self.client.zrange(ranking_key, 0, -1 if top is None else top - 1)
+            result['leaderboard'] = self._players(session_id, [self._member_id(member) for member in members])
+        if around_player is not None:
+            player = self.client.hget(self._key(session_id, 'players'), around_player)
+            index = self.client.zrank(ranking_key, self._member(json.loads(player))) if player else None
+            if index is None:
+                result['around'], result['player_rank'] = [], None
+            else:
+                start = max(0, index - radius)
+                members = self.client.zrange(ranking_key, start, index + radius)
+                result['around'] = self._players(session_id, [self._member_id(member) for member in members], start + 1)
+                result['player_rank'] = index + 1
+        return result
+
+    def player_view(self, session_id, player_id, top=PLAYER_TOP):
+        meta = self.client.hgetall(self._key(session_id, 'meta'))
+        if not meta or meta.get('filled') != '1':
+            return None
+
+        snapshot = {field: json.loads(meta[field]) for field in self.META_FIELDS}
+        snapshot['questions'] = json.loads(meta['questions'])
+        ranking_key = self._key(session_id, 'ranking')
+        question_id = _current_question_id(snapshot)
+
+        player = self.client.hget(self._key(session_id, 'players'), player_id)
+        if player is not None:
+            player = json.loads(player)
+            index = self.client.zrank(ranking_key, self._member(player))
+            player = ranked_player(player, None if index is None else index + 1)
+
+        view = {field: snapshot[field] for field in PLAYER_VIEW_FIELDS}
+        view.update(
+            total_questions=len(snapshot['questions']),
+            current_question=_current_question(snapshot),
+            total_players=self.client.zcard(ranking_key),
+            player=player,
+            has_answered=question_id is not None and bool(
+                self.client.sismember(self._key(session_id, 'answered', question_id), player_id)
+            ),
+            top=self._players(session_id, [
+                self._member_id(member) for member in self.client.zrange(ranking_key, 0, top - 1)
+            ]),
+        )
+        return view
+
+    def invalidate(self, session_id):
+        self._cancel_fill(session_id)
+        self.client.delete(
+            self._key(session_id, 'meta'), self._key(session_id, 'players'), self._key(session_id, 'ranking'),
+            self._key(session_id, 'log')
+        )
+
+    def clear(self):
+        # SCAN rather than KEYS, so a large keyspace never blocks the server
+        batch = []
+        for key in self.client.scan_iter(match=f'{self.prefix}:*', count=CLEAR_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= CLEAR_BATCH_SIZE:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+
+def collect_changes(entries, since, until):
+    """
+    Fold change-log entries into ``GameStateStore.changes`` form. Versions
+    are followed one by one from ``since``; where one is missing before
+    ``until`` (a write still in flight in another process) the result stops
+    at the last one found, and the rest is picked up on the client's next
+    poll. None when ``since + 1`` itself is not in the log.
+    """
+    if since == until:
+        return {'state_version': since, 'session': False, 'players': set()}
+    if since > until:
+        return None
+
+    logged = dict(entries)
+    version, session, players = since, False, set()
+    while version < until and version + 1 in logged:
+        version += 1
+        player_id = logged[version]
+        if player_id is None:
+            session = True
+        else:
+            players.add(player_id)
+    if version == since:
+        return None
+    return {'state_version': version, 'session': session, 'players': players}
+
+
+def _answer_write_state(known, player):
+    """
+    How an answer write applies to the snapshot's copy of the player,
+    ``known`` (None when missing): 'apply' when it is one answer behind the
+    counters in ``player``, 'skip' when it already has them, and 'missed'
+    when it lacks an earlier write (the player's join or another answer).
+    """
+    if known is None:
+        return 'missed'
+    behind = _answer_count(player) - _answer_count(known)
+    if behind <= 0:
+        return 'skip'
+    return 'apply' if behind == 1 else 'missed'
+
+
+def _answer_count(player):
+    return player['answers_correct'] + player['answers_wrong']
+
+
+def _log_missed_write(session_id):
+    logger.warning(f"Snapshot of session {session_id} missed a write, dropping it")
+
+
+def _current_question(snapshot):
+    index = snapshot['current_question_index']
+    questions = snapshot['questions']
+    if snapshot['status'] == 'active' and 0 <= index < len(questions):
+        return questions[index]
+    return None
+
+
+def _current_question_id(snapshot):
+    question = _current_question(snapshot)
+    return question['id'] if question else None
+
+
+def _create_store():
+    backend = getattr(settings, 'GAME_STATE_STORE', 'memory')
+    log_size = getattr(settings, 'GAME_STATE_LOG_SIZE', DEFAULT_LOG_SIZE)
+    if backend == 'memory':
+        return InMemoryGameStateStore(log_size=log_size)
+    if backend == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("GAME_STATE_STORE='redis' requires the redis package")
+        client = redis.Redis.from_url(settings.GAME_STATE_REDIS_URL, decode_responses=True)
+        return RedisGameStateStore(client, log_size=log_size)
+    raise ImproperlyConfigured(f"Unknown GAME_STATE_STORE backend: {backend}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_game_state_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _create_store()
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting in ('GAME_STATE_STORE', 'GAME_STATE_REDIS_URL', 'GAME_STATE_LOG_SIZE'):
+        _store = None
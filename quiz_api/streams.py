@@ -0,0 +1,276 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+from .events import broker
+from .game_state import (
+    build_game_state, build_player_state, load_game_state_delta, load_player_session_id, load_player_view, load_snapshot
+)
+from .state_store import get_game_state_store
+from .models import GameSession, Player
+from .views import GameSessionViewSet
+
+logger = logging.getLogger(__name__)
+
+# Comment lines keep proxies from closing an idle stream
+KEEPALIVE_SECONDS = 15
+
+# How often to re-read an expired question's state until the timer moves it on
+EXPIRY_RECHECK_SECONDS = 1
+
+# How long a long-poll request is parked before answering 304 Not Modified
+LONG_POLL_SECONDS = 25
+
+# Streams and parked requests re-read the store this often, to catch
+# changes made by other processes whose events never reach this broker
+RECHECK_SECONDS = 3
+
+
+def _format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def _load_state(session_id):
+    return build_game_state(load_snapshot(session_id))
+
+
+# The last re-read state of each session, shared by this process's streams
+# and parked polls: {session_id: (checked_at, built_at, state)} in time.monotonic()
+_rechecked = {}
+_rechecked_lock = threading.Lock()
+
+
+def _recheck_state(session_id):
+    """
+    The session's state as the store holds it now. However many clients
+    wait on a session, the store is asked for its version once per
+    RECHECK_SECONDS, and the state only rebuilt when the version moved.
+    """
+    session_id = int(session_id)
+    now = time.monotonic()
+    with _rechecked_lock:
+        checked_at, built_at, state = _rechecked.get(session_id, (None, None, None))
+
+    if state is None or (
+        now - checked_at >= RECHECK_SECONDS
+        and get_game_state_store().version(session_id) != state['state_version']
+    ):
+        checked_at, built_at, state = now, now, _load_state(session_id)
+    elif now - checked_at >= RECHECK_SECONDS:
+        checked_at = now
+
+    with _rechecked_lock:
+        for stale_id, (read_at, _, _) in list(_rechecked.items()):
+            if now - read_at > 2 * RECHECK_SECONDS:
+                del _rechecked[stale_id]
+        _rechecked[session_id] = (checked_at, built_at, state)
+
+    if built_at == now or state.get('time_left') is None:
+        return state
+    # The countdown has moved on since the state was built
+    return dict(
+        state,
+        time_left=round(max(0, state['time_left'] - (now - built_at)), 1),
+        server_time=timezone.now().isoformat()
+    )
+
+
+def _change_event(old, new):
+    """The event name for a state change this process was not told about"""
+    if new['status'] != old['status']:
+        return 'game_started' if new['status'] == 'active' else 'game_finished'
+    if new['current_question_index'] != old['current_question_index']:
+        return 'question_advanced'
+    if new['player_count'] != old['player_count']:
+        return 'player_joined'
+    return 'answer_received'
+
+
+def _position(state):
+    return state.get('status'), state.get('current_question_index')
+
+
+def _question_deadline(state, now):
+    """Event-loop time just after the current question expires, if any"""
+    if state.get('status') == 'active' and state.get('time_left') is not None:
+        return now + state['time_left'] + 0.2
+    return None
+
+
+async def _state_events(session_id, entry, state, read_state, reread=False):
+    """
+    The body of a Server-Sent Events stream following one session: ``state``
+    on connect, then one ``state`` event per session transition, until the
+    game finishes. Broker payloads are sent as they are, or with ``reread``
+    only wake the stream to send ``read_state()`` (a sync callable) instead.
+    Transitions made by other processes are picked up from the state store
+    within RECHECK_SECONDS.
+    """
+    _, queue = entry
+    loop = asyncio.get_running_loop()
+    try:
+        deadline = _question_deadline(state, loop.time())
+        yield _format_event('state', dict(state, event='connected'))
+        last_sent = loop.time()
+
+        while state.get('status') != 'finished':
+            now = loop.time()
+            timeout = max(0, min(RECHECK_SECONDS, last_sent + KEEPALIVE_SECONDS - now))
+            if deadline is not None:
+                timeout = max(0, min(timeout, deadline - now))
+
+            try:
+                event, pushed_state = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if deadline is not None and loop.time() >= deadline:
+                    # The question timer may run in another process, whose
+                    # events never reach this broker, so re-read the state
+                    fresh_state = await sync_to_async(read_state)()
+                    if _position(fresh_state) != _position(state):
+                        state = fresh_state
+                        deadline = _question_deadline(state, loop.time())
+                        event = 'game_finished' if state['status'] == 'finished' else 'question_advanced'
+                        yield _format_event('state', dict(state, event=event, auto_advanced=True))
+                        last_sent = loop.time()
+                        continue
+                    deadline = loop.time() + EXPIRY_RECHECK_SECONDS
+                else:
+                    # Joins and answers handled by other processes only show in the store
+                    fresh_state = await sync_to_async(_recheck_state)(session_id)
+                    if fresh_state['state_version'] > state['state_version']:
+                        if reread:
+                            fresh_state = await sync_to_async(read_state)()
+                        event = _change_event(state, fresh_state)
+                        state = fresh_state
+                        deadline = _question_deadline(state, loop.time())
+                        yield _format_event('state', dict(state, event=event))
+                        last_sent = loop.time()
+                        continue
+                if loop.time() - last_sent >= KEEPALIVE_SECONDS:
+                    yield ': keepalive\n\n'
+                    last_sent = loop.time()
+                continue
+
+            state = await sync_to_async(read_state)() if reread else pushed_state
+            deadline = _question_deadline(state, loop.time())
+            yield _format_event('state', dict(state, event=event))
+            last_sent = loop.time()
+    finally:
+        broker.unsubscribe(session_id, entry)
+
+
+def _event_stream(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def session_events(request, pk):
+    """
+    Server-Sent Events stream of game-state updates for one session.
+
+    Sends the current state on connect and then one ``state`` event per
+    session transition (player joined, game started, question advanced,
+    answer received, game finished). The REST ``game_state`` endpoint remains
+    available as a polling fallback.
+    """
+    try:
+        initial_state = await sync_to_async(_load_state)(pk)
+    except GameSession.DoesNotExist:
+        return JsonResponse({'error': 'Session not found'}, status=404)
+
+    entry = broker.subscribe(pk)
+    return _event_stream(_state_events(pk, entry, initial_state, lambda: _load_state(pk)))
+
+
+def _load_player_state(session_id, player_id):
+    return build_player_state(load_player_view(session_id, player_id))
+
+
+async def player_events(request, pk):
+    """
+    Server-Sent Events stream of one player's compact state, the payload of
+    ``PlayerViewSet.state``, on the same events as ``session_events``. Player
+    screens follow the game on this one, so a transition costs each of them
+    their own standing and the leaders rather than the whole room.
+    """
+    try:
+        session_id = await sync_to_async(load_player_session_id)(pk)
+        initial_state = await sync_to_async(_load_player_state)(session_id, pk)
+    except (Player.DoesNotExist, GameSession.DoesNotExist):
+        return JsonResponse({'error': 'Player not found'}, status=404)
+
+    entry = broker.subscribe(session_id)
+    return _event_stream(_state_events(
+        session_id, entry, initial_state, lambda: _load_player_state(session_id, pk), reread=True
+    ))
+
+
+_game_state_view = GameSessionViewSet.as_view({'get': 'game_state'})
+
+
+async def game_state(request, pk):
+    """
+    ``game_state``, with long-polling for clients that cannot keep a stream open.
+
+    With ``?since=<state_version>`` the request is parked until the session's
+    state version differs from ``since`` and then answered with the new
+    state, or with a bodyless 304 after LONG_POLL_SECONDS. Parked requests
+    are coroutines waiting on the event broker, so they hold no worker
+    thread when served through ASGI, as long as every middleware in
+    MIDDLEWARE is async-capable; a sync-only one makes Django run the whole
+    chain, parked polls included, in a thread per request. With ``&delta=1`` the answer only
+    holds what changed since ``since`` (see ``build_game_state_delta``).
+    Without ``since`` this is the regular ``GameSessionViewSet.game_state``.
+    """
+    if 'since' not in request.GET:
+        return await sync_to_async(_game_state_view)(request, pk=pk)
+
+    try:
+        since = int(request.GET['since'])
+    except ValueError:
+        return JsonResponse({'error': 'since must be a state version number'}, status=400)
+
+    # Subscribe before reading, so a change between the two is not missed
+    entry = broker.subscribe(pk)
+    _, queue = entry
+    try:
+        try:
+            state = await sync_to_async(_load_state)(pk)
+        except GameSession.DoesNotExist:
+            return JsonResponse({'error': 'Session not found'}, status=404)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LONG_POLL_SECONDS
+        while state['state_version'] == since:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                response = HttpResponseNotModified()
+                response['ETag'] = quote_etag(str(since))
+                return response
+
+            try:
+                _, state = await asyncio.wait_for(queue.get(), timeout=min(remaining, RECHECK_SECONDS))
+            except asyncio.TimeoutError:
+                fresh_state = await sync_to_async(_recheck_state)(pk)
+                if fresh_state['state_version'] > state['state_version']:
+                    state = fresh_state
+    finally:
+        broker.unsubscribe(pk, entry)
+
+    if request.GET.get('delta') == '1':
+        state = await sync_to_async(load_game_state_delta)(pk, since)
+
+    response = JsonResponse(state, encoder=DjangoJSONEncoder)
+    response['ETag'] = quote_etag(str(state['state_version']))
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -1,3 +1,2523 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import decimal
+import fnmatch
+import json
+import logging
+import os
+import random
+import re
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.servers.basehttp import WSGIServer
+from django.db import OperationalError, connection, connections, transaction
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .ai_service import AIServiceError, QuestionStreamParser, QuizAIService
+from . import db_router
+from .db_router import PIN_COOKIE, PrimaryReplicaRouter, primary_reads
+from .benchmarks import (
+    compare, legacy_final_scores, legacy_snapshot_from_session, load_baseline, run_benchmarks, run_delta_benchmarks
+)
+from .events import ANSWER_EVENT_WINDOW, SessionEventBroker, broker
+from .game_state import advance_question, build_final_scores, build_game_state, snapshot_from_session, snapshot_question
+from .http_client import PooledHTTPClient, parse_retry_after
+from .renderers import ORJSONRenderer
+from .question_bank import NearDuplicateIndex, QuestionBank, bank_text, get_question_bank, minhash
+from .question_cache import QuestionSetCache, get_question_cache, question_set_key
+from .jobs import GenerationJobRunner, run_generation_job
+from .join_codes import CODE_SPACE, code_for_index, get_join_code_resolver, permute, unpermute
+from .leaderboard import Leaderboard
+from .loadgen import AIStandIn, AsyncHTTPClient, LatencyStats, percentile
+from .materialize import BATCH_SIZE, import_questions, iter_ndjson, materialize_quiz
+from .metrics import MetricsRegistry, get_metrics, render
+from .models import BankQuestion, GeneratedQuestionSet, Quiz, RecycledJoinCode, Question, QuestionStats, GameSession, Player, PlayerAnswer, QuizGenerationJob
+from .serializers import PlayerSerializer
+from .state_store import InMemoryGameStateStore, RedisGameStateStore, collect_changes, get_game_state_store
+from .timers import QuestionTimerScheduler
+
+User = get_user_model()
+
+
+def create_quiz(host, num_questions=3):
+    quiz = Quiz.objects.create(host=host, title='Space Quiz', topic='Space')
+    for idx in range(num_questions):
+        Question.objects.create(
+            quiz=quiz,
+            question_text=f'Question {idx}?',
+            correct_answer='Right',
+            wrong_answers=['Wrong 1', 'Wrong 2', 'Wrong 3'],
+            order=idx
+        )
+    return quiz
+
+
+def create_players(session, count):
+    return [Player.objects.create(session=session, nickname=f'player{idx}') for idx in range(count)]
+
+
+def statements(queries):
+    """Captured queries minus transaction control (BEGIN, SAVEPOINT, RELEASE ...)"""
+    control = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+    return [query for query in queries.captured_queries if not query['sql'].upper().startswith(control)]
+
+
+class StandInServer:
+    """
+    A local keep-alive HTTP server that answers POSTs (and GETs) from a script of
+    (status, headers, body, delay) tuples, repeating the last one, or from a
+    function of the JSON request body, and records the client port of
+    every request. A list body is streamed as server-sent events.
+    """
+
+    def __init__(self, script):
+        self.script = script if callable(script) else list(script)
+        self.ports = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or 'null')
+                server.ports.append(self.client_address[1])
+                if callable(server.script):
+                    code, headers, body, delay = server.script(request)
+                else:
+                    code, headers, body, delay = server.script.pop(0) if len(server.script) > 1 else server.script[0]
+                time.sleep(delay)
+                try:
+                    self.send_response(code)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    if isinstance(body, list):
+                        self.stream(body, delay)
+                        return
+                    body = json.dumps(body).encode()
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client timed out and hung up
+                    self.close_connection = True
+
+            do_GET = do_POST
+
+            def stream(self, events, delay):
+                """Send each event as a server-sent event, ``delay`` seconds apart"""
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for event in events:
+                    # ':' lines are SSE comments, sent as they are
+                    data = (event if event.startswith(':') else f'data: {event}').encode() + b'\n\n'
+                    self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                    self.wfile.flush()
+                    time.sleep(delay)
+                self.wfile.write(b'0\r\n\r\n')
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/chat/completions'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class SessionEventBrokerTests(TestCase):
+    def test_publish_reaches_only_that_sessions_subscribers(self):
+        local_broker = SessionEventBroker()
+
+        async def scenario():
+            entry = local_broker.subscribe(1)
+            other = local_broker.subscribe(2)
+            local_broker.publish(1, 'player_joined', {'player_count': 1})
+            event = await asyncio.wait_for(entry[1].get(), timeout=1)
+            self.assertTrue(other[1].empty())
+            local_broker.unsubscribe(1, entry)
+            local_broker.unsubscribe(2, other)
+            return event
+
+        self.assertEqual(asyncio.run(scenario()), ('player_joined', {'player_count': 1}))
+        self.assertFalse(local_broker.has_subscribers(1))
+
+    def test_slow_subscriber_keeps_latest_events(self):
+        local_broker = SessionEventBroker(max_queue_size=2)
+
+        async def scenario():
+            entry = local_broker.subscribe(1)
+            for idx in range(5):
+                local_broker.publish(1, 'answer_received', {'responses_received': idx})
+            await asyncio.sleep(0)
+            return [entry[1].get_nowait()[1]['responses_received'] for _ in range(2)]
+
+        self.assertEqual(asyncio.run(scenario()), [3, 4])
+
+
+class LiveGameChannelTests(TransactionTestCase):
+    def setUp(self):
+        # Ids are reused between tests, so snapshots from earlier tests must not leak
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+        self.session = GameSession.objects.create(quiz=self.quiz)
+
+    def test_join_pushes_state_to_subscribers(self):
+        async def scenario():
+            entry = broker.subscribe(self.session.id)
+            try:
+                client = APIClient()
+                response = await asyncio.to_thread(
+                    client.post, '/api/sessions/join/',
+                    {'join_code': self.quiz.join_code, 'nickname': 'alice'}, format='json'
+                )
+                self.assertEqual(response.status_code, 201)
+                return await asyncio.wait_for(entry[1].get(), timeout=5)
+            finally:
+                broker.unsubscribe(self.session.id, entry)
+
+        event, state = asyncio.run(scenario())
+        self.assertEqual(event, 'player_joined')
+        self.assertEqual(state['player_count'], 1)
+        self.assertEqual(state['players'][0]['nickname'], 'alice')
+
+    def test_answers_reach_subscribers_as_one_event(self):
+        players = create_players(self.session, 3)
+        self.session.status = 'active'
+        self.session.started_at = self.session.question_started_at = timezone.now()
+        self.session.save()
+        question = self.quiz.questions.get(order=0)
+
+        async def scenario():
+            entry = broker.subscribe(self.session.id)
+            try:
+                for player in players:
+                    await asyncio.to_thread(
+                        APIClient().post, f'/api/players/{player.id}/submit_answer/',
+                        {'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 1.0}, format='json'
+                    )
+                event = await asyncio.wait_for(entry[1].get(), timeout=5)
+                await asyncio.sleep(ANSWER_EVENT_WINDOW * 2)
+                return event, entry[1].qsize()
+            finally:
+                broker.unsubscribe(self.session.id, entry)
+
+        (event, state), queued = asyncio.run(scenario())
+        self.assertEqual((event, state['responses_received'], queued), ('answer_received', 3, 0))
+
+    def test_event_stream_picks_up_changes_from_other_processes(self):
+        async def scenario():
+            response = await self.async_client.get(f'/api/sessions/{self.session.id}/events/')
+            chunks = aiter(response.streaming_content)
+            await anext(chunks)
+            # Another worker lets a player in: the store changes, this broker hears nothing
+            await asyncio.to_thread(self.join_elsewhere, 'alice')
+            return await asyncio.wait_for(anext(chunks), timeout=5)
+
+        with mock.patch('quiz_api.streams.RECHECK_SECONDS', 0.2):
+            chunk = asyncio.run(scenario())
+        state = json.loads(chunk.decode().splitlines()[1][len('data: '):])
+        self.assertEqual((state['event'], state['player_count']), ('player_joined', 1))
+
+    def test_player_stream_sends_the_players_own_state(self):
+        player = create_players(self.session, 1)[0]
+
+        async def scenario():
+            response = await self.async_client.get(f'/api/players/{player.id}/events/')
+            chunks = aiter(response.streaming_content)
+            connected = await anext(chunks)
+            await asyncio.to_thread(
+                APIClient().post, '/api/sessions/join/',
+                {'join_code': self.quiz.join_code, 'nickname': 'alice'}, format='json'
+            )
+            return connected, await asyncio.wait_for(anext(chunks), timeout=5)
+
+        connected, joined = [
+            json.loads(chunk.decode().splitlines()[1][len('data: '):]) for chunk in asyncio.run(scenario())
+        ]
+        self.assertEqual((connected['event'], connected['player']['id'], connected['player_count']), ('connected', player.id, 1))
+        self.assertNotIn('players', connected)
+        self.assertEqual((joined['event'], joined['player_count'], len(joined['top'])), ('player_joined', 2, 2))
+
+        async def unknown():
+            return await self.async_client.get('/api/players/999999/events/')
+
+        self.assertEqual(asyncio.run(unknown()).status_code, 404)
+
+    def join_elsewhere(self, nickname):
+        Player.objects.create(session=self.session, nickname=nickname)
+        GameSession.bump_state_version(self.session.id)
+        get_game_state_store().invalidate(self.session.id)
+
+    def test_event_stream_sends_snapshot_and_closes_when_finished(self):
+        create_players(self.session, 2)
+        self.session.status = 'finished'
+        self.session.ended_at = timezone.now()
+        self.session.save()
+
+        async def scenario():
+            response = await self.async_client.get(f'/api/sessions/{self.session.id}/events/')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            return [chunk async for chunk in response.streaming_content]
+
+        chunks = asyncio.run(scenario())
+        self.assertEqual(len(chunks), 1)
+        lines = chunks[0].decode().splitlines()
+        self.assertEqual(lines[0], 'event: state')
+        state = json.loads(lines[1][len('data: '):])
+        self.assertEqual(state['event'], 'connected')
+        self.assertEqual(state['status'], 'finished')
+        self.assertEqual(state['player_count'], 2)
+
+    def long_poll(self, since, timeout=5):
+        async def scenario():
+            return await asyncio.wait_for(
+                self.async_client.get(f'/api/sessions/{self.session.id}/game_state/', {'since': since}),
+                timeout=timeout
+            )
+        return asyncio.run(scenario())
+
+    def test_long_poll_answers_at_once_when_behind(self):
+        response = self.long_poll(since=-1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"0"')
+        self.assertEqual(response.json()['state_version'], 0)
+
+    def test_long_poll_wakes_on_change(self):
+        async def scenario():
+            parked = asyncio.create_task(
+                self.async_client.get(f'/api/sessions/{self.session.id}/game_state/', {'since': 0})
+            )
+            await asyncio.sleep(0.3)
+            self.assertFalse(parked.done())
+            await asyncio.to_thread(
+                APIClient().post, '/api/sessions/join/',
+                {'join_code': self.quiz.join_code, 'nickname': 'alice'}, format='json'
+            )
+            return await asyncio.wait_for(parked, timeout=5)
+
+        response = asyncio.run(scenario())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['state_version'], 1)
+        self.assertEqual(response.json()['player_count'], 1)
+
+    def test_long_poll_times_out_with_not_modified(self):
+        with mock.patch('quiz_api.streams.LONG_POLL_SECONDS', 0.2):
+            response = self.long_poll(since=0)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"0"')
+
+    def test_long_poll_delta(self):
+        create_players(self.session, 3)
+
+        async def scenario():
+            parked = asyncio.create_task(self.async_client.get(
+                f'/api/sessions/{self.session.id}/game_state/', {'since': 0, 'delta': 1}
+            ))
+            await asyncio.sleep(0.3)
+            await asyncio.to_thread(
+                APIClient().post, '/api/sessions/join/',
+                {'join_code': self.quiz.join_code, 'nickname': 'alice'}, format='json'
+            )
+            return await asyncio.wait_for(parked, timeout=5)
+
+        delta = asyncio.run(scenario()).json()
+        self.assertTrue(delta['delta'])
+        self.assertEqual((delta['since'], delta['state_version'], delta['player_count']), (0, 1, 4))
+        self.assertEqual([player['nickname'] for player in delta['players']], ['alice'])
+
+    def test_every_middleware_is_async_capable(self):
+        # A single sync-only middleware puts every request, parked ones too, in a thread
+        for path in settings.MIDDLEWARE:
+            self.assertTrue(getattr(import_string(path), 'async_capable', False), path)
+
+    def test_parked_long_polls_hold_no_thread(self):
+        async def scenario():
+            # The test client sends request signals on the loop's default
+            # executor; one thread, so its pool does not grow with the polls
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+            # Warm up, so the executor threads already exist
+            await self.async_client.get(f'/api/sessions/{self.session.id}/game_state/', {'since': -1})
+            threads_before = threading.active_count()
+            started = time.monotonic()
+            parked = [
+                asyncio.create_task(
+                    self.async_client.get(f'/api/sessions/{self.session.id}/game_state/', {'since': 0})
+                )
+                for _ in range(20)
+            ]
+            await asyncio.sleep(0.5)
+            threads_parked = threading.active_count()
+            self.assertFalse(any(task.done() for task in parked))
+            responses = await asyncio.wait_for(asyncio.gather(*parked), timeout=10)
+            return threads_before, threads_parked, time.monotonic() - started, responses
+
+        with mock.patch('quiz_api.streams.LONG_POLL_SECONDS', 1):
+            threads_before, threads_parked, elapsed, responses = asyncio.run(scenario())
+        self.assertLessEqual(threads_parked, threads_before)
+        self.assertEqual({response.status_code for response in responses}, {304})
+        # Parked side by side, not one after another
+        self.assertLess(elapsed, 5)
+
+    def test_game_state_without_since_is_not_parked(self):
+        response = APIClient().get(f'/api/sessions/{self.session.id}/game_state/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'waiting')
+        self.assertEqual(self.long_poll(since='abc').status_code, 400)
+
+    def test_event_stream_unknown_session(self):
+        async def scenario():
+            return await self.async_client.get('/api/sessions/999999/events/')
+
+        self.assertEqual(asyncio.run(scenario()).status_code, 404)
+
+
+class ConcurrentAnswerTests(TransactionTestCase):
+    def setUp(self):
+        get_game_state_store().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host, num_questions=1)
+        self.session = GameSession.objects.create(
+            quiz=self.quiz,
+            status='active',
+            started_at=timezone.now(),
+            question_started_at=timezone.now()
+        )
+
+    def test_simultaneous_answers_are_counted_once(self):
+        players = create_players(self.session, 500)
+        question = self.quiz.questions.get()
+
+        def submit(player):
+            try:
+                while True:
+                    try:
+                        response = APIClient().post(f'/api/players/{player.id}/submit_answer/', {
+                            'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 0.0
+                        }, format='json')
+                        return response.status_code
+                    except OperationalError:
+                        # The shared-cache SQLite test database reports lock
+                        # contention instead of waiting; retry like a client would
+                        continue
+            finally:
+                connections.close_all()
+
+        # Every player submits the same answer four times at once
+        request_logger = logging.getLogger('django.request')
+        request_logger.disabled = True
+        try:
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                codes = list(pool.map(submit, players * 4))
+        finally:
+            request_logger.disabled = False
+
+        self.assertEqual(set(codes), {200, 400})
+        self.assertEqual(PlayerAnswer.objects.count(), 500)
+        self.assertEqual(
+            set(Player.objects.values_list('score', 'answers_correct', 'answers_wrong')), {(150, 1, 0)}
+        )
+        stats = QuestionStats.objects.get(session=self.session, question=question)
+        self.assertEqual(
+            (stats.responses, stats.correct, stats.wrong_1, stats.wrong_2, stats.wrong_3), (500, 500, 0, 0, 0)
+        )
+
+    def test_same_player_answering_twice_at_once_keeps_fresh_score(self):
+        player = create_players(self.session, 1)[0]
+        first = self.quiz.questions.get()
+        second = Question.objects.create(
+            quiz=self.quiz, question_text='Question 1?', correct_answer='Right',
+            wrong_answers=['Wrong 1', 'Wrong 2', 'Wrong 3'], order=1
+        )
+        client = APIClient()
+        url = f'/api/players/{player.id}/submit_answer/'
+
+        def answer(question):
+            return client.post(url, {'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 0.0},
+                               format='json')
+
+        # The answer to the second question commits after the first one
+        # loaded the player and before it writes
+        overlapped = []
+        real_snapshot_question = snapshot_question
+
+        def snapshot_question_with_overlap(snapshot, question_id):
+            if question_id == first.id and not overlapped:
+                overlapped.append(answer(second))
+            return real_snapshot_question(snapshot, question_id)
+
+        with mock.patch('quiz_api.views.snapshot_question', snapshot_question_with_overlap):
+            response = answer(first)
+
+        self.assertEqual(overlapped[0].json()['total_score'], 150)
+        self.assertEqual(response.json()['total_score'], 300)
+        self.assertEqual(Player.objects.get(pk=player.pk).score, 300)
+        state = client.get(f'/api/sessions/{self.session.id}/game_state/').json()
+        self.assertEqual(
+            [(p['score'], p['answers_correct'], p['answers_wrong']) for p in state['players']], [(300, 2, 0)]
+        )
+
+    def test_add_answer_without_returning(self):
+        player = create_players(self.session, 1)[0]
+        Player.add_answer(player.pk, 150, True)
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            counters = Player.add_answer(player.pk, 0, False)
+        self.assertEqual(counters, {'score': 150, 'answers_correct': 1, 'answers_wrong': 1})
+
+
+class JoinStormTests(TransactionTestCase):
+    def setUp(self):
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+
+    def join_all(self, nicknames, workers=8):
+        """
+        Join every nickname from a pool of threads; returns each join's
+        status code and whether it had to be retried
+        """
+        def join(nickname):
+            retried = False
+            try:
+                while True:
+                    try:
+                        code = APIClient().post(
+                            '/api/sessions/join/', {'join_code': self.quiz.join_code, 'nickname': nickname}, format='json'
+                        ).status_code
+                        return code, retried
+                    except OperationalError:
+                        retried = True
+            finally:
+                connections.close_all()
+
+        request_logger = logging.getLogger('django.request')
+        request_logger.disabled = True
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(join, nicknames))
+        finally:
+            request_logger.disabled = False
+
+    def assertJoinedOnce(self, results, nicknames):
+        # The shared-cache SQLite test database can report a lock error for a
+        # join that went through, whose retry is then turned away: only the
+        # database tells whether every player got in, and only once
+        self.assertEqual({code for code, retried in results if not retried} - {201}, set())
+        self.assertEqual({code for code, retried in results if retried} - {201, 400}, set())
+        session = GameSession.objects.get(quiz=self.quiz)
+        joined = Counter(session.players.values_list('nickname', flat=True))
+        self.assertEqual(set(joined), set(nicknames))
+        self.assertEqual(set(joined.values()), {1})
+        self.assertEqual(session.players.count(), len(nicknames))
+        return session
+
+    def test_racing_first_joins_open_one_session(self):
+        nicknames = [f'player{idx}' for idx in range(40)]
+        self.assertJoinedOnce(self.join_all(nicknames, workers=16), nicknames)
+        self.assertEqual(GameSession.objects.filter(quiz=self.quiz).count(), 1)
+
+    def test_thousand_concurrent_joins(self):
+        nicknames = [f'player{idx}' for idx in range(1000)]
+        started = time.perf_counter()
+        results = self.join_all(nicknames)
+        elapsed = time.perf_counter() - started
+        logging.getLogger(__name__).info(f"⏱️ 1000 concurrent joins in {elapsed:.2f}s ({1000 / elapsed:.0f}/s)")
+
+        session = self.assertJoinedOnce(results, nicknames)
+        self.assertEqual(session.state_version, 1000)
+
+        # Taken nicknames are turned away by the unique constraint
+        self.assertEqual({code for code, _ in self.join_all(nicknames[::10], workers=1)}, {400})
+        self.assertEqual(session.players.count(), 1000)
+
+
+class LeaderboardTests(TestCase):
+    def player(self, player_id, score=0, is_active=True):
+        return {'id': player_id, 'score': score, 'joined_ts': float(player_id), 'is_active': is_active}
+
+    def test_updates_keep_leaderboard_order(self):
+        board = Leaderboard(self.player(player_id) for player_id in range(1, 11))
+        board.update(self.player(7, score=150))
+        board.update(self.player(3, score=150))
+        board.update(self.player(11))
+        board.update(self.player(5, is_active=False))
+
+        self.assertEqual(board.ids(0, 3), [3, 7, 1])
+        self.assertEqual(len(board), 10)
+        self.assertEqual(board.rank(11), 10)
+        self.assertIsNone(board.rank(5))
+        self.assertEqual(board.window(1, radius=2), (1, [3, 7, 1, 2, 4]))
+        self.assertEqual(board.window(11, radius=1), (9, [10, 11]))
+        self.assertEqual(board.window(99), (None, []))
+
+    def test_top_and_around_player_api(self):
+        get_game_state_store().clear()
+        host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        session = GameSession.objects.create(quiz=create_quiz(host), status='active', started_at=timezone.now())
+        players = create_players(session, 30)
+        for player in players[10:13]:
+            Player.objects.filter(pk=player.pk).update(score=player.id)
+
+        url = f'/api/sessions/{session.id}/leaderboard/'
+        data = APIClient().get(url, {'top': 3, 'around_player': players[20].id}).json()
+        self.assertEqual([p['id'] for p in data['leaderboard']], [players[12].id, players[11].id, players[10].id])
+        self.assertEqual(data['player_rank'], 21)
+        self.assertEqual([p['rank'] for p in data['around']], list(range(16, 27)))
+        self.assertEqual(data['total_players'], 30)
+
+        data = APIClient().get(url, {'around_player': players[0].id}).json()
+        self.assertNotIn('leaderboard', data)
+        self.assertEqual(data['around'][0]['rank'], 1)
+
+        self.assertEqual(APIClient().get(url, {'top': 0}).status_code, 400)
+
+
+class QuestionTimerTests(TestCase):
+    def setUp(self):
+        get_game_state_store().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host, num_questions=2)
+        self.session = self.start_session(self.quiz, seconds_ago=30)
+
+    def start_session(self, quiz, seconds_ago):
+        started = timezone.now() - timedelta(seconds=seconds_ago)
+        return GameSession.objects.create(
+            quiz=quiz, status='active', started_at=started, question_started_at=started
+        )
+
+    def test_expired_question_advances_exactly_once(self):
+        fresh = self.start_session(create_quiz(self.host), seconds_ago=0)
+        schedulers = [QuestionTimerScheduler(), QuestionTimerScheduler()]
+        for scheduler in schedulers:
+            self.assertEqual(scheduler.rescan(), 2)
+
+        due = [scheduler.pop_due(timezone.now()) for scheduler in schedulers]
+        self.assertEqual(due, [[(self.session.id, 0, 2)]] * 2)
+        self.assertEqual([schedulers[0].fire(*due[0][0]), schedulers[1].fire(*due[1][0])], [True, False])
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.current_question_index, 1)
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.current_question_index, 0)
+        self.assertAlmostEqual(schedulers[0].seconds_until_next(timezone.now()), 20, delta=1)
+
+    def test_last_question_finishes_session(self):
+        GameSession.objects.filter(pk=self.session.pk).update(current_question_index=1)
+        scheduler = QuestionTimerScheduler()
+        scheduler.rescan()
+        self.assertTrue(scheduler.fire(*scheduler.pop_due(timezone.now())[0]))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, 'finished')
+        self.assertIsNotNone(self.session.ended_at)
+
+    def test_rescan_picks_up_newly_started_questions_only(self):
+        scheduler = QuestionTimerScheduler()
+        scheduler.rescan()
+        scheduler.pop_due(timezone.now())
+        self.assertEqual(scheduler.rescan(), 0)
+
+        later = self.start_session(create_quiz(self.host), seconds_ago=0)
+        self.assertEqual(scheduler.rescan(), 1)
+        self.assertEqual(scheduler.pop_due(timezone.now() + timedelta(seconds=21)), [(later.id, 0, 3)])
+
+    def test_game_state_is_read_only(self):
+        response = APIClient().get(f'/api/sessions/{self.session.id}/game_state/')
+        self.assertEqual(response.json()['time_left'], 0)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.current_question_index, 0)
+
+    def test_stale_advance_loses(self):
+        stale = GameSession.objects.get(pk=self.session.pk)
+        self.assertTrue(advance_question(self.session, 2))
+        self.assertFalse(advance_question(stale, 2))
+        self.assertEqual(GameSession.objects.get(pk=self.session.pk).current_question_index, 1)
+
+
+class QuestionTimerLoopTests(TransactionTestCase):
+    def test_run_advances_session_without_pollers(self):
+        get_game_state_store().clear()
+        host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        quiz = create_quiz(host, num_questions=2)
+        Question.objects.filter(quiz=quiz).update(time_limit=1)
+        session = GameSession.objects.create(
+            quiz=quiz, status='active', started_at=timezone.now(), question_started_at=timezone.now()
+        )
+
+        async def scenario():
+            task = asyncio.create_task(QuestionTimerScheduler(rescan_interval=0.2).run())
+            try:
+                for _ in range(50):
+                    await asyncio.sleep(0.1)
+                    current = await GameSession.objects.aget(pk=session.pk)
+                    if current.status == 'finished':
+                        return current
+            finally:
+                task.cancel()
+
+        finished = asyncio.run(scenario())
+        self.assertEqual(finished.current_question_index, 2)
+
+
+class QuizGenerationJobTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+        self.ai_questions = [
+            {'question': f'Question {idx}?', 'correct_answer': 'Right', 'wrong_answers': ['A', 'B', 'C']}
+            for idx in range(5)
+        ]
+        self.streaming = False
+
+    def create_job(self):
+        with mock.patch('quiz_api.jobs.generation_runner.submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/quizzes/create_with_ai/', {
+                    'title': 'Space Quiz', 'topic': 'Space', 'difficulty': 'easy'
+                }, format='json')
+        self.assertEqual(response.status_code, 202)
+        submit.assert_called_once_with(response.data['job_id'])
+        return QuizGenerationJob.objects.get(pk=response.data['job_id'])
+
+    def generation_status(self, job):
+        return self.client.get(f'/api/quizzes/{job.quiz_id}/generation_status/').json()
+
+    def stream_questions(self, **kwargs):
+        """Yield the AI questions, checking each earlier one is already visible when streaming"""
+        for idx, question in enumerate(self.ai_questions):
+            if self.streaming:
+                data = self.generation_status(QuizGenerationJob.objects.get(status='running'))
+                self.assertEqual(len(data.get('questions', [])), idx)
+                self.assertEqual(data['questions_created'], idx)
+            yield question
+
+    def test_create_with_ai_returns_before_generating(self):
+        with mock.patch('quiz_api.jobs.QuizAIService') as service:
+            job = self.create_job()
+        service.assert_not_called()
+        self.assertEqual(job.status, 'pending')
+        self.assertFalse(job.quiz.questions.exists())
+        self.assertEqual(self.generation_status(job)['status'], 'pending')
+
+    def test_job_generates_questions_exactly_once(self):
+        job = self.create_job()
+        self.streaming = True
+        with mock.patch('quiz_api.jobs.QuizAIService') as service, \
+                mock.patch('quiz_api.jobs.STREAM_FLUSH_SECONDS', 0):
+            service.return_value.iter_quiz_questions.side_effect = self.stream_questions
+            self.assertTrue(run_generation_job(job.id))
+            self.assertFalse(run_generation_job(job.id))
+        service.return_value.iter_quiz_questions.assert_called_once_with(
+            topic='Space', difficulty='easy', num_questions=5
+        )
+
+        data = self.generation_status(job)
+        self.assertEqual(data['status'], 'completed')
+        self.assertEqual(data['questions_created'], 5)
+        self.assertEqual([q['order'] for q in data['quiz']['questions']], list(range(5)))
+
+    def test_questions_arriving_together_are_batched(self):
+        job = self.create_job()
+        with mock.patch('quiz_api.jobs.QuizAIService') as service, CaptureQueriesContext(connection) as queries:
+            service.return_value.iter_quiz_questions.side_effect = self.stream_questions
+            run_generation_job(job.id)
+
+        inserts = [query for query in queries.captured_queries if 'INSERT INTO "quiz_api_question"' in query['sql']]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(self.generation_status(job)['questions_created'], 5)
+
+    def test_failed_job_keeps_questions_written_before_the_error(self):
+        job = self.create_job()
+        self.ai_questions[3] = {'question': 'Broken?'}
+        with mock.patch('quiz_api.jobs.QuizAIService') as service:
+            service.return_value.iter_quiz_questions.side_effect = self.stream_questions
+            run_generation_job(job.id)
+
+        data = self.generation_status(job)
+        self.assertEqual(data['status'], 'failed')
+        self.assertIn('correct_answer', data['error'])
+        self.assertNotIn('quiz', data)
+        self.assertEqual(data['questions_created'], 3)
+        self.assertEqual([q['question_text'] for q in data['questions']], [f'Question {idx}?' for idx in range(3)])
+
+    def test_drain_runs_pending_and_orphaned_jobs(self):
+        pending, orphaned = self.create_job(), self.create_job()
+        QuizGenerationJob.objects.filter(pk=orphaned.pk).update(
+            status='running', started_at=timezone.now() - timedelta(hours=1)
+        )
+        with mock.patch('quiz_api.jobs.QuizAIService') as service, \
+                mock.patch('quiz_api.jobs.close_old_connections'):
+            service.return_value.iter_quiz_questions.side_effect = self.stream_questions
+            self.assertEqual(GenerationJobRunner().drain(), 2)
+
+        for job in (pending, orphaned):
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'completed')
+
+    def test_create_with_ai_takes_question_count(self):
+        url = '/api/quizzes/create_with_ai/'
+        data = {'title': 'Space Quiz', 'topic': 'Space', 'difficulty': 'easy', 'num_questions': 51}
+        self.assertEqual(self.client.post(url, data, format='json').status_code, 400)
+
+        with mock.patch('quiz_api.jobs.generation_runner.submit'):
+            response = self.client.post(url, dict(data, num_questions=30), format='json')
+        self.assertEqual(response.data['num_questions'], 30)
+
+    def test_quiz_without_job(self):
+        quiz = create_quiz(self.host)
+        response = self.client.get(f'/api/quizzes/{quiz.id}/generation_status/')
+        self.assertEqual(response.status_code, 404)
+
+
+class PooledHTTPClientTests(TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.client = PooledHTTPClient(max_retries=2, sleep=self.sleeps.append)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_connections_are_kept_alive(self):
+        with StandInServer([(200, {}, {'ok': True}, 0)]) as server:
+            for _ in range(3):
+                self.assertEqual(self.client.post(server.url, json={}).json(), {'ok': True})
+        self.assertEqual(len(server.ports), 3)
+        self.assertEqual(len(set(server.ports)), 1)
+        self.assertEqual(self.client.metrics.snapshot()['attempts'], 3)
+
+    def test_retries_back_off_and_honor_retry_after(self):
+        script = [(429, {'Retry-After': '2'}, {}, 0), (503, {}, {}, 0), (200, {}, {'ok': True}, 0)]
+        with StandInServer(script) as server:
+            response = self.client.post(server.url, json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertGreaterEqual(self.sleeps[0], 2)
+        self.assertLessEqual(self.sleeps[1], self.client.backoff_base * 2)
+
+        metrics = self.client.metrics.snapshot()
+        self.assertEqual(metrics['outcomes'], {'429': 1, '503': 1, '200': 1})
+        self.assertEqual(metrics['retries'], 2)
+        self.assertEqual([attempt['attempt'] for attempt in metrics['recent']], [1, 2, 3])
+
+    def test_gives_up_after_max_retries(self):
+        with StandInServer([(500, {}, {}, 0)]) as server:
+            response = self.client.post(server.url, json={})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(server.ports), 3)
+
+    def test_timeouts_are_retried(self):
+        with StandInServer([(200, {}, {}, 0.5), (200, {}, {'ok': True}, 0)]) as server:
+            response = self.client.post(server.url, json={}, timeout=0.2)
+        self.assertEqual(response.json(), {'ok': True})
+        self.assertEqual(self.client.metrics.snapshot()['outcomes'], {'ReadTimeout': 1, '200': 1})
+
+    def test_streamed_response_holds_its_slot_until_closed(self):
+        client = PooledHTTPClient(max_concurrency=1, max_retries=0)
+        self.addCleanup(client.close)
+        with StandInServer([(200, {}, ['{"n": 1}', '{"n": 2}'], 0.05)]) as server:
+            first = client.post(server.url, json={}, stream=True)
+            next(first.iter_lines())
+
+            second = ThreadPoolExecutor(max_workers=1)
+            self.addCleanup(second.shutdown)
+            pending = second.submit(client.post, server.url, json={}, stream=True)
+            time.sleep(0.3)
+            # The first body is still being read, so the second waits for the slot
+            self.assertFalse(pending.done())
+
+            first.close()
+            with pending.result(timeout=5) as response:
+                self.assertEqual(list(response.iter_lines()), [b'data: {"n": 1}', b'', b'data: {"n": 2}', b''])
+            first.close()
+        # Both slots are back, and closing twice released only one
+        self.assertTrue(client._slots.acquire(blocking=False))
+        self.assertFalse(client._slots.acquire(blocking=False))
+
+    def test_backoff_bounds(self):
+        for attempt in range(1, 10):
+            self.assertLessEqual(self.client.backoff(attempt), self.client.backoff_cap)
+        self.assertEqual(self.client.backoff(1, retry_after=100), self.client.max_retry_after)
+        self.assertEqual(parse_retry_after('7'), 7)
+        self.assertIsNone(parse_retry_after('soon'))
+        retry_at = timezone.now() + timedelta(seconds=60)
+        self.assertAlmostEqual(
+            parse_retry_after(retry_at.strftime('%a, %d %b %Y %H:%M:%S GMT')), 60, delta=2
+        )
+
+    @override_settings(AI_HTTP_BACKOFF_BASE=0.01)
+    def test_ai_service_retries_rate_limits_instead_of_falling_back(self):
+        get_question_cache().clear()
+        questions = [{'question': 'Q?', 'correct_answer': 'A', 'wrong_answers': ['B', 'C', 'D']}]
+        completion = {'choices': [{'message': {'content': json.dumps(questions)}}]}
+        with mock.patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test-key'}), \
+                StandInServer([(429, {}, {}, 0), (200, {}, completion, 0)]) as server:
+            service = QuizAIService()
+            service.base_url = server.url
+            self.assertEqual(service.generate_quiz_questions('Space', num_questions=1), questions)
+        self.assertEqual(len(server.ports), 2)
+
+
+class QuestionSetCacheTests(TestCase):
+    def setUp(self):
+        self.cache = QuestionSetCache(max_entries=2, ttl=60)
+        self.sets = [
+            [{'question': f'Set {idx}?', 'correct_answer': 'A', 'wrong_answers': ['B', 'C', 'D']}]
+            for idx in range(3)
+        ]
+
+    def key(self, topic, difficulty='easy'):
+        return question_set_key(topic, difficulty, 5, 'model', 1)
+
+    def test_keys_ignore_topic_case_and_spacing(self):
+        self.assertEqual(self.key('Solar  System'), self.key(' solar system '))
+        self.assertNotEqual(self.key('Solar System'), self.key('Solar System', 'hard'))
+
+    def test_memory_then_database_tier(self):
+        key = self.key('Space')
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, self.sets[0], topic='Space')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.get(key), self.sets[0])
+
+        other_process = QuestionSetCache()
+        self.assertEqual(other_process.get(key), self.sets[0])
+        self.assertEqual(self.cache.stats(), {'misses': 1, 'stores': 1, 'memory_hits': 1, 'entries': 1})
+        self.assertEqual(other_process.stats(), {'db_hits': 1, 'entries': 1})
+
+    def test_entries_expire(self):
+        key = self.key('Space')
+        self.cache.put(key, self.sets[0])
+        later = timezone.now() + timedelta(seconds=61)
+        with mock.patch('quiz_api.question_cache.timezone.now', return_value=later):
+            self.assertIsNone(self.cache.get(key))
+            self.cache.put(key, self.sets[1])
+        self.assertEqual(GeneratedQuestionSet.objects.get(key=key).questions, self.sets[1])
+
+    def test_memory_tier_is_bounded(self):
+        keys = [self.key(topic) for topic in ('Space', 'Oceans', 'Music')]
+        for key, questions in zip(keys, self.sets):
+            self.cache.put(key, questions)
+        self.assertEqual(self.cache.stats()['entries'], 2)
+        self.assertEqual(self.cache.get(keys[0]), self.sets[0])
+        self.assertEqual(self.cache.stats()['db_hits'], 1)
+
+    def test_variants_rotate_between_callers(self):
+        key = self.key('Space')
+        for questions in self.sets[:2]:
+            self.assertIsNone(self.cache.get(key, variants=2))
+            self.cache.put(key, questions, variants=2)
+        served = [self.cache.get(key, variants=2) for _ in range(4)]
+        self.assertEqual(served, [self.sets[0], self.sets[1], self.sets[0], self.sets[1]])
+        self.assertEqual(GeneratedQuestionSet.objects.filter(key=key).count(), 2)
+
+    @override_settings(AI_HTTP_BACKOFF_BASE=0.01, AI_HTTP_MAX_RETRIES=0)
+    def test_ai_service_caches_generated_questions_only(self):
+        get_question_cache().clear()
+        completion = {'choices': [{'message': {'content': json.dumps(self.sets[0])}}]}
+        with mock.patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test-key'}):
+            service = QuizAIService()
+            with StandInServer([(500, {}, {}, 0), (200, {}, completion, 0)]) as server:
+                service.base_url = server.url
+                fallback = service.generate_quiz_questions('Space', num_questions=1)
+                generated = service.generate_quiz_questions('Space', num_questions=1)
+                cached = service.generate_quiz_questions(' SPACE', num_questions=1)
+
+        self.assertNotEqual(fallback, self.sets[0])
+        self.assertEqual(generated, self.sets[0])
+        self.assertEqual(cached, self.sets[0])
+        self.assertEqual(len(server.ports), 2)
+        self.assertEqual(get_question_cache().stats()['stores'], 1)
+
+
+@override_settings(AI_HTTP_MAX_RETRIES=0)
+class ChunkedGenerationTests(TestCase):
+    def setUp(self):
+        get_question_cache().clear()
+
+    @staticmethod
+    def complete(request):
+        """Answer a chunk with questions about its focus; the 'numbers' chunk fails"""
+        prompt = request['messages'][1]['content']
+        count = int(re.search(r'Create exactly (\d+)', prompt).group(1))
+        focus = re.search(r'FOCUS: Only ask about the (.+) of', prompt).group(1)
+        if 'numbers' in focus:
+            return 500, {}, {}, 0.5
+
+        questions = [{'question': 'What is  space?', 'correct_answer': 'A', 'wrong_answers': ['B', 'C', 'D']}]
+        questions += [
+            {'question': f'{focus} question {idx}?', 'correct_answer': 'A', 'wrong_answers': ['B', 'C', 'D']}
+            for idx in range(1, count)
+        ]
+        return 200, {}, {'choices': [{'message': {'content': json.dumps(questions)}}]}, 0.5
+
+    def test_large_quiz_is_generated_in_concurrent_chunks(self):
+        with mock.patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test-key'}), \
+                StandInServer(self.complete) as server:
+            service = QuizAIService()
+            service.base_url = server.url
+            started = time.monotonic()
+            questions = service.generate_quiz_questions('Space', num_questions=20)
+            elapsed = time.monotonic() - started
+
+        # Three chunks of 7, 7 and 6 (plus a spare each), answered side by side
+        self.assertEqual(len(server.ports), 3)
+        self.assertLess(elapsed, 1.2)
+
+        # The failed chunk is skipped and the duplicate kept once, in chunk order
+        texts = [question['question'] for question in questions]
+        self.assertEqual(len(texts), 15)
+        self.assertEqual(texts[0], 'What is  space?')
+        self.assertEqual(texts[1:8], [f'history and origins question {idx}?' for idx in range(1, 8)])
+        self.assertTrue(all(text.startswith('key people') for text in texts[8:]))
+
+        # A short set is not cached
+        self.assertNotIn('stores', get_question_cache().stats())
+
+    def test_small_quiz_is_one_request(self):
+        with mock.patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test-key'}), \
+                mock.patch.object(QuizAIService, '_request_questions', return_value=[]) as request, \
+                self.assertRaises(AIServiceError):
+            QuizAIService().generate_quiz_questions('Space', num_questions=8)
+        request.assert_called_once_with('Space', 'medium', 8)
+
+    def test_sample_questions_only_stand_in_for_as_many(self):
+        with mock.patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test-key'}), \
+                mock.patch.object(QuizAIService, '_request_questions', side_effect=AIServiceError('down')):
+            self.assertEqual(len(QuizAIService().generate_quiz_questions('Space', num_questions=5)), 5)
+            with self.assertRaisesMessage(AIServiceError, 'cannot stand in for 20'):
+                QuizAIService().generate_quiz_questions('Space', num_questions=20)
+
+
+class StreamingGenerationTests(TestCase):
+    def setUp(self):
+        get_question_cache().clear()
+        self.questions = [
+            {'question': 'Which {planet} is "red"?', 'correct_answer': 'Mars', 'wrong_answers': ['[Venus]', 'Earth', 'Pluto\\']},
+            {'question': 'Largest moon?', 'correct_answer': 'Ganymede', 'wrong_answers': ['Titan', 'Io', 'Europa']},
+            {'question': 'Broken?'},
+            {'question': 'Closest star?', 'correct_answer': 'The Sun', 'wrong_answers': ['Sirius', 'Vega', 'Rigel']},
+        ]
+
+    def completion_events(self, text, piece=7):
+        """SSE data payloads delivering ``text`` a few characters at a time, as OpenRouter does"""
+        events = [': OPENROUTER PROCESSING']
+        events += [
+            json.dumps({'choices': [{'delta': {'content': text[idx:idx + piece]}}]})
+            for idx in range(0, len(text), piece)
+        ]
+        return events + ['[DONE]']
+
+    def test_parser_returns_objects_as_they_close(self):
+        text = '```json\n' + json.dumps(self.questions, indent=2) + '\n```'
+        parser = QuestionStreamParser()
+        closed_at = []
+        for idx in range(len(text)):
+            for question in parser.feed(text[idx]):
+                closed_at.append((idx, question))
+
+        self.assertEqual([question for _, question in closed_at], self.questions)
+        for (idx, question), end in zip(closed_at, [text.index('"Pluto'), text.index('Europa')]):
+            self.assertGreater(idx, end)
+        self.assertLess(closed_at[0][0], text.index('Largest'))
+
+    @override_settings(AI_HTTP_MAX_RETRIES=0)
+    def test_streamed_questions_arrive_before_the_completion_ends(self):
+        events = self.completion_events(json.dumps(self.questions))
+        with mock.patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test-key'}), \
+                StandInServer([(200, {}, events, 0.02)]) as server:
+            service = QuizAIService()
+            service.base_url = server.url
+            started = time.monotonic()
+            arrivals = [
+                (time.monotonic() - started, question)
+                for question in service.iter_quiz_questions('Space', num_questions=4)
+            ]
+
+        valid = [self.questions[0], self.questions[1], self.questions[3]]
+        self.assertEqual([question for _, question in arrivals], valid)
+        self.assertLess(arrivals[0][0], arrivals[-1][0] - 0.2)
+        # Three of four questions is short of the request, so it is not cached
+        self.assertNotIn('stores', get_question_cache().stats())
+
+    @override_settings(AI_HTTP_MAX_RETRIES=0)
+    def test_failed_stream_keeps_streamed_questions(self):
+        events = self.completion_events(json.dumps(self.questions[:2])[:-30])
+        events.insert(-1, json.dumps({'error': {'message': 'Provider disconnected'}}))
+        with mock.patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test-key'}), \
+                StandInServer([(200, {}, events, 0)]) as server:
+            service = QuizAIService()
+            service.base_url = server.url
+            self.assertEqual(list(service.iter_quiz_questions('Space', num_questions=2)), self.questions[:1])
+
+            # Nothing streamed at all falls back to the sample questions
+            server.script = [(503, {}, {}, 0)]
+            fallback = list(service.iter_quiz_questions('Space', num_questions=2))
+        self.assertEqual(len(fallback), 5)
+
+
+class QuizMaterializationTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    @staticmethod
+    def question(idx):
+        return {'question': f'Question {idx}?', 'correct_answer': 'Right', 'wrong_answers': ['A', 'B', 'C']}
+
+    def test_materialize_quiz_inserts_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            quiz = materialize_quiz(
+                self.host, 'Big Quiz', 'Space', 'hard', (self.question(idx) for idx in range(1200))
+            )
+        # A few multi-row INSERTs (SQLite caps the rows per statement) instead of 1200
+        inserts = [query for query in queries.captured_queries if 'INSERT INTO "quiz_api_question"' in query['sql']]
+        self.assertLessEqual(len(inserts), 12)
+        self.assertEqual(list(quiz.questions.values_list('order', flat=True)), list(range(1200)))
+
+    def test_import_is_streamed_in_bounded_batches(self):
+        quiz = create_quiz(self.host, num_questions=2)
+        lines = (json.dumps(self.question(idx)) + '\n' for idx in range(2 * BATCH_SIZE + 10))
+        batches = []
+        real_bulk_create = Question.objects.bulk_create
+
+        def spy(objs, **kwargs):
+            batches.append(len(objs))
+            return real_bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Question.objects, 'bulk_create', side_effect=spy):
+            result = import_questions(quiz, iter_ndjson(lines))
+
+        self.assertEqual(batches, [BATCH_SIZE, BATCH_SIZE, 10])
+        self.assertEqual(result, {'imported': 2 * BATCH_SIZE + 10, 'skipped': 0, 'errors': []})
+        self.assertEqual(quiz.questions.order_by('order').last().order, 2 * BATCH_SIZE + 11)
+
+    def test_ndjson_import_endpoint_reports_bad_lines(self):
+        quiz = create_quiz(self.host, num_questions=1)
+        body = '\n'.join([
+            json.dumps(self.question(1)),
+            '',
+            '{not json',
+            json.dumps({'question': 'Short?', 'correct_answer': 'A', 'wrong_answers': ['B']}),
+            json.dumps(dict(self.question(2), time_limit=45)),
+        ])
+        response = self.client.post(
+            f'/api/quizzes/{quiz.id}/import_questions/', body, content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(response.data['skipped'], 2)
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4])
+        self.assertEqual(response.data['question_count'], 3)
+        self.assertEqual(quiz.questions.get(order=2).time_limit, 45)
+
+    def test_csv_import_endpoint(self):
+        quiz = create_quiz(self.host, num_questions=0)
+        body = (
+            'question,correct_answer,wrong_answer_1,wrong_answer_2,wrong_answer_3,time_limit\r\n'
+            '"Which planet,\nexactly?",Mars,Venus,Earth,Pluto,30\r\n'
+            'Missing answers?,Yes,No,,,\r\n'
+            'Largest moon?,Ganymede,Titan,Io,Europa,\r\n'
+        )
+        response = self.client.post(f'/api/quizzes/{quiz.id}/import_questions/', body, content_type='text/csv')
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(response.data['errors'], [{'line': 4, 'error': 'Question needs exactly 3 wrong_answers'}])
+        self.assertEqual(
+            list(quiz.questions.values_list('question_text', 'time_limit')),
+            [('Which planet,\nexactly?', 30), ('Largest moon?', 20)]
+        )
+
+    def test_import_needs_a_supported_format_and_own_quiz(self):
+        quiz = create_quiz(self.host)
+        url = f'/api/quizzes/{quiz.id}/import_questions/'
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, 415)
+
+        other = User.objects.create_user(username='other', email='other@example.com', password='pw')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.post(url, '', content_type='text/csv').status_code, 404)
+
+
+class QuestionBankTests(TestCase):
+    def setUp(self):
+        get_question_bank().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    @staticmethod
+    def question(text, answer='Mars'):
+        return {'question': text, 'correct_answer': answer, 'wrong_answers': ['A', 'B', 'C']}
+
+    def test_near_duplicates_are_rejected(self):
+        bank = QuestionBank()
+        banked, skipped = bank.add([
+            self.question('Which planet is known as the Red Planet?'),
+            self.question('Which planet is commonly known as the Red Planet?'),
+            self.question('which planet is known as the red planet'),
+            self.question('Which planet is known as the Blue Planet?', 'Earth'),
+        ], 'Space')
+        self.assertEqual((banked, skipped), (2, 2))
+
+        # Another process sees the banked rows on its next lookup
+        other_process = QuestionBank()
+        self.assertIsNotNone(other_process.find_duplicate(self.question('Which planet is known as the Red Planet?', 'Venus')))
+        self.assertIsNone(other_process.find_duplicate(self.question('What is the largest planet?', 'Jupiter')))
+        self.assertEqual(other_process.add([self.question('Which planet is known as the red planet!?')], 'Space'), (0, 1))
+        self.assertEqual(BankQuestion.objects.count(), 2)
+
+    def test_lookups_refresh_on_a_timer(self):
+        bank = QuestionBank(refresh_interval=60)
+        red_planet = self.question('Which planet is known as the Red Planet?')
+        with self.assertNumQueries(1):
+            self.assertIsNone(bank.find_duplicate(red_planet))
+        QuestionBank().add([red_planet], 'Space')
+
+        # Banked elsewhere: unseen until the interval is up, then loaded in one query
+        with self.assertNumQueries(0):
+            self.assertIsNone(bank.find_duplicate(red_planet))
+        with mock.patch('quiz_api.question_bank.time.monotonic', return_value=time.monotonic() + 61), \
+                self.assertNumQueries(1):
+            self.assertIsNotNone(bank.find_duplicate(red_planet))
+
+        # Banking always looks first
+        blue_planet = self.question('Which planet is known as the Blue Planet?', 'Earth')
+        QuestionBank().add([blue_planet], 'Space')
+        self.assertEqual(bank.add([blue_planet], 'Space'), (0, 1))
+
+    def test_lookups_take_under_a_millisecond(self):
+        rng = random.Random(1)
+        words = [f'{rng.choice("bcdfgklmnprst")}{rng.choice("aeiou")}{rng.choice("lmnrst")}{idx}' for idx in range(3000)]
+        texts = [bank_text(self.question(' '.join(rng.sample(words, 8)) + '?', rng.choice(words))) for _ in range(2000)]
+        index = NearDuplicateIndex()
+        for idx, text in enumerate(texts):
+            index.add(idx, text)
+
+        # Reworded probes: the last word of the question changed
+        probes = [(idx, text.replace(' |', 'x |')) for idx, text in enumerate(texts[::10])]
+        signatures = [minhash(text) for _, text in probes]
+        started = time.perf_counter()
+        found = [index.find(text, signature) for (_, text), signature in zip(probes, signatures)]
+        per_lookup = (time.perf_counter() - started) / len(probes)
+
+        self.assertEqual([match[0] if match else None for match in found], [idx * 10 for idx, _ in probes])
+        self.assertLess(per_lookup, 0.001)
+
+    def test_generation_job_banks_questions_without_near_duplicates(self):
+        quiz = Quiz.objects.create(host=self.host, title='Space Quiz', topic='Space')
+        job = QuizGenerationJob.objects.create(quiz=quiz)
+        generated = [
+            self.question('Which planet is known as the Red Planet?'),
+            self.question('Which planet is commonly known as the Red Planet?'),
+            self.question('What is the largest planet?', 'Jupiter'),
+        ]
+        with mock.patch('quiz_api.jobs.QuizAIService') as service:
+            service.return_value.iter_quiz_questions.return_value = iter(generated)
+            run_generation_job(job.id)
+
+        self.assertEqual(quiz.questions.count(), 2)
+        self.assertEqual(
+            set(BankQuestion.objects.values_list('topic', 'created_by')), {('space', self.host.id)}
+        )
+        self.assertEqual(BankQuestion.objects.count(), 2)
+
+    def test_quiz_assembled_from_bank_without_ai(self):
+        moons = ['Phobos', 'Ganymede', 'Titan', 'Triton', 'Charon', 'Io']
+        get_question_bank().add(
+            [self.question(f'{moon} orbits which body?', moon[::-1]) for moon in moons], ' SPACE', 'easy'
+        )
+        BankQuestion.objects.filter(question_text__startswith='Phobos').update(times_used=5)
+
+        url = '/api/quizzes/from_bank/'
+        with mock.patch('quiz_api.ai_service.QuizAIService') as service:
+            response = self.client.post(url, {
+                'title': 'Bank Quiz', 'topic': 'space', 'difficulty': 'easy', 'num_questions': 5
+            }, format='json')
+        service.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['question_count'], 5)
+        self.assertNotIn('Phobos orbits which body?', [q['question_text'] for q in response.data['questions']])
+        self.assertEqual(BankQuestion.objects.filter(times_used=1).count(), 5)
+
+        response = self.client.post(url, {'title': 'Empty', 'topic': 'Oceans'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class JoinCodeTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def create_quiz(self, **kwargs):
+        return Quiz.objects.create(host=self.host, title='Quiz', topic='Space', **kwargs)
+
+    def test_codes_are_a_keyed_shuffle_of_the_code_space(self):
+        rng = random.Random(1)
+        sample = [rng.randrange(CODE_SPACE) for _ in range(2000)] + [0, CODE_SPACE - 1]
+        for index in sample:
+            self.assertEqual(unpermute(permute(index)), index)
+
+        codes = {code_for_index(index) for index in range(1, 5001)}
+        self.assertEqual(len(codes), 5000)
+        self.assertTrue(all(re.fullmatch(r'[A-Z0-9]{6}', code) for code in codes))
+        self.assertNotEqual(code_for_index(1, 'one key'), code_for_index(1, 'another key'))
+
+    def test_new_quizzes_get_codes_without_probing(self):
+        with CaptureQueriesContext(connection) as queries:
+            quizzes = [self.create_quiz() for _ in range(20)]
+
+        self.assertEqual([quiz.join_code for quiz in quizzes], [code_for_index(quiz.pk) for quiz in quizzes])
+        probes = [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'join_code' in query['sql']]
+        self.assertEqual(probes, [])
+
+    def test_taken_code_falls_back_to_a_free_one(self):
+        legacy = self.create_quiz(join_code='AAAAAA')
+        # A legacy random code that happens to be the next quiz's shuffled code
+        legacy.join_code = code_for_index(legacy.pk + 1)
+        legacy.save()
+
+        quiz = self.create_quiz()
+        self.assertEqual(quiz.pk, legacy.pk + 1)
+        self.assertIsNotNone(quiz.join_code)
+        self.assertNotEqual(quiz.join_code, legacy.join_code)
+
+    def test_deactivated_quiz_codes_are_recycled_after_the_delay(self):
+        quiz = self.create_quiz()
+        code = quiz.join_code
+
+        response = self.client.post(f'/api/quizzes/{quiz.id}/deactivate/')
+        self.assertEqual(response.status_code, 200)
+        quiz.refresh_from_db()
+        self.assertIsNone(quiz.join_code)
+        self.assertTrue(RecycledJoinCode.objects.filter(code=code).exists())
+
+        # Still quarantined: new quizzes get fresh codes
+        self.assertNotEqual(self.create_quiz().join_code, code)
+
+        RecycledJoinCode.objects.filter(code=code).update(available_at=timezone.now())
+        with override_settings(JOIN_CODE_RECYCLE_DELAY=0):
+            self.assertEqual(self.create_quiz().join_code, code)
+            self.assertFalse(RecycledJoinCode.objects.exists())
+
+            deleted = self.create_quiz()
+            deleted_code = deleted.join_code
+            deleted.delete()
+            self.assertEqual(self.create_quiz().join_code, deleted_code)
+
+    def test_reactivation_with_update_fields_saves_the_new_code(self):
+        quiz = self.create_quiz()
+        code = quiz.join_code
+        quiz.deactivate()
+        RecycledJoinCode.objects.filter(code=code).update(available_at=timezone.now())
+
+        # A recycled code is saved along with the fields asked for
+        quiz.is_active = True
+        with override_settings(JOIN_CODE_RECYCLE_DELAY=0):
+            quiz.save(update_fields=['is_active'])
+        self.assertEqual(quiz.join_code, code)
+        self.assertEqual(Quiz.objects.get(pk=quiz.pk).join_code, code)
+
+    def test_start_session_reuses_only_a_waiting_session(self):
+        quiz = create_quiz(self.host)
+        url = f'/api/quizzes/{quiz.id}/start_session/'
+        session_id = self.client.post(url).json()['id']
+        self.assertEqual(self.client.post(url).json()['id'], session_id)
+
+        GameSession.objects.filter(pk=session_id).update(status='active', started_at=timezone.now())
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['session_id'], session_id)
+        self.assertEqual(GameSession.objects.filter(quiz=quiz).count(), 1)
+
+    def test_join_from_cache_rejects_quiz_deactivated_elsewhere(self):
+        get_join_code_resolver().clear()
+        quiz = create_quiz(self.host)
+        join = {'join_code': quiz.join_code, 'nickname': 'early'}
+        self.assertEqual(APIClient().post('/api/sessions/join/', join, format='json').status_code, 201)
+
+        # Deactivated by another process, whose resolver.forget never reaches this one
+        Quiz.objects.filter(pk=quiz.pk).update(is_active=False)
+        response = APIClient().post('/api/sessions/join/', dict(join, nickname='late'), format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Player.objects.filter(nickname='late').exists())
+
+    def test_benchmark_command_reports_each_size(self):
+        out = StringIO()
+        call_command('benchmark_join_codes', sizes=[10, 60], sample=5, stdout=out)
+        rows = out.getvalue().splitlines()[1:]
+        self.assertEqual([int(row.split()[0]) for row in rows], [15, 65])
+        self.assertEqual(Quiz.objects.count(), 0)
+
+
+class SerialLiveServerThread(LiveServerThread):
+    """
+    A live server answering one request at a time. The threaded one shares
+    the in-memory SQLite test connection between its request threads,
+    which breaks under concurrent writes.
+    """
+
+    def _create_server(self, connections_override=None):
+        return WSGIServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+    server_thread_class = SerialLiveServerThread
+
+    def setUp(self):
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        get_question_cache().clear()
+        self.stand_in = AIStandIn().start()
+        self.addCleanup(self.stand_in.stop)
+        # Generate on the server thread: a pool thread writing alongside it
+        # locks the shared in-memory test database
+        patcher = mock.patch('quiz_api.jobs.generation_runner.submit', side_effect=GenerationJobRunner.run)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_load(self, **options):
+        out = StringIO()
+        with mock.patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test-key'}), \
+                override_settings(OPENROUTER_API_URL=self.stand_in.url):
+            call_command(
+                'load_test', base_url=self.live_server_url, think_time=0, poll_interval=0.05, stdout=out, **options
+            )
+        return out.getvalue()
+
+    def test_games_are_played_to_the_end(self):
+        output = self.run_load(hosts=2, players=4, questions=3)
+        self.assertIn('2/2 games', output)
+        for endpoint in [
+            'POST /api/auth/login/', 'POST /api/quizzes/create_with_ai/', 'POST /api/sessions/join/',
+            'GET /api/sessions/{id}/game_state/', 'POST /api/players/{id}/submit_answer/',
+            'POST /api/sessions/{id}/next_question/',
+        ]:
+            self.assertIn(endpoint, output)
+        self.assertGreater(self.stand_in.requests, 0)
+        self.assertEqual(GameSession.objects.filter(status='finished').count(), 2)
+        self.assertEqual(PlayerAnswer.objects.count(), 2 * 4 * 3)
+
+    def test_long_poll_mode(self):
+        # Parked requests hold the serial live server, so keep them short
+        with mock.patch('quiz_api.streams.LONG_POLL_SECONDS', 0.2):
+            output = self.run_load(hosts=1, players=2, questions=2, mode='long-poll')
+        self.assertIn('1/1 games', output)
+        self.assertIn('GET /api/sessions/{id}/game_state/?since', output)
+
+    def test_failed_games_fail_the_command(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            closed_port = sock.getsockname()[1]
+        with self.assertRaisesMessage(CommandError, '1 of 1 games did not finish'):
+            call_command('load_test', base_url=f'http://127.0.0.1:{closed_port}', players=1, stdout=StringIO())
+
+    def test_event_stream_client(self):
+        states = [{'state_version': 1}, {'state_version': 2, 'status': 'finished'}]
+        stats = LatencyStats()
+
+        async def follow(url):
+            client = AsyncHTTPClient(url, stats, timeout=5)
+            return [state async for state in client.events('/events/', 'GET /events/')]
+
+        with StandInServer([(200, {}, [json.dumps(states[0]), ': keepalive', json.dumps(states[1])], 0)]) as server:
+            received = asyncio.run(follow(server.url.rsplit('/chat', 1)[0]))
+        self.assertEqual(received, [states[0], None, states[1]])
+        self.assertEqual([(row['endpoint'], row['errors']) for row in stats.report(1)], [('GET /events/', 0)])
+
+    def test_percentiles(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, pct) for pct in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(percentile([], 50), 0.0)
+
+
+class StateVersionTests(TestCase):
+    def setUp(self):
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+        self.session = GameSession.objects.create(quiz=self.quiz)
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def version(self):
+        return GameSession.objects.get(pk=self.session.pk).state_version
+
+    def join(self, nickname):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/sessions/join/', {'join_code': self.quiz.join_code, 'nickname': nickname}, format='json'
+            )
+        return Player.objects.get(pk=response.json()['player']['id'])
+
+    def test_join_answer_and_advance_bump_version(self):
+        player = self.join('alice')
+        self.assertEqual(self.version(), 1)
+
+        self.client.post(f'/api/sessions/{self.session.id}/start_game/')
+        self.assertEqual(self.version(), 2)
+
+        question = self.quiz.questions.get(order=0)
+        served = self.client.get(f'/api/sessions/{self.session.id}/game_state/').json()['state_version']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/players/{player.id}/submit_answer/', {
+                'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 1.0
+            }, format='json')
+        # Answers only bump the version served from the snapshot
+        self.assertEqual(self.version(), 2)
+        self.assertEqual(self.client.get(f'/api/sessions/{self.session.id}/game_state/').json()['state_version'], served + 1)
+
+        self.client.post(f'/api/sessions/{self.session.id}/next_question/')
+        self.assertEqual(self.version(), 3)
+
+        self.client.post(f'/api/sessions/{self.session.id}/end_game/')
+        self.assertEqual(self.version(), 4)
+
+        # A rebuilt snapshot serves the same version: the database's plus the answers
+        get_game_state_store().clear()
+        self.assertEqual(self.client.get(f'/api/sessions/{self.session.id}/game_state/').json()['state_version'], 5)
+
+    def test_game_state_not_modified(self):
+        url = f'/api/sessions/{self.session.id}/game_state/'
+        self.join('alice')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(etag, '"1"')
+        self.assertEqual(response.json()['state_version'], 1)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        # The snapshot follows the database version, so a join changes the ETag
+        self.join('bob')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{self.version()}"')
+        self.assertEqual(response.json()['player_count'], 2)
+
+    def test_leaderboard_not_modified(self):
+        self.join('alice')
+        url = f'/api/sessions/{self.session.id}/leaderboard/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_current_question(self):
+        url = f'/api/sessions/{self.session.id}/current_question/'
+        self.join('alice')
+        self.assertEqual(self.client.get(url).json()['status'], 'waiting')
+
+        self.client.post(f'/api/sessions/{self.session.id}/start_game/')
+        response = self.client.get(url)
+        self.assertEqual(response.json()['question_number'], 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.client.post(f'/api/sessions/{self.session.id}/next_question/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.json()['question_number'], 2)
+
+
+class QueryCountTests(TestCase):
+    """The hot session endpoints must run a constant number of queries per request"""
+
+    def setUp(self):
+        # Ids are reused between tests, so snapshots from earlier tests must not leak
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+        self.session = GameSession.objects.create(
+            quiz=self.quiz,
+            status='active',
+            started_at=timezone.now(),
+            question_started_at=timezone.now()
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def seed(self, count):
+        players = create_players(self.session, count)
+        question = self.quiz.questions.get(order=0)
+        for player in players[::2]:
+            PlayerAnswer.objects.create(
+                player=player, question=question, selected_answer='Right', is_correct=True, time_taken=1.0
+            )
+        return players
+
+    def test_game_state(self):
+        self.seed(40)
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/sessions/{self.session.id}/game_state/')
+        data = response.json()
+        self.assertEqual(data['responses_received'], 20)
+        self.assertEqual([p['rank'] for p in data['players']], list(range(1, 41)))
+        self.assertEqual(sum(p['has_answered'] for p in data['players']), 20)
+
+    def test_leaderboard(self):
+        players = self.seed(40)
+        Player.objects.filter(pk=players[-1].pk).update(score=500)
+        # Ranked from the hot snapshot: the first request fills it, later ones never query
+        with self.assertNumQueries(4):
+            self.client.get(f'/api/sessions/{self.session.id}/leaderboard/')
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/sessions/{self.session.id}/leaderboard/')
+        leaderboard = response.json()['leaderboard']
+        self.assertEqual(leaderboard[0]['id'], players[-1].id)
+        self.assertEqual(leaderboard[0]['rank'], 1)
+        self.assertEqual(leaderboard[1]['rank'], 2)
+
+    def test_end_game(self):
+        self.seed(40)
+        with self.assertNumQueries(3):
+            response = self.client.post(f'/api/sessions/{self.session.id}/end_game/')
+        self.assertEqual(len(response.json()['final_scores']), 40)
+
+    def test_next_question(self):
+        self.seed(40)
+        with self.assertNumQueries(4):
+            response = self.client.post(f'/api/sessions/{self.session.id}/next_question/')
+        self.assertEqual(response.json()['question_number'], 2)
+
+        GameSession.objects.filter(pk=self.session.pk).update(current_question_index=2)
+        with self.assertNumQueries(4):
+            response = self.client.post(f'/api/sessions/{self.session.id}/next_question/')
+        self.assertEqual(response.json()['status'], 'Quiz completed')
+        self.assertEqual(len(response.json()['final_scores']), 40)
+
+    def test_join(self):
+        self.seed(40)
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(
+                '/api/sessions/join/', {'join_code': self.quiz.join_code, 'nickname': 'late'}, format='json'
+            )
+        # Quiz and session lookup, version bump, player INSERT
+        self.assertEqual(len(statements(queries)), 4)
+        data = response.json()
+        self.assertEqual(data['player']['nickname'], 'late')
+        self.assertEqual(data['session'], {
+            'id': self.session.id, 'quiz': self.quiz.id, 'quiz_title': 'Space Quiz', 'total_questions': 3
+        })
+
+        # The rest of the storm joins from the cached code: no lookups, however big the room
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(
+                '/api/sessions/join/', {'join_code': self.quiz.join_code.lower(), 'nickname': 'later'}, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(statements(queries)), 2)
+
+    def test_submit_answer(self):
+        players = self.seed(4)
+        question = self.quiz.questions.get(order=1)
+        GameSession.objects.filter(pk=self.session.pk).update(current_question_index=1)
+        self.client.get(f'/api/sessions/{self.session.id}/game_state/')
+
+        # The question's first answer also inserts its answer counters row
+        data = {'question_id': question.id, 'selected_answer': 'Wrong 1', 'time_taken': 0.0}
+        self.client.post(f'/api/players/{players[0].id}/submit_answer/', data, format='json')
+
+        url = f'/api/players/{players[1].id}/submit_answer/'
+        data = {'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 0.0}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.json()['total_score'], 150)
+        # Answer insert, counter update and the question's answer counters
+        # update: the player's session and the question come from the store
+        self.assertLessEqual(len(statements(queries)), 3)
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Player.objects.get(pk=players[1].pk).score, 150)
+        self.assertEqual(self.client.post('/api/players/999999/submit_answer/', data, format='json').status_code, 404)
+
+    def test_player_rank_without_annotation(self):
+        players = self.seed(3)
+        Player.objects.filter(pk=players[2].pk).update(score=100)
+        self.assertEqual(PlayerSerializer(Player.objects.get(pk=players[2].pk)).data['rank'], 1)
+        self.assertEqual(PlayerSerializer(Player.objects.get(pk=players[1].pk)).data['rank'], 3)
+
+
+class EndpointBenchmarkTests(TestCase):
+    """Rooms of 10, 100 and 1000 players against the committed benchmark baseline"""
+
+    def setUp(self):
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+
+    def test_query_counts_match_baseline(self):
+        # Latency depends on the machine; the management command compares it
+        baseline = load_baseline()
+        results = run_benchmarks(repeat=1)
+        self.assertEqual(sorted(results, key=int), ['10', '100', '1000'])
+        for size, endpoints in results.items():
+            self.assertEqual(set(endpoints), set(baseline[size]))
+        self.assertEqual(compare(results, baseline, latency_tolerance=None), [])
+        # The hot endpoints don't grow with the room
+        for name in ('game_state', 'game_state_cold', 'leaderboard_cold', 'join', 'submit_answer', 'next_question'):
+            self.assertEqual(len({results[size][name]['queries'] for size in results}), 1, name)
+
+    def test_compare(self):
+        baseline = {'10': {'join': {'queries': 2, 'median_ms': 4.0}}}
+        self.assertEqual(compare({'10': {'join': {'queries': 2, 'median_ms': 5.9}}}, baseline), [])
+        self.assertEqual(len(compare({'10': {'join': {'queries': 3, 'median_ms': 6.1}}}, baseline)), 2)
+        self.assertEqual(compare({'10': {'join': {'queries': 3, 'median_ms': 9.0}}}, baseline,
+                                 query_tolerance=1, latency_tolerance=None), [])
+        # Sub-millisecond noise on fast endpoints isn't a regression
+        self.assertEqual(compare({'10': {'join': {'queries': 0, 'median_ms': 0.9}}},
+                                 {'10': {'join': {'queries': 0, 'median_ms': 0.1}}}), [])
+        # Nothing to compare against
+        self.assertEqual(compare({'100': {'join': {'queries': 9, 'median_ms': 9.0}}}, baseline), [])
+
+    def test_command_fails_on_regression(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            call_command('benchmark_endpoints', sizes=[10], repeat=1, endpoints=['join'],
+                         baseline=path, update_baseline=True, stdout=StringIO())
+            with open(path) as f:
+                baseline = json.load(f)
+            self.assertEqual(baseline['10']['join']['queries'], 2)
+
+            out = StringIO()
+            call_command('benchmark_endpoints', sizes=[10], repeat=1, endpoints=['join'],
+                         baseline=path, no_latency=True, stdout=out)
+            self.assertIn('No regressions', out.getvalue())
+
+            baseline['10']['join']['queries'] = 1
+            with open(path, 'w') as f:
+                json.dump(baseline, f)
+            out = StringIO()
+            with self.assertRaises(CommandError):
+                call_command('benchmark_endpoints', sizes=[10], repeat=1, endpoints=['join'],
+                             baseline=path, no_latency=True, stdout=out)
+            self.assertIn('join with 10 players: 2 queries, baseline 1', out.getvalue())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        get_question_cache().clear()
+        get_metrics().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+        self.session = GameSession.objects.create(
+            quiz=self.quiz, status='active', started_at=timezone.now(), question_started_at=timezone.now()
+        )
+        self.players = create_players(self.session, 3)
+        self.client = APIClient()
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_requests_are_recorded_per_action(self):
+        self.client.get(f'/api/sessions/{self.session.id}/game_state/')
+        self.client.get(f'/api/sessions/{self.session.id}/game_state/')
+        question = self.quiz.questions.get(order=0)
+        self.client.post(
+            f'/api/players/{self.players[0].id}/submit_answer/',
+            {'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 1.0}, format='json'
+        )
+        self.client.get('/api/no-such-page/')
+
+        text = self.scrape()
+        game_state = 'route="session-game-state",action="game_state"'
+        self.assertIn(f'quiz_http_requests_total{{{game_state},method="GET",status="200"}} 2', text)
+        self.assertIn(f'quiz_http_request_duration_seconds_count{{{game_state}}} 2', text)
+        self.assertIn(f'quiz_http_request_duration_seconds_bucket{{{game_state},le="+Inf"}} 2', text)
+        # The first request filled the hot snapshot, the second was served from it
+        self.assertIn(f'quiz_http_db_queries_total{{{game_state}}} 4', text)
+        self.assertRegex(text, r'quiz_http_response_bytes_total\{' + re.escape(game_state) + r'\} [1-9]')
+        self.assertIn(
+            'quiz_http_requests_total{route="player-submit-answer",action="submit_answer",method="POST",status="200"} 1',
+            text
+        )
+        self.assertIn('route="unmatched",action="unmatched",method="GET",status="404"', text)
+        self.assertIn('# TYPE quiz_http_request_duration_seconds histogram', text)
+        self.assertIn('quiz_active_sessions 1', text)
+        self.assertIn('quiz_active_players 3', text)
+
+    def test_ai_generation_outcomes(self):
+        with mock.patch.dict(os.environ, {'OPENROUTER_API_KEY': ''}):
+            QuizAIService().generate_quiz_questions('Space', num_questions=3)
+        with mock.patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test-key'}), \
+                mock.patch.object(QuizAIService, '_request_questions', return_value=[
+                    {'question': f'Q{idx}?', 'correct_answer': 'A', 'wrong_answers': ['B', 'C', 'D']}
+                    for idx in range(3)
+                ]):
+            QuizAIService().generate_quiz_questions('Space', num_questions=3)
+            QuizAIService().generate_quiz_questions('Space', num_questions=3)
+
+        text = self.scrape()
+        for outcome in ('fallback', 'ai', 'cached'):
+            self.assertIn(f'quiz_ai_generations_total{{outcome="{outcome}"}} 1', text)
+            self.assertIn(f'quiz_ai_generation_duration_seconds_count{{outcome="{outcome}"}} 1', text)
+
+    def test_worker_processes_are_aggregated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            workers = [MetricsRegistry(directory=directory, flush_interval=3600) for _ in range(2)]
+            for idx, worker in enumerate(workers):
+                worker.inc('quiz_http_requests_total', {'route': 'r', 'action': 'a', 'method': 'GET', 'status': 200})
+                worker.observe('quiz_http_request_duration_seconds', {'route': 'r', 'action': 'a'}, 0.02 * (idx + 1))
+                worker.flush()
+            # Counted after the last flush: only the scraping worker's own samples are current
+            workers[0].inc('quiz_http_requests_total', {'route': 'r', 'action': 'a', 'method': 'GET', 'status': 200})
+
+            text = render(workers[0].collect())
+            for worker in workers:
+                worker.close()
+        self.assertIn('quiz_http_requests_total{route="r",action="a",method="GET",status="200"} 3', text)
+        self.assertIn('quiz_http_request_duration_seconds_bucket{route="r",action="a",le="0.025"} 1', text)
+        self.assertIn('quiz_http_request_duration_seconds_bucket{route="r",action="a",le="0.05"} 2', text)
+        self.assertIn('quiz_http_request_duration_seconds_count{route="r",action="a"} 2', text)
+        self.assertIn('quiz_http_request_duration_seconds_sum{route="r",action="a"} 0.06', text)
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        registry.inc('quiz_ai_generations_total', {'outcome': 'a "b"\\c'})
+        self.assertIn('quiz_ai_generations_total{outcome="a \\"b\\"\\\\c"} 1', render(registry.collect()))
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+
+
+class FastSerializationTests(TestCase):
+    """The .values() snapshot and the orjson renderer must give the same bytes as before"""
+
+    def setUp(self):
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+        self.session = GameSession.objects.create(
+            quiz=self.quiz, status='active', started_at=timezone.now(), question_started_at=timezone.now()
+        )
+        players = create_players(self.session, 6)
+        Player.objects.filter(pk=players[3].pk).update(score=250, answers_correct=2)
+        Player.objects.filter(pk=players[5].pk).update(is_active=False)
+        PlayerAnswer.objects.create(
+            player=players[3], question=self.quiz.questions.get(order=0), selected_answer='Right',
+            is_correct=True, time_taken=1.0
+        )
+        self.session = GameSession.objects.select_related('quiz').get(pk=self.session.pk)
+
+    def assertSameBytes(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_renderer_matches_json_renderer(self):
+        now = timezone.now()
+        self.assertSameBytes({
+            'floats': [0.0, -0.0, 12.3, 0.1 + 0.2, 1e-05, -4.2e-05, 10.00001, 1e-7, 1e16, 1.5e300, 123456789012345680.0, 5e-324],
+            'text': 'Case-3 and 1e5 "quoted" \\ \t\n\x00\x1f é 😀 a\u2028b\u2029 ’',
+            'ints': [0, -1, 2 ** 63 - 1, True, False, None],
+            'datetimes': [now, now.replace(microsecond=0), datetime.datetime(2024, 1, 2, 3, 4, 5), now.date()],
+            'other': [decimal.Decimal('1.50'), uuid.UUID(int=7), gettext_lazy('Not found.'), b'raw', (1, 2)],
+            1: 'int key',
+            'nested': {'empty': {}, 'list': [[], [{}]]},
+        })
+        self.assertSameBytes([])
+        self.assertSameBytes('plain')
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        # Too big for orjson, left to the stock renderer
+        self.assertSameBytes({'big': 2 ** 70})
+        # Pretty printing is left to the stock renderer too
+        self.assertEqual(
+            ORJSONRenderer().render({'a': [1]}, 'application/json; indent=2'),
+            JSONRenderer().render({'a': [1]}, 'application/json; indent=2')
+        )
+
+    def test_payloads_match_serializers(self):
+        snapshot = snapshot_from_session(self.session)
+        legacy = legacy_snapshot_from_session(self.session)
+        self.assertEqual(snapshot['answered'], legacy['answered'])
+        for key in ('questions', 'players', 'quiz_title', 'state_version'):
+            self.assertEqual(JSONRenderer().render(snapshot[key]), JSONRenderer().render(legacy[key]), key)
+
+        self.assertSameBytes(build_game_state(snapshot))
+        self.assertEqual(
+            JSONRenderer().render(build_final_scores(self.session)),
+            JSONRenderer().render(legacy_final_scores(self.session))
+        )
+
+    def test_current_question(self):
+        client = APIClient()
+        with self.assertNumQueries(2):
+            response = client.get(f'/api/sessions/{self.session.id}/current_question/')
+        question = self.quiz.questions.get(order=0)
+        self.assertEqual(response.json()['question'], {
+            'id': question.id, 'question_text': 'Question 0?', 'correct_answer': 'Right',
+            'wrong_answers': ['Wrong 1', 'Wrong 2', 'Wrong 3'], 'order': 0, 'time_limit': question.time_limit
+        })
+        self.assertEqual(response.json()['total_questions'], 3)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_serializers', sizes=[10], repeat=1, stdout=out)
+        self.assertIn('Same JSON bytes', out.getvalue())
+        for part in ('snapshot', 'final_scores', 'render'):
+            self.assertIn(part, out.getvalue())
+
+
+class GameStateDeltaTests(TestCase):
+    def setUp(self):
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+        self.session = GameSession.objects.create(quiz=self.quiz)
+        self.players = create_players(self.session, 4)
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+        self.url = f'/api/sessions/{self.session.id}/game_state/'
+
+    def post(self, url, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, data, format='json')
+
+    def answer(self, player, order=0):
+        question = self.quiz.questions.get(order=order)
+        self.post(f'/api/players/{player.id}/submit_answer/', {
+            'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 1.0
+        })
+
+    @staticmethod
+    def apply(state, delta):
+        """A client's copy of the full state brought up to date with a delta"""
+        players = {player['id']: player for player in state['players']}
+        for player_id in delta['left']:
+            players.pop(player_id, None)
+        players.update({player['id']: player for player in delta['players']})
+        if 'answered' in delta:
+            for player in players.values():
+                player['has_answered'] = player['id'] in delta['answered']
+        ordered = sorted(players.values(), key=lambda player: (-player['score'], player['joined_at'], player['id']))
+        for rank, player in enumerate(ordered, 1):
+            player['rank'] = rank
+        skipped = ('players', 'left', 'answered', 'delta', 'since')
+        fields = {key: value for key, value in delta.items() if key not in skipped}
+        return dict(state, **fields, players=ordered)
+
+    def assertCaughtUp(self, state):
+        full = self.client.get(self.url).json()
+        for key in ('status', 'current_question_index', 'current_question', 'players', 'player_count',
+                    'responses_received', 'state_version'):
+            self.assertEqual(state[key], full[key], key)
+
+    def test_store_change_log(self):
+        snapshot = snapshot_from_session(GameSession.objects.select_related('quiz').get(pk=self.session.pk))
+        question_id = snapshot['questions'][0]['id']
+        for store in (InMemoryGameStateStore(log_size=3), RedisGameStateStore(FakeRedis(), log_size=3)):
+            session_id = self.session.id
+            self.assertIsNone(store.changes(session_id, 0, 0))
+            store.finish_fill(session_id, store.begin_fill(session_id), snapshot)
+            self.assertEqual(store.changes(session_id, 0, 0), {'state_version': 0, 'session': False, 'players': set()})
+
+            player = snapshot['players'][self.players[0].id]
+            newcomer = dict(snapshot['players'][self.players[1].id], id=self.players[-1].id + 1, nickname='newcomer')
+            store.update_session(session_id, 1, {'status': 'waiting'}, status='active')
+            store.record_answer(session_id, question_id, dict(player, score=100, answers_correct=1))
+            store.put_player(session_id, newcomer)
+            self.assertEqual(store.changes(session_id, 0, 3), {
+                'state_version': 3, 'session': True, 'players': {self.players[0].id, newcomer['id']}
+            })
+            self.assertEqual(store.changes(session_id, 1, 2)['players'], {self.players[0].id})
+
+            # The log keeps the last three writes; clients further behind (or ahead) get nothing
+            store.record_answer(session_id, question_id, dict(player, score=200, answers_correct=2))
+            self.assertIsNone(store.changes(session_id, 0, 4))
+            self.assertEqual(store.changes(session_id, 1, 4)['players'], {self.players[0].id, newcomer['id']})
+            self.assertIsNone(store.changes(session_id, 5, 4))
+
+            store.invalidate(session_id)
+            self.assertIsNone(store.changes(session_id, 4, 4))
+
+        # A write still in flight stops the delta before it
+        self.assertEqual(collect_changes([(1, None), (3, 7)], 0, 3)['state_version'], 1)
+
+    def test_deltas_follow_the_game(self):
+        state = self.client.get(self.url).json()
+        version = state['state_version']
+
+        self.post(f'/api/sessions/{self.session.id}/start_game/')
+        self.answer(self.players[2])
+        with self.assertNumQueries(0):
+            delta = self.client.get(self.url, {'delta_since': version}).json()
+        self.assertTrue(delta['delta'])
+        self.assertEqual(delta['since'], version)
+        self.assertEqual(delta['status'], 'active')
+        self.assertEqual(delta['answered'], [self.players[2].id])
+        self.assertEqual([(player['id'], player['rank']) for player in delta['players']], [(self.players[2].id, 1)])
+        state = self.apply(state, delta)
+        self.assertCaughtUp(state)
+
+        # Answers only send the players who answered
+        self.answer(self.players[0])
+        self.answer(self.players[3])
+        delta = self.client.get(self.url, {'delta_since': state['state_version']}).json()
+        self.assertNotIn('status', delta)
+        self.assertEqual([player['id'] for player in delta['players']], [self.players[0].id, self.players[3].id])
+        self.assertTrue(all(player['has_answered'] for player in delta['players']))
+        self.assertEqual(delta['responses_received'], 3)
+        state = self.apply(state, delta)
+        self.assertCaughtUp(state)
+
+        etag = f'"{state["state_version"]}"'
+        response = self.client.get(self.url, {'delta_since': state['state_version']}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # An advance resets every answered flag without listing the players
+        self.post(f'/api/sessions/{self.session.id}/next_question/')
+        delta = self.client.get(self.url, {'delta_since': state['state_version']}).json()
+        self.assertEqual((delta['current_question_index'], delta['answered'], delta['players']), (1, [], []))
+        state = self.apply(state, delta)
+        self.assertCaughtUp(state)
+
+        self.post(f'/api/sessions/{self.session.id}/end_game/')
+        delta = self.client.get(self.url, {'delta_since': state['state_version']}).json()
+        self.assertFalse(delta['delta'])
+        self.assertEqual(len(delta['final_scores']), 4)
+
+    def test_full_state_when_too_far_behind(self):
+        self.client.get(self.url)
+        with override_settings(GAME_STATE_LOG_SIZE=2):
+            self.client.get(self.url)
+            self.post(f'/api/sessions/{self.session.id}/start_game/')
+            for player in self.players[:3]:
+                self.answer(player)
+            behind = self.client.get(self.url, {'delta_since': 1}).json()
+            recent = self.client.get(self.url, {'delta_since': 2}).json()
+        self.assertFalse(behind['delta'])
+        self.assertEqual((behind['player_count'], behind['responses_received']), (4, 3))
+        self.assertEqual(len(behind['players']), 4)
+        self.assertTrue(recent['delta'])
+        self.assertEqual(len(recent['players']), 2)
+
+        self.assertEqual(self.client.get(self.url, {'delta_since': 'abc'}).status_code, 400)
+
+    def test_delta_benchmark(self):
+        result = run_delta_benchmarks(size=40, batch=5)
+        self.assertEqual(result['players'], 40)
+        self.assertLess(result['delta_bytes'], result['full_bytes'] / 2)
+        out = StringIO()
+        call_command('benchmark_state_deltas', sizes=[20], stdout=out)
+        self.assertIn('%', out.getvalue())
+
+
+class PlayerStateTests(TestCase):
+    def setUp(self):
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+        self.session = GameSession.objects.create(
+            quiz=self.quiz, status='active', started_at=timezone.now(), question_started_at=timezone.now()
+        )
+        self.players = create_players(self.session, 30)
+        self.client = APIClient()
+
+    def url(self, player):
+        return f'/api/players/{player.id}/state/'
+
+    def answer(self, player):
+        question = self.quiz.questions.get(order=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/players/{player.id}/submit_answer/', {
+                'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 1.0
+            }, format='json')
+
+    def test_compact_state(self):
+        self.answer(self.players[7])
+        self.client.get(self.url(self.players[7]))
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url(self.players[7]))
+        state = response.json()
+        self.assertEqual(response['ETag'], f'"{state["state_version"]}"')
+        self.assertEqual((state['status'], state['current_question_index'], state['player_count']), ('active', 0, 30))
+        self.assertEqual(state['current_question']['question_text'], 'Question 0?')
+        self.assertGreater(state['time_left'], 0)
+        self.assertEqual(
+            (state['player']['id'], state['player']['rank'], state['player']['has_answered']),
+            (self.players[7].id, 1, True)
+        )
+        self.assertGreater(state['player']['score'], 0)
+        self.assertEqual([player['id'] for player in state['top']], [
+            self.players[7].id, *(player.id for player in self.players[:4])
+        ])
+        self.assertNotIn('players', state)
+        full = self.client.get(f'/api/sessions/{self.session.id}/game_state/')
+        self.assertLess(len(response.content) * 3, len(full.content))
+
+        # Someone else's answer moves the version on
+        state = self.client.get(self.url(self.players[1]), {'top': 2}).json()
+        self.assertEqual((state['player']['rank'], state['player']['has_answered'], len(state['top'])), (3, False, 2))
+        unchanged = self.client.get(self.url(self.players[1]), HTTP_IF_NONE_MATCH=f'"{state["state_version"]}"')
+        self.assertEqual(unchanged.status_code, 304)
+
+    def test_backends_agree(self):
+        snapshot = snapshot_from_session(GameSession.objects.select_related('quiz').get(pk=self.session.pk))
+        question_id = snapshot['questions'][0]['id']
+        views = []
+        for store in (InMemoryGameStateStore(), RedisGameStateStore(FakeRedis())):
+            self.assertIsNone(store.player_view(self.session.id, self.players[0].id))
+            store.finish_fill(self.session.id, store.begin_fill(self.session.id), snapshot)
+            player = snapshot['players'][self.players[3].id]
+            store.record_answer(self.session.id, question_id, dict(player, score=120, answers_correct=1))
+            views.append([store.player_view(self.session.id, self.players[idx].id, top=3) for idx in (3, 0)])
+        self.assertEqual(views[0], views[1])
+        mine, other = views[0]
+        self.assertEqual((mine['player']['rank'], mine['has_answered'], other['player']['rank']), (1, True, 2))
+        self.assertEqual(mine['current_question']['id'], question_id)
+
+    def test_phases_and_errors(self):
+        self.session.status = 'waiting'
+        self.session.save()
+        state = self.client.get(self.url(self.players[0])).json()
+        self.assertEqual((state['status'], state['current_question'], state['time_left']), ('waiting', None, 0))
+
+        get_game_state_store().clear()
+        self.session.status = 'finished'
+        self.session.save()
+        state = self.client.get(self.url(self.players[0])).json()
+        self.assertEqual((state['status'], state['player']['rank']), ('finished', 1))
+
+        self.assertEqual(self.client.get('/api/players/999999/state/').status_code, 404)
+        self.assertEqual(self.client.get(self.url(self.players[0]), {'top': 0}).status_code, 400)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Reads against a second SQLite file that only catches up when ``replicate`` copies the primary over"""
+
+    def setUp(self):
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        fd, self.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connections.settings['replica'] = connections.configure_settings({
+            'default': {}, 'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.replica_path}
+        })['replica']
+        self.addCleanup(self.drop_replica)
+
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+        self.session = GameSession.objects.create(quiz=self.quiz)
+        create_players(self.session, 2)
+        self.replicate()
+
+        self.host_client = APIClient()
+        self.host_client.force_authenticate(self.host)
+        self.client = APIClient()
+        self.url = f'/api/sessions/{self.session.id}/current_question/'
+
+    def drop_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        os.remove(self.replica_path)
+
+    def replicate(self):
+        for alias in ('default', 'replica'):
+            connections[alias].ensure_connection()
+        connections['default'].connection.backup(connections['replica'].connection)
+
+    def status(self, client):
+        return client.get(self.url).json()['status']
+
+    @override_settings(DATABASE_READ_REPLICA='replica', DATABASE_REPLICA_LAG=5)
+    def test_reads_follow_the_replica_until_a_write(self):
+        response = self.host_client.post(f'/api/sessions/{self.session.id}/start_game/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        # The host reads its own write, everyone else the lagging replica
+        self.assertEqual(self.status(self.host_client), 'active')
+        self.assertEqual(self.status(self.client), 'waiting')
+        self.replicate()
+        self.assertEqual(self.status(self.client), 'active')
+
+        # Once the pin runs out the host reads the replica too
+        GameSession.objects.filter(pk=self.session.pk).update(status='finished')
+        self.host_client.cookies[PIN_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.status(self.host_client), 'active')
+
+        # Reads without a write don't pin
+        self.assertNotIn(PIN_COOKIE, self.client.get(self.url).cookies)
+
+    @override_settings(DATABASE_READ_REPLICA='replica')
+    def test_shared_snapshot_reads_primary(self):
+        GameSession.objects.filter(pk=self.session.pk).update(status='active', started_at=timezone.now())
+        self.assertEqual(self.status(self.client), 'waiting')
+        self.assertEqual(self.client.get(f'/api/sessions/{self.session.id}/game_state/').json()['status'], 'active')
+
+    @override_settings(DATABASE_READ_REPLICA='replica')
+    def test_routing(self):
+        router = PrimaryReplicaRouter()
+        # Outside requests and for writes it is always the primary
+        self.assertIsNone(router.db_for_read(GameSession))
+        self.assertEqual(router.db_for_write(GameSession), 'default')
+
+        token = db_router._replica_reads.set(True)
+        try:
+            self.assertEqual(router.db_for_read(GameSession), 'replica')
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(GameSession))
+            with primary_reads():
+                self.assertIsNone(router.db_for_read(GameSession))
+        finally:
+            db_router._replica_reads.reset(token)
+
+        # Without a replica everything reads the primary and nobody is pinned
+        with override_settings(DATABASE_READ_REPLICA=''):
+            GameSession.objects.filter(pk=self.session.pk).update(status='active')
+            self.assertEqual(self.status(self.client), 'active')
+            response = self.host_client.post(f'/api/sessions/{self.session.id}/end_game/')
+            self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class QuestionStatsTests(TestCase):
+    def setUp(self):
+        get_game_state_store().clear()
+        get_join_code_resolver().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+        self.session = GameSession.objects.create(
+            quiz=self.quiz, status='active', started_at=timezone.now(), question_started_at=timezone.now()
+        )
+        self.players = create_players(self.session, 4)
+        self.questions = list(self.quiz.questions.order_by('order'))
+        self.client = APIClient()
+        self.host_client = APIClient()
+        self.host_client.force_authenticate(self.host)
+        self.url = f'/api/sessions/{self.session.id}/answer_stats/'
+
+    def answer(self, player, selected_answer, time_taken, question=None):
+        return self.client.post(f'/api/players/{player.id}/submit_answer/', {
+            'question_id': (question or self.questions[0]).id,
+            'selected_answer': selected_answer,
+            'time_taken': time_taken
+        }, format='json')
+
+    def test_submit_answer_keeps_counters(self):
+        self.answer(self.players[0], 'Right', 1.0)
+        self.answer(self.players[1], 'Wrong 2', 2.0)
+        self.answer(self.players[2], 'Right', 6.0)
+        self.answer(self.players[3], 'Not an option', 3.0)
+        # A second answer is rejected and not counted
+        self.assertEqual(self.answer(self.players[0], 'Wrong 1', 1.0).status_code, 400)
+
+        stats = QuestionStats.objects.get(session=self.session, question=self.questions[0])
+        self.assertEqual((stats.responses, stats.correct), (4, 2))
+        self.assertEqual(stats.options, ['Right', 'Wrong 1', 'Wrong 2', 'Wrong 3'])
+        self.assertEqual((stats.wrong_1, stats.wrong_2, stats.wrong_3), (0, 1, 0))
+        self.assertAlmostEqual(stats.mean_time_taken, 3.0)
+
+    def test_host_reads_histograms_without_aggregation(self):
+        self.answer(self.players[0], 'Right', 1.5)
+        self.answer(self.players[1], 'Wrong 3', 2.5)
+        self.answer(self.players[0], 'Wrong 1', 4.0, question=self.questions[1])
+
+        with self.assertNumQueries(2):
+            response = self.host_client.get(self.url)
+        questions = response.json()['questions']
+        self.assertEqual([question['question_id'] for question in questions], [q.id for q in self.questions[:2]])
+        self.assertEqual(questions[0], {
+            'question_id': self.questions[0].id, 'responses': 2, 'correct': 1, 'mean_time_taken': 2.0,
+            'options': [
+                {'answer': 'Right', 'count': 1, 'is_correct': True},
+                {'answer': 'Wrong 1', 'count': 0, 'is_correct': False},
+                {'answer': 'Wrong 2', 'count': 0, 'is_correct': False},
+                {'answer': 'Wrong 3', 'count': 1, 'is_correct': False},
+            ]
+        })
+
+        response = self.host_client.get(self.url, {'question': self.questions[1].id})
+        self.assertEqual([question['responses'] for question in response.json()['questions']], [1])
+        self.assertEqual(self.host_client.get(self.url, {'question': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class FakeRedis:
+    """Just enough of the redis-py client (decode_responses=True) for RedisGameStateStore"""
+
+    def __init__(self):
+        self.data = {}
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        values = self.data.setdefault(key, {})
+        if field is not None:
+            values[str(field)] = str(value)
+        for name, item in (mapping or {}).items():
+            values[str(name)] = str(item)
+
+    def hincrby(self, key, field, amount=1):
+        values = self.data.setdefault(key, {})
+        values[field] = str(int(values.get(field, 0)) + amount)
+        return int(values[field])
+
+    def hsetnx(self, key, field, value):
+        values = self.data.setdefault(key, {})
+        if str(field) in values:
+            return 0
+        values[str(field)] = str(value)
+        return 1
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(str(field))
+
+    def hmget(self, key, fields):
+        values = self.data.get(key, {})
+        return [values.get(str(field)) for field in fields]
+
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update({member: float(score) for member, score in mapping.items()})
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.data.get(key, {}).pop(member, None)
+
+    def _zsorted(self, key):
+        return sorted(self.data.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+
+    def zrange(self, key, start, end):
+        members = [member for member, _ in self._zsorted(key)]
+        return members[start:] if end == -1 else members[start:end + 1]
+
+    def zrank(self, key, member):
+        members = [item for item, _ in self._zsorted(key)]
+        return members.index(member) if member in members else None
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(str(member) for member in members)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    def sismember(self, key, member):
+        return int(str(member) in self.data.get(key, set()))
+
+    def set(self, key, value, px=None, ex=None):
+        self.data[key] = str(value)
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(str(value) for value in values)
+
+    def ltrim(self, key, start, end):
+        values = self.data.get(key, [])
+        self.data[key] = values[start:] if end == -1 else values[start:end + 1]
+
+    def lrange(self, key, start, end):
+        values = self.data.get(key, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match=None, count=None):
+        for key in list(self.data):
+            if match is None or fnmatch.fnmatchcase(key, match):
+                yield key
+
+
+class GameStateStoreTests(TestCase):
+    def setUp(self):
+        get_game_state_store().clear()
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pw')
+        self.quiz = create_quiz(self.host)
+        self.session = GameSession.objects.create(
+            quiz=self.quiz,
+            status='active',
+            started_at=timezone.now(),
+            question_started_at=timezone.now()
+        )
+        self.players = create_players(self.session, 3)
+        self.client = APIClient()
+
+    def snapshot(self):
+        return snapshot_from_session(GameSession.objects.select_related('quiz').get(pk=self.session.pk))
+
+    def check_backend(self, store):
+        session_id = self.session.id
+        self.assertIsNone(store.get(session_id))
+
+        token = store.begin_fill(session_id)
+        self.assertTrue(store.finish_fill(session_id, token, self.snapshot()))
+        snapshot = store.get(session_id)
+        self.assertEqual(set(snapshot['players']), {player.id for player in self.players})
+        self.assertEqual(snapshot['answered'], set())
+        self.assertEqual(store.player_session(self.players[0].id), session_id)
+        self.assertIsNone(store.player_session(self.players[-1].id + 1))
+
+        question_id = snapshot['questions'][0]['id']
+        player_data = dict(snapshot['players'][self.players[0].id], score=100, answers_correct=1)
+        store.record_answer(session_id, question_id, player_data)
+        store.update_session(session_id, 1, {'current_question_index': 0}, current_question_index=0)
+        snapshot = store.get(session_id)
+        self.assertEqual(snapshot['answered'], {self.players[0].id})
+        self.assertEqual(snapshot['players'][self.players[0].id]['score'], 100)
+
+        board = store.leaderboard(session_id, top=1, around_player=self.players[2].id, radius=1)
+        self.assertEqual([p['id'] for p in board['leaderboard']], [self.players[0].id])
+        self.assertEqual([(p['id'], p['rank']) for p in board['around']], [
+            (self.players[1].id, 2), (self.players[2].id, 3)
+        ])
+        self.assertEqual((board['player_rank'], board['total_players']), (3, 3))
+        self.assertEqual(store.get(session_id)['ranking'], [player.id for player in self.players])
+
+        # Answers to the previous question are not reported once the game moves on
+        store.update_session(session_id, 2, {'current_question_index': 0}, current_question_index=1)
+        self.assertEqual(store.get(session_id)['answered'], set())
+
+        # Writes the snapshot already holds are skipped
+        store.update_session(session_id, 2, {'current_question_index': 0}, current_question_index=5)
+        store.record_answer(session_id, question_id, player_data)
+        self.assertEqual(store.get(session_id)['current_question_index'], 1)
+        self.assertEqual(store.get(session_id)['state_version'], 3)
+        self.assertEqual(store.version(session_id), 3)
+
+        # A write finding the snapshot without an earlier one drops it, so readers rebuild it
+        store.update_session(session_id, 3, {'current_question_index': 0}, current_question_index=2)
+        self.assertIsNone(store.get(session_id))
+        self.assertIsNone(store.version(session_id))
+        self.assertIsNone(store.changes(session_id, 3, 3))
+        store.finish_fill(session_id, store.begin_fill(session_id), self.snapshot())
+        store.record_answer(session_id, question_id, dict(player_data, answers_correct=2))
+        self.assertIsNone(store.get(session_id))
+
+        # A rebuild that raced with a writer is thrown away
+        token = store.begin_fill(session_id)
+        store.put_player(session_id, player_data)
+        self.assertFalse(store.finish_fill(session_id, token, self.snapshot()))
+        self.assertIsNone(store.get(session_id))
+
+    def test_in_memory_backend(self):
+        self.check_backend(InMemoryGameStateStore())
+
+    def test_redis_backend(self):
+        self.check_backend(RedisGameStateStore(FakeRedis()))
+
+    def test_redis_clear_deletes_only_its_keys(self):
+        client = FakeRedis()
+        store = RedisGameStateStore(client)
+        for session_id in range(3):
+            store.finish_fill(session_id, store.begin_fill(session_id), dict(self.snapshot(), session_id=session_id))
+        client.set('other:key', 'kept')
+        self.assertGreater(len(client.data), 8)
+        deleted = []
+        real_delete = client.delete
+
+        def delete(*keys):
+            deleted.append(len(keys))
+            real_delete(*keys)
+
+        with mock.patch('quiz_api.state_store.CLEAR_BATCH_SIZE', 4), mock.patch.object(client, 'delete', delete):
+            store.clear()
+        self.assertEqual(list(client.data), ['other:key'])
+        self.assertLessEqual(max(deleted), 4)
+        self.assertIsNone(store.get(0))
+
+    def test_game_state_served_from_store(self):
+        url = f'/api/sessions/{self.session.id}/game_state/'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['player_count'], 3)
+
+    def test_failed_or_lost_store_writes_drop_the_snapshot(self):
+        url = f'/api/sessions/{self.session.id}/game_state/'
+        store = get_game_state_store()
+
+        def answer(player, order=0):
+            question = self.quiz.questions.get(order=order)
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.post(f'/api/players/{player.id}/submit_answer/', {
+                    'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 1.0
+                }, format='json')
+
+        self.client.get(url)
+        with mock.patch.object(store, 'record_answer', side_effect=ConnectionError('store down')):
+            self.assertEqual(answer(self.players[0]).status_code, 200)
+        self.assertIsNone(store.get(self.session.id))
+        self.assertEqual(self.client.get(url).json()['responses_received'], 1)
+
+        # An answer whose store write never ran is noticed by the player's next one
+        with mock.patch.object(store, 'record_answer'):
+            self.assertEqual(answer(self.players[1]).status_code, 200)
+        self.assertEqual(self.client.get(url).json()['responses_received'], 1)
+        self.assertEqual(answer(self.players[1], order=1).status_code, 200)
+        self.assertIsNone(store.get(self.session.id))
+        state = self.client.get(url).json()
+        self.assertEqual(state['players'][0]['answers_correct'], 2)
+        # The database version, plus the three answers given
+        self.assertEqual(state['state_version'], GameSession.objects.get(pk=self.session.pk).state_version + 3)
+
+    def test_submit_answer_updates_snapshot(self):
+        url = f'/api/sessions/{self.session.id}/game_state/'
+        self.client.get(url)
+        question = self.quiz.questions.get(order=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/players/{self.players[1].id}/submit_answer/', {
+                'question_id': question.id, 'selected_answer': 'Right', 'time_taken': 1.0
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            data = self.client.get(url).json()
+        self.assertEqual(data['responses_received'], 1)
+        self.assertEqual(data['players'][0]['id'], self.players[1].id)
+        self.assertTrue(data['players'][0]['has_answered'])
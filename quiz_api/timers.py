@@ -0,0 +1,136 @@
+import asyncio
+import heapq
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .events import publish_session_event
+from .game_state import advance_question
+from .models import GameSession, Question
+
+logger = logging.getLogger(__name__)
+
+# How often to look for questions started since the last scan
+RESCAN_SECONDS = 1.0
+
+# Rescans look this far back past the previous one to absorb clock skew
+# between the processes that start questions
+RESCAN_OVERLAP = timedelta(seconds=5)
+
+
+class QuestionTimerScheduler:
+    """
+    Advances active sessions when their current question runs out of time.
+
+    Deadlines (``question_started_at`` + the question's ``time_limit``) sit in
+    a heap, so the scheduler sleeps until the next one is due instead of
+    waiting for a client to poll. Questions started by the host or another
+    process are picked up by rescanning recently started sessions.
+
+    Every advance is a compare-and-swap on ``current_question_index``, so
+    running one scheduler per worker, or racing the host's ``next_question``,
+    still advances each question exactly once.
+    """
+
+    def __init__(self, rescan_interval=RESCAN_SECONDS):
+        self.rescan_interval = rescan_interval
+        self._heap = []
+        self._scheduled = set()
+        self._last_scan = None
+
+    def schedule(self, session_id, question_index, deadline, total_questions):
+        """Queue a question's deadline; a question already queued is ignored"""
+        key = (session_id, question_index)
+        if key in self._scheduled:
+            return
+        self._scheduled.add(key)
+        heapq.heappush(self._heap, (deadline, session_id, question_index, total_questions))
+
+    def rescan(self):
+        """Queue the active sessions whose question started since the last scan"""
+        now = timezone.now()
+        sessions = GameSession.objects.filter(status='active')
+        if self._last_scan is not None:
+            sessions = sessions.filter(question_started_at__gte=self._last_scan - RESCAN_OVERLAP)
+        self._last_scan = now
+
+        sessions = list(sessions.values(
+            'id', 'quiz_id', 'current_question_index', 'started_at', 'question_started_at'
+        ))
+        if not sessions:
+            return 0
+
+        time_limits = {}
+        questions = Question.objects.filter(
+            quiz_id__in={session['quiz_id'] for session in sessions}
+        ).order_by('order').values_list('quiz_id', 'time_limit')
+        for quiz_id, time_limit in questions:
+            time_limits.setdefault(quiz_id, []).append(time_limit)
+
+        for session in sessions:
+            limits = time_limits.get(session['quiz_id'], [])
+            index = session['current_question_index']
+            started = session['question_started_at'] or session['started_at'] or now
+            time_limit = limits[index] if index < len(limits) else 0
+            self.schedule(session['id'], index, started + timedelta(seconds=time_limit), len(limits))
+
+        return len(sessions)
+
+    def pop_due(self, now):
+        """Remove and return the queued questions whose deadline has passed"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, session_id, question_index, total_questions = heapq.heappop(self._heap)
+            self._scheduled.discard((session_id, question_index))
+            due.append((session_id, question_index, total_questions))
+        return due
+
+    def seconds_until_next(self, now):
+        """Seconds until the earliest queued deadline, or None when nothing is queued"""
+        if not self._heap:
+            return None
+        return max(0, (self._heap[0][0] - now).total_seconds())
+
+    def fire(self, session_id, question_index, total_questions):
+        """Advance the session past ``question_index`` unless someone already did"""
+        session = GameSession.objects.filter(
+            pk=session_id, status='active', current_question_index=question_index
+        ).first()
+        if session is None or not advance_question(session, total_questions):
+            return False
+
+        logger.info(f"⏰ Auto-advanced session {session_id} past question {question_index + 1} due to time expiry")
+        event = 'game_finished' if session.status == 'finished' else 'question_advanced'
+        publish_session_event(session, event, auto_advanced=True)
+        return True
+
+    def tick(self):
+        """Rescan, then advance every session whose question has expired"""
+        # Long-running callers never go through the request cycle that recycles connections
+        close_old_connections()
+        self.rescan()
+        for session_id, question_index, total_questions in self.pop_due(timezone.now()):
+            try:
+                self.fire(session_id, question_index, total_questions)
+            except Exception as e:
+                logger.error(f"Failed to advance session {session_id}: {e}")
+                retry_at = timezone.now() + timedelta(seconds=self.rescan_interval)
+                self.schedule(session_id, question_index, retry_at, total_questions)
+        return self.seconds_until_next(timezone.now())
+
+    async def run(self):
+        """Run until cancelled"""
+        logger.info("⏱️ Question timer started")
+        while True:
+            try:
+                wait = await sync_to_async(self.tick)()
+            except Exception as e:
+                logger.error(f"Question timer tick failed: {e}")
+                wait = None
+
+            if wait is None or wait > self.rescan_interval:
+                wait = self.rescan_interval
+            await asyncio.sleep(wait)
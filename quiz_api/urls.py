@@ -14,7 +14,6 @@ urlpatterns = [
 
     # Additional custom endpoints
     path('my-quizzes/', views.user_quizzes, name='user_quizzes'),
-    path('sessions/<int:pk>/current_question/', views.get_current_question, name='session-current-question'),
 
     # Test AI service endpoint
     path('test-ai/', views.test_ai_service, name='test_ai_service'),
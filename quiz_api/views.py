@@ -4,21 +4,67 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from django.db import IntegrityError, transaction
 import logging
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
-from .models import Quiz, Question, GameSession, Player, PlayerAnswer
+from .models import Quiz, Question, GameSession, Player, PlayerAnswer, QuestionStats, QuizGenerationJob
 from .serializers import (
     QuizSerializer, QuizCreateSerializer, GameSessionSerializer,
-    PlayerSerializer, JoinQuizSerializer, SubmitAnswerSerializer,
-    QuestionSerializer, PlayerAnswerSerializer
+    PlayerSerializer, JoinQuizSerializer, JoinedPlayerSerializer, SubmitAnswerSerializer,
+    QuestionSerializer, PlayerAnswerSerializer, QuizGenerationJobSerializer, BankQuizSerializer
 )
 from .ai_service import QuizAIService
+from .jobs import enqueue_generation_job
+from .join_codes import get_join_code_resolver
+from .materialize import import_questions, iter_csv, iter_ndjson, materialize_quiz
+from .metrics import get_metrics, render
+from .question_bank import assemble_questions
+from .events import publish_answer_received, publish_player_joined, publish_session_event
+from .game_state import (
+    QUESTION_FIELDS, advance_question, build_final_scores, build_game_state, build_player_state, load_game_state_delta,
+    load_leaderboard, load_player_session_id, load_player_view, load_snapshot, session_position, snapshot_question,
+    store_answer, store_player, store_session
+)
+from .leaderboard import PLAYER_TOP
 
 logger = logging.getLogger(__name__)
 
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+
+
+def state_etag(version):
+    """ETag for a session's live state version"""
+    return quote_etag(str(version))
+
+
+def not_modified(request, etag):
+    """A bodyless 304 when the client already holds this version, otherwise None"""
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        return response
+    return None
+
+
+def positive_int_param(request, name):
+    """An optional positive integer query parameter; raises ValueError when malformed"""
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError(f'{name} must be a positive integer')
+    return int(value)
+
+
+def with_etag(response, etag):
+    # no-cache: clients may keep the body but must revalidate every time
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 
 class QuizViewSet(viewsets.ModelViewSet):
     """ViewSet for Quiz CRUD operations and AI generation"""
@@ -94,45 +140,23 @@ class QuizViewSet(viewsets.ModelViewSet):
         title = serializer.validated_data['title']
         topic = serializer.validated_data['topic']
         difficulty = serializer.validated_data.get('difficulty', 'medium')
+        num_questions = serializer.validated_data['num_questions']
 
-        logger.info(f"Creating AI quiz: {title} about {topic} ({difficulty})")
+        logger.info(f"Creating AI quiz: {title} about {topic} ({difficulty}, {num_questions} questions)")
 
         try:
             with transaction.atomic():
-                # Create the quiz
+                # Create the quiz; its questions are generated in the background
                 quiz = Quiz.objects.create(
                     host=request.user,
                     title=title,
                     topic=topic,
                     difficulty=difficulty
                 )
+                job = QuizGenerationJob.objects.create(quiz=quiz, num_questions=num_questions)
+                enqueue_generation_job(job)
 
-                logger.info(f"Quiz created: ID={quiz.id}, Host={quiz.host.username}")
-
-                # Generate questions with AI
-                ai_service = QuizAIService()
-                try:
-                    questions_data = ai_service.generate_quiz_questions(
-                        topic=topic,
-                        difficulty=difficulty,
-                        num_questions=5
-                    )
-                    logger.info(f"AI generated {len(questions_data)} questions")
-                except Exception as e:
-                    logger.warning(f"AI service failed, using sample questions: {str(e)}")
-                    # Fallback to sample questions
-                    questions_data = ai_service.generate_sample_questions(topic, difficulty)
-
-                # Create question objects
-                for idx, q_data in enumerate(questions_data):
-                    question = Question.objects.create(
-                        quiz=quiz,
-                        question_text=q_data['question'],
-                        correct_answer=q_data['correct_answer'],
-                        wrong_answers=q_data['wrong_answers'],
-                        order=idx
-                    )
-                    logger.info(f"Created question {idx + 1}: {question.question_text[:50]}...")
+                logger.info(f"Quiz created: ID={quiz.id}, Host={quiz.host.username}, generation job {job.id}")
 
                 # Update user stats (if field exists)
                 try:
@@ -142,11 +166,6 @@ class QuizViewSet(viewsets.ModelViewSet):
                 except Exception as e:
                     logger.warning(f"Could not update user stats: {e}")
 
-                # Return the created quiz with questions
-                quiz_serializer = QuizSerializer(quiz)
-                logger.info(f"Quiz creation successful: {quiz.title} (ID: {quiz.id})")
-                return Response(quiz_serializer.data, status=status.HTTP_201_CREATED)
-
         except Exception as e:
             logger.error(f"Error creating quiz: {str(e)}")
             return Response(
@@ -154,6 +173,84 @@ class QuizViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        data = QuizGenerationJobSerializer(job).data
+        data['title'] = quiz.title
+        data['status_url'] = request.build_absolute_uri(f'/api/quizzes/{quiz.id}/generation_status/')
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'], serializer_class=BankQuizSerializer)
+    def from_bank(self, request):
+        """Create a quiz from banked questions on the topic, without calling the AI"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        difficulty = data.get('difficulty')
+
+        with transaction.atomic():
+            questions = assemble_questions(data['topic'], difficulty, data['num_questions'])
+            if not questions:
+                return Response(
+                    {'error': 'No banked questions for this topic yet'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+            quiz = materialize_quiz(
+                request.user, data['title'], data['topic'], difficulty or 'medium', questions
+            )
+            request.user.total_quizzes_hosted = getattr(request.user, 'total_quizzes_hosted', 0) + 1
+            request.user.save(update_fields=['total_quizzes_hosted'])
+
+        logger.info(f"🏦 Quiz {quiz.id} assembled from {len(questions)} banked questions")
+        return Response(QuizSerializer(quiz).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def generation_status(self, request, pk=None):
+        """Progress of the quiz's AI generation job: the questions saved so far, then the quiz"""
+        quiz = self.get_object()
+        job = QuizGenerationJob.objects.filter(quiz=quiz).first()
+        if job is None:
+            return Response(
+                {'error': 'Quiz was not generated with AI'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        data = QuizGenerationJobSerializer(job).data
+        if job.status == 'completed':
+            data['quiz'] = QuizSerializer(quiz).data
+        else:
+            # Questions are saved one by one while a completion streams in
+            data['questions'] = QuestionSerializer(quiz.questions.all(), many=True).data
+        return Response(data)
+
+    @action(detail=True, methods=['post'])
+    def import_questions(self, request, pk=None):
+        """
+        Append questions streamed as NDJSON (one question object per line) or
+        CSV (question, correct_answer, wrong_answer_1..3, time_limit). The body
+        is read line by line and written in batches, so imports of any size
+        run in constant memory.
+        """
+        quiz = self.get_object()
+
+        content_type = request.content_type.split(';')[0].strip()
+        if content_type in NDJSON_CONTENT_TYPES:
+            rows = iter_ndjson(request._request)
+        elif content_type == 'text/csv':
+            rows = iter_csv(request._request)
+        else:
+            return Response(
+                {'error': 'Send application/x-ndjson or text/csv'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+
+        try:
+            result = import_questions(quiz, rows)
+        except UnicodeDecodeError:
+            return Response({'error': 'Body must be UTF-8'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result['question_count'] = quiz.questions.count()
+        return Response(result)
+
     @action(detail=True, methods=['post'])
     def start_session(self, request, pk=None):
         """Start a new game session for a quiz"""
@@ -169,9 +266,16 @@ class QuizViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Create new session
-        session = GameSession.objects.create(quiz=quiz)
-        logger.info(f"Session created: {session.id} for quiz: {quiz.id}")
+        # Players join the quiz's one live session, so reuse it while it is
+        # still waiting; a running game is not restarted
+        session, created = GameSession.get_or_create_live(quiz.id)
+        if session.status == 'active':
+            logger.warning(f"Quiz {quiz.id} already has a running session: {session.id}")
+            return Response(
+                {'error': 'This quiz already has a game in progress', 'session_id': session.id},
+                status=status.HTTP_409_CONFLICT
+            )
+        logger.info(f"Session {'created' if created else 'reused'}: {session.id} for quiz: {quiz.id}")
 
         serializer = GameSessionSerializer(session)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -180,8 +284,7 @@ class QuizViewSet(viewsets.ModelViewSet):
     def deactivate(self, request, pk=None):
         """Deactivate a quiz"""
         quiz = self.get_object()
-        quiz.is_active = False
-        quiz.save()
+        quiz.deactivate()
 
         logger.info(f"Quiz {quiz.id} deactivated by user: {request.user}")
         return Response({'status': 'Quiz deactivated'})
@@ -189,7 +292,7 @@ class QuizViewSet(viewsets.ModelViewSet):
 
 class GameSessionViewSet(viewsets.ModelViewSet):
     """ViewSet for game session management"""
-    queryset = GameSession.objects.all()
+    queryset = GameSession.objects.select_related('quiz')
     serializer_class = GameSessionSerializer
     permission_classes = [AllowAny]  # Allow anyone to join games
 
@@ -212,58 +315,52 @@ class GameSessionViewSet(viewsets.ModelViewSet):
 
         print(f"LOOKING FOR QUIZ: join_code={join_code}, nickname={nickname}")  # Debug log
 
-        # Find active quiz with this code
-        try:
-            quiz = Quiz.objects.get(
-                join_code=join_code.upper(),
-                is_active=True
-            )
-            print(f"FOUND QUIZ: {quiz.title} (ID: {quiz.id})")  # Debug log
-        except Quiz.DoesNotExist:
-            print(f"QUIZ NOT FOUND: {join_code}")  # Debug log
-            return Response(
-                {'error': f'Quiz with code {join_code} not found or inactive'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Get or create active session
-        session = GameSession.objects.filter(
-            quiz=quiz,
-            status__in=['waiting', 'active']
-        ).first()
+        # Resolved from memory for everyone after the storm's first join; a
+        # cached session that has since finished, or whose quiz was
+        # deactivated in another process, is caught by the joinable-only
+        # version bump, and the code is then resolved again from the database
+        resolver = get_join_code_resolver()
+        for fresh in (False, True):
+            target = resolver.resolve(join_code.upper(), fresh=fresh)
+            if target is None:
+                print(f"QUIZ NOT FOUND: {join_code}")  # Debug log
+                return Response(
+                    {'error': f'Quiz with code {join_code} not found or inactive'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
 
-        if not session:
-            session = GameSession.objects.create(quiz=quiz)
-            print(f"CREATED NEW SESSION: {session.id}")  # Debug log
+            try:
+                with transaction.atomic():
+                    if GameSession.bump_state_version(target['session_id'], joinable_only=True) is None:
+                        continue
+                    # Nicknames are unique per session by constraint, not by a lookup first
+                    player = Player.objects.create(session_id=target['session_id'], nickname=nickname)
+                    store_player(player)
+                    publish_player_joined(player.session_id)
+            except IntegrityError:
+                print(f"NICKNAME ALREADY EXISTS: {nickname}")  # Debug log
+                return Response(
+                    {'error': f'Nickname "{nickname}" already taken in this session'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            break
         else:
-            print(f"USING EXISTING SESSION: {session.id}")  # Debug log
-
-        # Check if nickname already exists in session
-        if session.players.filter(nickname=nickname).exists():
-            print(f"NICKNAME ALREADY EXISTS: {nickname}")  # Debug log
             return Response(
-                {'error': f'Nickname "{nickname}" already taken in this session'},
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': 'The game session just ended, please try again'},
+                status=status.HTTP_409_CONFLICT
             )
 
-        # Create player
-        try:
-            player = Player.objects.create(
-                session=session,
-                nickname=nickname
-            )
-            print(f"CREATED PLAYER: {player.nickname} (ID: {player.id})")  # Debug log
-        except Exception as e:
-            print(f"ERROR CREATING PLAYER: {str(e)}")  # Debug log
-            return Response(
-                {'error': f'Failed to create player: {str(e)}'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        print(f"CREATED PLAYER: {player.nickname} (ID: {player.id})")  # Debug log
 
-        # Return player and session info
+        # Only what the joining player needs; the room comes with the next poll or event
         response_data = {
-            'player': PlayerSerializer(player).data,
-            'session': GameSessionSerializer(session).data
+            'player': JoinedPlayerSerializer(player).data,
+            'session': {
+                'id': target['session_id'],
+                'quiz': target['quiz_id'],
+                'quiz_title': target['quiz_title'],
+                'total_questions': target['total_questions'],
+            }
         }
         print(f"JOIN SUCCESS: {response_data}")  # Debug log
 
@@ -271,138 +368,34 @@ class GameSessionViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def game_state(self, request, pk=None):
-        """Get current game state with precise timing and response tracking"""
-        try:
-            session = self.get_object()
-
-            # Get current question with timing
-            questions = session.quiz.questions.all().order_by('order')
-            total_questions = questions.count()
-            current_question = None
-            time_left = 0
-            question_start_time = None
-            auto_advanced = False
-            responses_received = 0
-
-            if session.status == 'active' and session.current_question_index < total_questions:
-                current_question = questions[session.current_question_index]
-
-                # Calculate time left based on when question started
-                if session.question_started_at:
-                    question_start_time = session.question_started_at
-                else:
-                    # Fallback to session updated time
-                    question_start_time = session.updated_at or timezone.now()
-
-                elapsed = (timezone.now() - question_start_time).total_seconds()
-                time_left = max(0, 20 - elapsed)  # 20 second questions
-
-                # FIXED: Count responses for current question
-                responses_received = PlayerAnswer.objects.filter(
-                    player__session=session,
-                    question=current_question,
-                    player__is_active=True
-                ).count()
-
-                # 🚀 AUTO-ADVANCE LOGIC: If time is up, automatically move to next question
-                if time_left <= 0:
-                    logger.info(
-                        f"⏰ Auto-advancing from question {session.current_question_index + 1} due to time expiry")
-
-                    # Move to next question
-                    session.current_question_index += 1
-
-                    # Check if quiz is complete
-                    if session.current_question_index >= total_questions:
-                        session.status = 'finished'
-                        session.ended_at = timezone.now()
-                        session.save()
-
-                        # Return final results
-                        players = session.players.filter(is_active=True).order_by('-score', 'joined_at')
-                        return Response({
-                            'session_id': session.id,
-                            'status': 'finished',
-                            'current_question_index': session.current_question_index,
-                            'total_questions': total_questions,
-                            'final_scores': PlayerSerializer(players, many=True).data,
-                            'players': PlayerSerializer(players, many=True).data,  # Add this for compatibility
-                            'player_count': players.count(),  # Add this
-                            'server_time': timezone.now().isoformat()
-                        })
-                    else:
-                        # Start new question
-                        session.question_started_at = timezone.now()
-                        session.save()
-
-                        # Get new current question
-                        current_question = questions[session.current_question_index]
-                        question_start_time = session.question_started_at
-                        time_left = 20  # Fresh timer for new question
-                        auto_advanced = True
-
-                        # Reset response count for new question
-                        responses_received = 0
-
-                        logger.info(f"✅ Auto-advanced to question {session.current_question_index + 1}")
-
-            # FIXED: Handle finished status properly
-            elif session.status == 'finished' or session.current_question_index >= total_questions:
-                if session.status != 'finished':
-                    session.status = 'finished'
-                    session.ended_at = timezone.now()
-                    session.save()
-
-                players = session.players.filter(is_active=True).order_by('-score', 'joined_at')
-                return Response({
-                    'session_id': session.id,
-                    'status': 'finished',
-                    'current_question_index': session.current_question_index,
-                    'total_questions': total_questions,
-                    'final_scores': PlayerSerializer(players, many=True).data,
-                    'players': PlayerSerializer(players, many=True).data,  # Add this for compatibility
-                    'player_count': players.count(),  # Add this
-                    'server_time': timezone.now().isoformat()
-                })
-
-            # Get active players with scores and response status
-            players = session.players.filter(is_active=True).order_by('-score', 'joined_at')
-
-            # ENHANCED: Add response status to each player
-            players_data = []
-            for player in players:
-                player_data = PlayerSerializer(player).data
-
-                # Check if this player has answered the current question
-                if current_question:
-                    has_answered = PlayerAnswer.objects.filter(
-                        player=player,
-                        question=current_question
-                    ).exists()
-                    player_data['has_answered'] = has_answered
-                else:
-                    player_data['has_answered'] = False
-
-                players_data.append(player_data)
-
-            response_data = {
-                'session_id': session.id,
-                'status': session.status,
-                'current_question_index': session.current_question_index,
-                'total_questions': total_questions,
-                'time_left': round(time_left, 1),
-                'question_start_time': question_start_time.isoformat() if question_start_time else None,
-                'current_question': QuestionSerializer(current_question).data if current_question else None,
-                'players': players_data,
-                'player_count': players.count(),
-                'responses_received': responses_received,  # FIXED: Add response count
-                'server_time': timezone.now().isoformat(),
-                'auto_advanced': auto_advanced
-            }
-
-            return Response(response_data)
+        """
+        Get current game state with precise timing and response tracking.
+        With ``?delta_since=<state_version>`` only what changed since that
+        version is sent (see ``build_game_state_delta``).
+        """
+        delta_since = request.query_params.get('delta_since')
+        if delta_since is not None:
+            try:
+                delta_since = int(delta_since)
+            except ValueError:
+                return Response(
+                    {'error': 'delta_since must be a state version number'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        except GameSession.DoesNotExist:
+        try:
+            # Served from the hot state store; the database is only read on a miss.
+            # Expired questions are advanced by the question timer, never by a read.
+            if delta_since is not None:
+                delta = load_game_state_delta(pk, delta_since)
+                etag = state_etag(delta['state_version'])
+                return not_modified(request, etag) or with_etag(Response(delta), etag)
+
+            snapshot = load_snapshot(pk)
+            etag = state_etag(snapshot['state_version'])
+            return not_modified(request, etag) or with_etag(Response(build_game_state(snapshot)), etag)
+
+        except (GameSession.DoesNotExist, ValueError):
             return Response(
                 {'error': 'Session not found'},
                 status=status.HTTP_404_NOT_FOUND
@@ -414,24 +407,24 @@ class GameSessionViewSet(viewsets.ModelViewSet):
         session = self.get_object()
 
         # Check if user is the host
-        if request.user != session.quiz.host:
+        if request.user.id != session.quiz.host_id:
             return Response(
                 {'error': 'Only the host can end the game'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
         # End the game
-        session.status = 'finished'
-        session.ended_at = timezone.now()
-        session.save()
+        previous = session_position(session)
+        session.apply_state({'status': 'finished', 'ended_at': timezone.now()})
+        store_session(session, previous)
+        publish_session_event(session, 'game_finished')
 
         logger.info(f"🛑 Game ended by host for session {session.id}")
 
         # Return final results
-        players = session.players.filter(is_active=True).order_by('-score', 'joined_at')
         return Response({
             'status': 'Game ended by host',
-            'final_scores': PlayerSerializer(players, many=True).data
+            'final_scores': build_final_scores(session)
         })
 
 
@@ -441,7 +434,7 @@ class GameSessionViewSet(viewsets.ModelViewSet):
         session = self.get_object()
 
         # Check if user is the host
-        if request.user != session.quiz.host:
+        if request.user.id != session.quiz.host_id:
             return Response(
                 {'error': 'Only the host can start the game'},
                 status=status.HTTP_403_FORBIDDEN
@@ -455,11 +448,13 @@ class GameSessionViewSet(viewsets.ModelViewSet):
             )
 
         # Start the game with precise timing
-        session.status = 'active'
-        session.started_at = timezone.now()
-        session.current_question_index = 0
-        session.question_started_at = timezone.now()  # ADD THIS LINE
-        session.save()
+        now = timezone.now()
+        previous = session_position(session)
+        session.apply_state({
+            'status': 'active', 'started_at': now, 'current_question_index': 0, 'question_started_at': now
+        })
+        store_session(session, previous)
+        publish_session_event(session, 'game_started')
 
         # Get first question
         first_question = session.quiz.questions.first()
@@ -477,49 +472,28 @@ class GameSessionViewSet(viewsets.ModelViewSet):
         session = self.get_object()
 
         # Check if user is the host
-        if request.user != session.quiz.host:
+        if request.user.id != session.quiz.host_id:
             return Response(
                 {'error': 'Only the host can control questions'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Get current state to avoid race conditions
         total_questions = session.quiz.questions.count()
 
-        # If already at or past the last question, don't advance further
-        if session.current_question_index >= total_questions - 1:
-            # Mark as finished
-            session.status = 'finished'
-            session.ended_at = timezone.now()
-            session.save()
-
-            # Return final results
-            players = session.players.filter(is_active=True).order_by('-score', 'joined_at')
-            return Response({
-                'status': 'Quiz completed',
-                'final_scores': PlayerSerializer(players, many=True).data
-            })
-
-        # Increment question index
-        session.current_question_index += 1
-
-        # Check if quiz is complete after increment
-        if session.current_question_index >= total_questions:
-            session.status = 'finished'
-            session.ended_at = timezone.now()
-            session.save()
+        # Compare-and-swap, so a click racing the question timer can't skip a question
+        if advance_question(session, total_questions):
+            event = 'game_finished' if session.status == 'finished' else 'question_advanced'
+            publish_session_event(session, event)
+        else:
+            session.refresh_from_db()
 
+        if session.status == 'finished':
             # Return final results
-            players = session.players.filter(is_active=True).order_by('-score', 'joined_at')
             return Response({
                 'status': 'Quiz completed',
-                'final_scores': PlayerSerializer(players, many=True).data
+                'final_scores': build_final_scores(session)
             })
 
-        # Set new question start time - CRITICAL FOR SYNC!
-        session.question_started_at = timezone.now()
-        session.save()
-
         # Get current question
         current_question = session.quiz.questions.all().order_by('order')[session.current_question_index]
 
@@ -534,36 +508,113 @@ class GameSessionViewSet(viewsets.ModelViewSet):
             'manually_advanced': True  # NEW: Flag to indicate manual advance
         })
 
+    @action(detail=True, methods=['get'])
+    def answer_stats(self, request, pk=None):
+        """
+        Live answer histograms (host only): responses, correct answers, the
+        count of each option and the mean answer time of every question
+        answered so far, or of ``?question=<id>``. Read from counters kept by
+        submit_answer, without aggregating the answers.
+        """
+        session = self.get_object()
+
+        if request.user.id != session.quiz.host_id:
+            return Response(
+                {'error': 'Only the host can see the answer statistics'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            question_id = positive_int_param(request, 'question')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        stats = session.question_stats.order_by('question__order')
+        if question_id is not None:
+            stats = stats.filter(question_id=question_id)
+
+        return Response({
+            'session_id': session.id,
+            'questions': [question.histogram() for question in stats]
+        })
+
+    @action(detail=True, methods=['get'])
+    def current_question(self, request, pk=None):
+        """Get current question for a session"""
+        session = self.get_object()
+        logger.info(f"Getting current question for session {session.id}, status: {session.status}")
+
+        etag = state_etag(session.state_version)
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
+
+        if session.status == 'waiting':
+            return with_etag(Response({
+                'session_id': session.id,
+                'status': 'waiting',
+                'message': 'Game has not started yet'
+            }), etag)
+
+        # Plain rows in one query: the count and the current question, no serializer
+        questions = list(session.quiz.questions.order_by('order').values(*QUESTION_FIELDS))
+        total_questions = len(questions)
+
+        if session.status == 'finished' or session.current_question_index >= total_questions:
+            # Finishing an exhausted quiz is left to the question timer; reads never write
+            return with_etag(Response({
+                'session_id': session.id,
+                'status': 'finished',
+                'message': 'Game has ended' if session.status == 'finished' else 'Quiz completed'
+            }), etag)
+
+        return with_etag(Response({
+            'session_id': session.id,
+            'question': questions[session.current_question_index],
+            'question_number': session.current_question_index + 1,
+            'total_questions': total_questions,
+            'status': session.status
+        }), etag)
+
     @action(detail=True, methods=['get'])
     def leaderboard(self, request, pk=None):
-        """Get current leaderboard"""
+        """
+        Get current leaderboard. ``?top=K`` returns only the first K players and
+        ``?around_player=<id>`` adds that player's rank and neighbours, so big
+        rooms don't ship every player to every client.
+        """
         print(f"LEADERBOARD REQUEST for session: {pk}")  # Debug log
 
         try:
-            # Make sure we get the session correctly
-            session = self.get_object()
-            print(f"LEADERBOARD SESSION FOUND: {session.id} for quiz {session.quiz.title}")  # Debug log
+            top = positive_int_param(request, 'top')
+            around_player = positive_int_param(request, 'around_player')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Get players with explicit filtering
-            players = session.players.filter(is_active=True).order_by('-score', 'joined_at')
-            print(f"LEADERBOARD PLAYERS FOUND: {players.count()}")  # Debug log
+        try:
+            # Sliced from the incrementally ranked hot snapshot, no sorting per request
+            board = load_leaderboard(pk, top=top, around_player=around_player)
+            print(f"LEADERBOARD SESSION FOUND: {board['session_id']} for quiz {board['quiz_title']}")  # Debug log
 
-            # Log each player for debugging
-            for player in players:
-                print(f"  PLAYER: {player.nickname}, Score: {player.score}, Active: {player.is_active}")
+            etag = state_etag(board['state_version'])
+            unchanged = not_modified(request, etag)
+            if unchanged:
+                return unchanged
 
             response_data = {
-                'leaderboard': PlayerSerializer(players, many=True).data,
-                'session_status': session.status,
-                'session_id': session.id,
-                'quiz_title': session.quiz.title,
-                'total_players': players.count()
+                'session_status': board['status'],
+                'session_id': board['session_id'],
+                'quiz_title': board['quiz_title'],
+                'total_players': board['total_players']
             }
+            for key in ('leaderboard', 'around', 'player_rank'):
+                if key in board:
+                    response_data[key] = board[key]
+            print(f"LEADERBOARD PLAYERS FOUND: {board['total_players']}")  # Debug log
 
-            print(f"LEADERBOARD RESPONSE: {response_data}")  # Debug log
-            return Response(response_data)
+            return with_etag(Response(response_data), etag)
 
-        except GameSession.DoesNotExist:
+        except (GameSession.DoesNotExist, ValueError):
             print(f"LEADERBOARD ERROR: Session {pk} does not exist")  # Debug log
             return Response(
                 {'error': f'Session {pk} not found'},
@@ -583,14 +634,17 @@ class GameSessionViewSet(viewsets.ModelViewSet):
 
 class PlayerViewSet(viewsets.ModelViewSet):
     """ViewSet for player actions"""
-    queryset = Player.objects.all()
+    queryset = Player.objects.select_related('session')
     serializer_class = PlayerSerializer
     permission_classes = [AllowAny]
 
     @action(detail=True, methods=['post'], serializer_class=SubmitAnswerSerializer)
     def submit_answer(self, request, pk=None):
-        """Submit an answer for the current question"""
-        player = self.get_object()
+        """
+        Submit an answer for the current question. The player's session and
+        the question come from the state store, so a warm snapshot leaves
+        three statements: the answer, the player's counters and the stats.
+        """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
@@ -598,57 +652,92 @@ class PlayerViewSet(viewsets.ModelViewSet):
         selected_answer = serializer.validated_data['selected_answer']
         time_taken = serializer.validated_data['time_taken']
 
-        # Get the question
-        question = get_object_or_404(Question, id=question_id)
-
-        # Check if question belongs to the session's quiz
-        if question.quiz != player.session.quiz:
+        try:
+            session_id = load_player_session_id(pk)
+            snapshot = load_snapshot(session_id)
+        except (Player.DoesNotExist, GameSession.DoesNotExist, ValueError):
+            return Response({'error': 'Player not found'}, status=status.HTTP_404_NOT_FOUND)
+        player_id = int(pk)
+
+        question = snapshot_question(snapshot, question_id)
+        if question is None:
+            get_object_or_404(Question, id=question_id)
             return Response(
                 {'error': 'Invalid question for this quiz'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Check if player already answered this question
-        if PlayerAnswer.objects.filter(player=player, question=question).exists():
-            return Response(
-                {'error': 'Already answered this question'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
         # Check if answer is correct
-        is_correct = selected_answer == question.correct_answer
+        is_correct = selected_answer == question['correct_answer']
 
         # Calculate score (base 100 points, bonus for speed)
         score_earned = 0
         if is_correct:
             base_score = 100
             # Bonus points for quick answers (max 50 bonus points)
-            time_bonus = max(0, int(50 * (1 - time_taken / question.time_limit)))
+            time_bonus = max(0, int(50 * (1 - time_taken / question['time_limit'])))
             score_earned = base_score + time_bonus
 
-            player.score += score_earned
-            player.answers_correct += 1
-        else:
-            player.answers_wrong += 1
-
-        # Save the answer
-        answer = PlayerAnswer.objects.create(
-            player=player,
-            question=question,
-            selected_answer=selected_answer,
-            is_correct=is_correct,
-            time_taken=time_taken
-        )
+        # The unique (player, question) constraint rejects duplicates, and the
+        # counters are incremented in the database so concurrent answers never
+        # overwrite each other. Answers don't bump the session's state version:
+        # the snapshot counts them (see served_state_version).
+        try:
+            with transaction.atomic():
+                PlayerAnswer.objects.create(
+                    player_id=player_id,
+                    question_id=question_id,
+                    selected_answer=selected_answer,
+                    is_correct=is_correct,
+                    time_taken=time_taken
+                )
+                counters = Player.add_answer(player_id, score_earned, is_correct)
+                if counters is None:
+                    raise Player.DoesNotExist
+                QuestionStats.record(session_id, question, selected_answer, time_taken)
+        except IntegrityError:
+            return Response(
+                {'error': 'Already answered this question'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Player.DoesNotExist:
+            return Response({'error': 'Player not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        player.save()
+        # The counters as this answer's UPDATE left them, which include any
+        # answer of this player that committed since the snapshot was read
+        player = snapshot['players'].get(player_id)
+        store_answer(session_id, question_id, player and dict(player, **counters))
+        publish_answer_received(session_id)
 
         return Response({
             'is_correct': is_correct,
-            'correct_answer': question.correct_answer,
+            'correct_answer': question['correct_answer'],
             'score_earned': score_earned,
-            'total_score': player.score
+            'total_score': counters['score']
         })
 
+    @action(detail=True, methods=['get'])
+    def state(self, request, pk=None):
+        """
+        The player's own view of the game: phase, current question, time
+        left, their score and rank, and the top ``?top=K`` players (5 by
+        default). Served from the session's hot snapshot in one query, for
+        player screens; hosts use the session's full ``game_state``.
+        """
+        try:
+            top = positive_int_param(request, 'top') or PLAYER_TOP
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session_id = get_object_or_404(Player.objects.values_list('session_id', flat=True), pk=pk)
+            view = load_player_view(session_id, int(pk), top=top)
+        except (GameSession.DoesNotExist, ValueError):
+            return Response({'error': 'Player not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        etag = state_etag(view['state_version'])
+        return not_modified(request, etag) or with_etag(Response(build_player_state(view)), etag)
+
     @action(detail=True, methods=['get'])
     def results(self, request, pk=None):
         """Get player's complete results"""
@@ -682,65 +771,13 @@ class PlayerViewSet(viewsets.ModelViewSet):
             'count': quizzes.count()
         })
 
-    @api_view(['GET'])
-    def get_current_question(request, pk):
-        """Get current question for a session - Fixed function"""
-        try:
-            session = GameSession.objects.get(pk=pk)
-            logger.info(f"Getting current question for session {session.id}, status: {session.status}")
-
-            if session.status == 'waiting':
-                return Response({
-                    'session_id': session.id,
-                    'status': 'waiting',
-                    'message': 'Game has not started yet'
-                })
-
-            if session.status == 'finished':
-                return Response({
-                    'session_id': session.id,
-                    'status': 'finished',
-                    'message': 'Game has ended'
-                })
-
-            # Get current question
-            questions = session.quiz.questions.all().order_by('order')
-            total_questions = questions.count()
-
-            if session.current_question_index < total_questions:
-                current_question = questions[session.current_question_index]
-
-                return Response({
-                    'session_id': session.id,
-                    'question': QuestionSerializer(current_question).data,
-                    'question_number': session.current_question_index + 1,
-                    'total_questions': total_questions,
-                    'status': session.status
-                })
-            else:
-                # Quiz completed
-                session.status = 'finished'
-                session.ended_at = timezone.now()
-                session.save()
-
-                return Response({
-                    'session_id': session.id,
-                    'status': 'finished',
-                    'message': 'Quiz completed'
-                })
-
-        except GameSession.DoesNotExist:
-            logger.error(f"Session {pk} not found")
-            return Response(
-                {'error': 'Session not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
 
 # Add test endpoint for debugging
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
 import json
 
 
@@ -781,3 +818,21 @@ def test_ai_service(request):
             'error': str(e)
         }, status=500)
 
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """Prometheus metrics of every worker process, plus live session and player gauges"""
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+
+    gauges = {
+        'quiz_active_sessions': GameSession.objects.filter(status__in=GameSession.LIVE_STATUSES).count(),
+        'quiz_active_players': Player.objects.filter(
+            is_active=True, session__status__in=GameSession.LIVE_STATUSES
+        ).count(),
+    }
+    return HttpResponse(
+        render(get_metrics().collect(), gauges),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
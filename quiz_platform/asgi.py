@@ -2,15 +2,49 @@
 ASGI config for quiz_platform project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the project through this module (rather than WSGI) so the live game
+event streams in ``quiz_api.streams`` are held open on the event loop instead
+of tying up a worker thread per connected client.
+
+Unless QUESTION_TIMER_IN_PROCESS is off, the ASGI lifespan startup also
+starts the question timer that auto-advances expired questions.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quiz_platform.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from quiz_api.jobs import generation_runner  # noqa: E402
+from quiz_api.timers import QuestionTimerScheduler  # noqa: E402
+
+
+async def lifespan(receive, send):
+    timer_task = None
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if settings.QUESTION_TIMER_IN_PROCESS:
+                timer_task = asyncio.create_task(QuestionTimerScheduler().run())
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if timer_task is not None:
+                timer_task.cancel()
+            generation_runner.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    else:
+        await django_application(scope, receive, send)
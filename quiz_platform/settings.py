@@ -5,8 +5,10 @@ Fixed for static files deployment on Render.
 
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 import os
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -40,7 +42,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'quiz_api.static_files.AsyncWhiteNoiseMiddleware',
+    'quiz_api.metrics.MetricsMiddleware',
+    'quiz_api.db_router.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -95,6 +99,20 @@ else:
         }
     }
 
+# Optional read replica: reads of GET requests go to it, everything else to
+# the primary (see quiz_api.db_router). A client that wrote keeps reading from
+# the primary for DATABASE_REPLICA_LAG seconds, the most the replica may lag.
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default=None)
+DATABASE_READ_REPLICA = config('DATABASE_READ_REPLICA', default='replica')
+DATABASE_REPLICA_LAG = config('DATABASE_REPLICA_LAG', default=5.0, cast=float)
+
+if DATABASE_REPLICA_URL:
+    DATABASES[DATABASE_READ_REPLICA] = dj_database_url.parse(DATABASE_REPLICA_URL)
+    # Tests read the replica through the test database
+    DATABASES[DATABASE_READ_REPLICA]['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['quiz_api.db_router.PrimaryReplicaRouter']
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -156,6 +174,10 @@ if not DEBUG:
         "https://*.onrender.com",
     ])
 
+# Live endpoints answer If-None-Match with 304 Not Modified
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match')
+CORS_EXPOSE_HEADERS = ['ETag']
+
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:63342",
     "http://127.0.0.1:63342",
@@ -196,10 +218,77 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # Same bytes as DRF's JSONRenderer, encoded with orjson
+    'DEFAULT_RENDERER_CLASSES': [
+        'quiz_api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10
 }
 
+# Hot game-state store: 'memory' (single process) or 'redis' (shared by all workers)
+GAME_STATE_STORE = config('GAME_STATE_STORE', default='memory')
+GAME_STATE_REDIS_URL = config('GAME_STATE_REDIS_URL', default='redis://localhost:6379/0')
+
+# Writes per session remembered for ?delta_since= game states; clients
+# further behind than this get the full state
+GAME_STATE_LOG_SIZE = config('GAME_STATE_LOG_SIZE', default=1000, cast=int)
+
+# Run the question timer inside the ASGI app. Turn off when it runs as its
+# own process (python manage.py run_question_timer)
+QUESTION_TIMER_IN_PROCESS = config('QUESTION_TIMER_IN_PROCESS', default=True, cast=bool)
+
+# Each process would serve its own memory snapshots, blind to the writes of
+# the others (more gunicorn workers, or a separate question timer)
+if GAME_STATE_STORE == 'memory' and (
+    config('WEB_CONCURRENCY', default=1, cast=int) > 1 or not QUESTION_TIMER_IN_PROCESS
+):
+    raise ImproperlyConfigured(
+        "GAME_STATE_STORE='memory' needs a single worker running the question timer; use 'redis'"
+    )
+
+# Generate AI quizzes on a thread pool inside each web process. Turn off
+# when jobs are drained by their own process (python manage.py run_generation_jobs)
+QUIZ_GENERATION_IN_PROCESS = config('QUIZ_GENERATION_IN_PROCESS', default=True, cast=bool)
+QUIZ_GENERATION_WORKERS = config('QUIZ_GENERATION_WORKERS', default=2, cast=int)
+
+# Shared keep-alive HTTP client for OpenRouter: requests in flight per
+# process, retries of 429/5xx/timeouts, and the first backoff step (seconds)
+AI_HTTP_MAX_CONCURRENCY = config('AI_HTTP_MAX_CONCURRENCY', default=8, cast=int)
+AI_HTTP_MAX_RETRIES = config('AI_HTTP_MAX_RETRIES', default=3, cast=int)
+AI_HTTP_BACKOFF_BASE = config('AI_HTTP_BACKOFF_BASE', default=0.5, cast=float)
+
+# Chat completions endpoint; point it at a local stand-in for load tests
+OPENROUTER_API_URL = config('OPENROUTER_API_URL', default='https://openrouter.ai/api/v1/chat/completions')
+
+# Stream completions and save each generated question as soon as it is parsed
+AI_STREAM_COMPLETIONS = config('AI_STREAM_COMPLETIONS', default=True, cast=bool)
+
+# Cache of generated question sets: LRU entries kept in memory, lifetime of
+# a cached set (seconds, memory and database), and how many different sets
+# to rotate through for the same topic
+QUESTION_CACHE_SIZE = config('QUESTION_CACHE_SIZE', default=256, cast=int)
+QUESTION_CACHE_TTL = config('QUESTION_CACHE_TTL', default=7 * 24 * 60 * 60, cast=int)
+QUESTION_CACHE_VARIANTS = config('QUESTION_CACHE_VARIANTS', default=1, cast=int)
+
+# Join codes are a keyed shuffle of quiz ids; changing the key changes which
+# codes new quizzes get. It is its own setting, so rotating SECRET_KEY leaves
+# codes alone; deployments set one so codes can't be worked out from quiz ids.
+# Codes of deactivated quizzes are handed out again after the recycle delay
+# (seconds).
+JOIN_CODE_KEY = config('JOIN_CODE_KEY', default='quiz-platform-join-codes')
+JOIN_CODE_RECYCLE_DELAY = config('JOIN_CODE_RECYCLE_DELAY', default=24 * 60 * 60, cast=int)
+
+# Seconds a join code's live session is served from memory to joining players
+JOIN_CODE_CACHE_TTL = config('JOIN_CODE_CACHE_TTL', default=10, cast=int)
+
+# Directory shared by all worker processes for /metrics (empty: this process
+# only). Empty it before starting the server. With a token, scrapes must send
+# "Authorization: Bearer <token>".
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 # Custom user model
 AUTH_USER_MODEL = 'authentication.User'
 
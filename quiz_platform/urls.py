@@ -4,7 +4,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
 from rest_framework.routers import DefaultRouter
-from quiz_api.views import QuizViewSet, GameSessionViewSet, PlayerViewSet
+from quiz_api.views import QuizViewSet, GameSessionViewSet, PlayerViewSet, metrics
+from quiz_api.streams import game_state, player_events, session_events
 
 # Create the router and register viewsets
 router = DefaultRouter()
@@ -17,9 +18,15 @@ urlpatterns = [
     path('admin/', admin.site.urls),
 
     # API endpoints
+    path('api/sessions/<int:pk>/events/', session_events, name='session-events'),
+    path('api/sessions/<int:pk>/game_state/', game_state, name='session-game-state'),
+    path('api/players/<int:pk>/events/', player_events, name='player-events'),
     path('api/', include(router.urls)),
     path('api/auth/', include('authentication.urls')),
 
+    # Prometheus scrape endpoint
+    path('metrics', metrics, name='metrics'),
+
     # Frontend pages - serve HTML templates
     path('', TemplateView.as_view(template_name='index.html'), name='home'),
     path('register/', TemplateView.as_view(template_name='register.html'), name='register'),
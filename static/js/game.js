@@ -128,26 +128,20 @@ class GameManager {
         return Date.now() + this.serverTimeOffset;
     }
 
-    // ENHANCED: Fast polling with auto-advance detection
+    // Subscribe once to pushed game state; LiveSessionChannel polls only as a fallback
     startFastPolling() {
         if (this.pollTimer) {
-            clearInterval(this.pollTimer);
+            this.pollTimer.stop();
         }
 
-        console.log('🚀 Starting fast polling with auto-advance detection...');
-
-        this.pollTimer = setInterval(async () => {
-            try {
-                const gameState = await api.getGameState(this.sessionId);
-                this.handleGameStateUpdate(gameState);
-            } catch (error) {
-                console.error('Polling error:', error);
-                if (this.pollTimer) {
-                    clearInterval(this.pollTimer);
-                    setTimeout(() => this.startFastPolling(), 2000);
-                }
-            }
-        }, 500); // Poll every 500ms for real-time sync
+        console.log('🚀 Subscribing to live game state...');
+
+        this.pollTimer = new LiveSessionChannel(
+            this.sessionId,
+            (gameState) => this.handleGameStateUpdate(gameState),
+            { apiBase: API_BASE_URL, pollInterval: 500 }
+        );
+        this.pollTimer.start();
     }
 
     // ENHANCED: Handle game state with auto-advance detection
@@ -461,7 +455,7 @@ class GameManager {
         console.log('🏁 Game finished, showing results');
 
         if (this.pollTimer) {
-            clearInterval(this.pollTimer);
+            this.pollTimer.stop();
         }
 
         try {
@@ -490,7 +484,7 @@ class GameManager {
             clearInterval(this.timer);
         }
         if (this.pollTimer) {
-            clearInterval(this.pollTimer);
+            this.pollTimer.stop();
         }
 
         // Clean up temporary message overlay
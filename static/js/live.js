@@ -0,0 +1,181 @@
+// Live game-state channel: subscribes once to the session's Server-Sent Events
+// stream and falls back to long-polling game_state when the stream is unavailable.
+// With options.streamUrl it subscribes to that stream instead (e.g. a player's
+// compact state), and with options.pollUrl the fallback polls that URL every
+// pollInterval, revalidating with its ETag.
+class LiveSessionChannel {
+    constructor(sessionId, onState, options = {}) {
+        this.sessionId = sessionId;
+        this.onState = onState;
+        this.apiBase = options.apiBase || '/api';
+        this.pollInterval = options.pollInterval || 1000;
+        this.tickInterval = options.tickInterval || 250;
+        this.connectTimeout = options.connectTimeout || 5000;
+        this.streamUrl = options.streamUrl || `${this.apiBase}/sessions/${sessionId}/events/`;
+        this.pollUrl = options.pollUrl || null;
+
+        this.source = null;
+        this.tickTimer = null;
+        this.connectTimer = null;
+        this.lastState = null;
+        this.lastStateAt = 0;
+        this.polling = false;
+        this.abortController = null;
+        this.stopped = false;
+    }
+
+    start() {
+        if (!window.EventSource) {
+            this.startPolling();
+            return;
+        }
+
+        console.log(`📡 Subscribing to live updates for session ${this.sessionId}`);
+        this.source = new EventSource(this.streamUrl, { withCredentials: true });
+
+        // Under a plain WSGI server the stream never flushes, so give up after a while
+        this.connectTimer = setTimeout(() => this.fallBack('no events received'), this.connectTimeout);
+
+        this.source.addEventListener('state', (event) => {
+            clearTimeout(this.connectTimer);
+            this.handleState(JSON.parse(event.data));
+        });
+
+        this.source.onerror = () => {
+            if (this.source && this.source.readyState === EventSource.CLOSED) {
+                this.fallBack('stream closed');
+            }
+        };
+
+        this.tickTimer = setInterval(() => this.tick(), this.tickInterval);
+    }
+
+    handleState(state) {
+        this.lastState = state;
+        this.lastStateAt = Date.now();
+        this.onState(state);
+
+        if (state.status === 'finished') {
+            this.stop();
+        }
+    }
+
+    // Count the question timer down locally between pushed events
+    tick() {
+        const state = this.lastState;
+        if (!state || state.status !== 'active' || state.time_left === undefined) {
+            return;
+        }
+
+        const elapsed = (Date.now() - this.lastStateAt) / 1000;
+        this.onState({
+            ...state,
+            time_left: Math.max(0, state.time_left - elapsed),
+            event: 'tick'
+        });
+    }
+
+    fallBack(reason) {
+        if (this.stopped || this.polling) {
+            return;
+        }
+
+        console.warn(`⚠️ Live updates unavailable (${reason}), falling back to long-polling`);
+        this.closeStream();
+        this.startPolling();
+    }
+
+    startPolling() {
+        this.polling = true;
+        this.abortController = new AbortController();
+        if (!this.tickTimer) {
+            // Parked requests return nothing until the state changes, so count down locally
+            this.tickTimer = setInterval(() => this.tick(), this.tickInterval);
+        }
+        if (this.pollUrl) {
+            this.poll();
+        } else {
+            this.longPoll();
+        }
+    }
+
+    // Unchanged states come back as a bodyless 304, so the last one is kept
+    async poll() {
+        let etag = null;
+        while (!this.stopped) {
+            try {
+                const response = await fetch(this.pollUrl, {
+                    credentials: 'include',
+                    cache: 'no-store',
+                    headers: etag ? { 'If-None-Match': etag } : {},
+                    signal: this.abortController.signal
+                });
+                if (response.ok) {
+                    etag = response.headers.get('ETag');
+                    this.handleState(await response.json());
+                } else if (response.status !== 304) {
+                    console.error(`❌ Game state polling failed: ${response.status}`);
+                }
+            } catch (error) {
+                if (this.stopped) {
+                    return;
+                }
+                console.error('❌ Game state polling error:', error);
+            }
+
+            await new Promise((resolve) => setTimeout(resolve, this.pollInterval));
+        }
+    }
+
+    // Each request is held by the server until the state version moves past the one we have
+    async longPoll() {
+        while (!this.stopped) {
+            const version = this.lastState ? this.lastState.state_version : undefined;
+            const query = version === undefined ? '' : `?since=${version}`;
+
+            try {
+                const response = await fetch(`${this.apiBase}/sessions/${this.sessionId}/game_state/${query}`, {
+                    credentials: 'include',
+                    cache: 'no-store',
+                    signal: this.abortController.signal
+                });
+                if (response.status === 304) {
+                    continue;
+                }
+                if (response.ok) {
+                    this.handleState(await response.json());
+                    continue;
+                }
+            } catch (error) {
+                if (this.stopped) {
+                    return;
+                }
+                console.error('❌ Game state polling error:', error);
+            }
+
+            // Back off before retrying after an error
+            await new Promise((resolve) => setTimeout(resolve, this.pollInterval));
+        }
+    }
+
+    closeStream() {
+        clearTimeout(this.connectTimer);
+        if (this.tickTimer) {
+            clearInterval(this.tickTimer);
+            this.tickTimer = null;
+        }
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+    }
+
+    stop() {
+        this.stopped = true;
+        this.closeStream();
+        if (this.abortController) {
+            this.abortController.abort();
+            this.abortController = null;
+        }
+    }
+}